@@ -0,0 +1,158 @@
+"""
+Saves benchmark results as JSON baselines and compares later runs against them.
+
+Results are a mapping of benchmark name to metrics, e.g.
+{"POST /query/process": {"throughput_rps": 850.0, "p50_ms": 21.3, "p99_ms": 48.0}}.
+Metrics named in HIGHER_IS_BETTER regress when they fall; every other metric is a time and
+regresses when it rises. Timings depend on the machine, so compare only against a baseline
+saved on the same machine.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+HIGHER_IS_BETTER = frozenset({"throughput_rps"})
+
+Results = Dict[str, Dict[str, float]]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=BASELINE_DIR.parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def baseline_path(suite: str, path: Optional[str] = None) -> Path:
+    return Path(path) if path else BASELINE_DIR / f"{suite}.json"
+
+
+def save(
+    suite: str,
+    results: Results,
+    path: Optional[str] = None,
+    parameters: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """
+    Writes `results` as the baseline of `suite`, with how, where and when they were measured.
+    """
+    target = baseline_path(suite, path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "suite": suite,
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": parameters or {},
+        "results": results,
+    }
+    target.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+    return target
+
+
+def load(suite: str, path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Returns the saved baseline document of `suite`, or None if there is none.
+    """
+    target = baseline_path(suite, path)
+    if not target.exists():
+        return None
+    return json.loads(target.read_text())
+
+
+def compare(
+    current: Results, baseline: Results, tolerance: float
+) -> Tuple[List[str], List[str]]:
+    """
+    Compares every metric present in both result sets.
+
+    Args:
+        current (Results): The results of this run.
+        baseline (Results): The saved baseline.
+        tolerance (float): The relative change allowed before a metric counts as regressed,
+            e.g. 0.2 for 20%.
+
+    Returns:
+        Tuple[List[str], List[str]]: A report line per compared metric, and the lines of the
+        metrics that regressed.
+    """
+    lines = []
+    regressions = []
+    for name in sorted(current):
+        for metric, value in sorted(current[name].items()):
+            before = baseline.get(name, {}).get(metric)
+            if before is None or before == 0:
+                continue
+            change = (value - before) / before
+            if metric in HIGHER_IS_BETTER:
+                regressed = change < -tolerance
+            else:
+                regressed = change > tolerance
+            line = (
+                f"{name:<40} {metric:<16} {before:>12.3f} -> {value:>12.3f} "
+                f"{change:>+8.1%}{'  REGRESSED' if regressed else ''}"
+            )
+            lines.append(line)
+            if regressed:
+                regressions.append(line)
+    return lines, regressions
+
+
+def report(
+    suite: str,
+    results: Results,
+    save_baseline: bool,
+    tolerance: float,
+    path: Optional[str] = None,
+    parameters: Optional[Dict[str, Any]] = None,
+) -> int:
+    """
+    Saves or checks the baseline of `suite` and prints the comparison.
+
+    Results measured with other `parameters` than the baseline are still compared, with a
+    warning, since most metrics depend on them.
+
+    Returns:
+        int: The process exit status: 1 if any metric regressed beyond `tolerance`, else 0.
+    """
+    if save_baseline:
+        print(f"\nSaved baseline to {save(suite, results, path, parameters)}")
+        return 0
+    baseline = load(suite, path)
+    if baseline is None:
+        print(
+            f"\nNo baseline at {baseline_path(suite, path)}; run with --save-baseline"
+        )
+        return 0
+    saved_parameters = baseline.get("parameters", {})
+    for name, value in sorted((parameters or {}).items()):
+        if saved_parameters.get(name, value) != value:
+            print(
+                f"\nWarning: the baseline was measured with {name}={saved_parameters[name]}, "
+                f"this run with {name}={value}"
+            )
+    lines, regressions = compare(results, baseline["results"], tolerance)
+    print(
+        f"\nAgainst baseline {baseline_path(suite, path)} (tolerance {tolerance:.0%}):"
+    )
+    for line in lines:
+        print(line)
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed")
+        return 1
+    return 0
@@ -0,0 +1,623 @@
+"""
+An in-memory stand-in for the Prisma models, so that benchmarks measure the service rather
+than PostgreSQL.
+
+`FakeDatabase.install()` swaps `prisma.models.<Model>.prisma()` for in-memory actions and
+`prisma.get_client()` for a client whose raw queries return no rows, and restores both on
+exit. Rows are stored as dicts and returned as the generated model classes, so a generated
+client is still needed. Only what the service uses is supported: equality, `in`, `not`,
+`lt`/`lte`/`gt`/`gte`, `AND`/`OR`, `order`, `take`, `skip`, `include` of a to-one relation,
+`group_by` with `sum` and `count`, and `batch_()`.
+
+Every call yields to the event loop, sleeps for `latency` seconds if it is set to model a
+database round trip, and is recorded with `project.metrics` like InstrumentedPrisma records
+real ones, so /metrics reports database calls per route.
+"""
+
+import asyncio
+import contextlib
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.errors
+import prisma.models
+import project.metrics
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _uuid() -> str:
+    return str(uuid.uuid4())
+
+
+# The value of every scalar column of a new row that the caller did not set, as the
+# database would fill it in. Callables are evaluated per row.
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "User": {
+        "id": _uuid,
+        "createdAt": _now,
+        "updatedAt": _now,
+        "role": lambda: prisma.enums.UserRole.VIEWER,
+    },
+    "Query": {
+        "id": _uuid,
+        "createdAt": _now,
+        "complexityScore": None,
+        "routedToModel": None,
+        "response": None,
+        "latency": None,
+        "cost": None,
+        "status": lambda: prisma.enums.QueryStatus.COMPLETED,
+        "submitted": False,
+        "priority": 0,
+        "attempts": 0,
+        "processingStartedAt": None,
+        "error": None,
+        "queryTextHash": None,
+    },
+    "Feedback": {
+        "id": _uuid,
+        "createdAt": _now,
+        "userId": None,
+        "queryId": None,
+    },
+    "APIKey": {"id": _uuid, "createdAt": _now, "revokedAt": None},
+    "Subscription": {"id": _uuid, "createdAt": _now},
+    "AuditLog": {"id": _uuid, "createdAt": _now, "userId": None},
+    "SystemConfig": {"id": _uuid, "updatedAt": _now},
+    "ModelUsageHourly": {
+        "queries": 0,
+        "errors": 0,
+        "cost": 0.0,
+        "latencySum": 0.0,
+        "latencyBuckets": list,
+        "updatedAt": _now,
+    },
+    "RateLimitBucket": {"updatedAt": _now},
+    "AIModel": {"id": _uuid, "createdAt": _now, "description": None},
+}
+
+# The to-one relations that `include` can load: relation field -> (model, foreign key).
+RELATIONS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "Query": {"user": ("User", "userId")},
+    "Feedback": {"user": ("User", "userId"), "query": ("Query", "queryId")},
+    "APIKey": {"user": ("User", "userId")},
+    "Subscription": {"user": ("User", "userId")},
+    "AuditLog": {"user": ("User", "userId")},
+}
+
+PRIMARY_KEYS: Dict[str, Tuple[str, ...]] = {
+    "ModelUsageHourly": ("hour", "modelName"),
+    "RateLimitBucket": ("key",),
+}
+
+# Columns with a hash index, so that lookups by them do not scan a table that grows with
+# every request and skew the timings the way a real index would not.
+INDEXES: Dict[str, Tuple[str, ...]] = {
+    "Query": ("userId", "routedToModel", "queryTextHash", "status"),
+    "Feedback": ("userId", "queryId"),
+    "APIKey": ("key", "userId"),
+    "Subscription": ("userId",),
+    "SystemConfig": ("key",),
+    "AIModel": ("name",),
+}
+
+# The catalog seeded by `seed_models`: name, model type, cost per query in USD and average
+# latency in milliseconds.
+SEED_MODELS: Tuple[Tuple[str, str, float, float], ...] = (
+    ("GPT-4 Turbo", "GPT4_TURBO", 0.03, 2000.0),
+    ("Claude 3 Opus", "CLAUDE_3_OPUS", 0.075, 2500.0),
+    ("Gemini 1.5 Pro", "GEMINI_1_5_PRO", 0.007, 1200.0),
+    ("Claude 3 Haiku", "OTHER", 0.0005, 400.0),
+)
+
+
+def _comparable(value: Any) -> Any:
+    # Naive datetimes are UTC, as Prisma stores them.
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _matches_value(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return _comparable(value) == _comparable(condition)
+    value = _comparable(value)
+    for operator, operand in condition.items():
+        operand = _comparable(operand)
+        if operator == "equals":
+            ok = value == operand
+        elif operator == "not":
+            ok = not _matches_value(value, operand)
+        elif operator == "in":
+            ok = value in operand
+        elif operator in ("not_in", "notIn"):
+            ok = value not in operand
+        elif value is None:
+            ok = False
+        elif operator == "lt":
+            ok = value < operand
+        elif operator == "lte":
+            ok = value <= operand
+        elif operator == "gt":
+            ok = value > operand
+        elif operator == "gte":
+            ok = value >= operand
+        elif operator == "contains":
+            ok = operand in value
+        elif operator == "startswith":
+            ok = value.startswith(operand)
+        else:
+            raise NotImplementedError(f"Unsupported filter operator: {operator}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(row: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    Returns whether a row satisfies a Prisma `where` filter.
+    """
+    if not where:
+        return True
+    for field, condition in where.items():
+        if field == "AND":
+            if not all(matches(row, part) for part in condition):
+                return False
+        elif field == "OR":
+            if not any(matches(row, part) for part in condition):
+                return False
+        elif field == "NOT":
+            parts = condition if isinstance(condition, list) else [condition]
+            if any(matches(row, part) for part in parts):
+                return False
+        elif not _matches_value(row.get(field), condition):
+            return False
+    return True
+
+
+def _sort(rows: List[Dict[str, Any]], order: Any) -> List[Dict[str, Any]]:
+    if not order:
+        return rows
+    orders = order if isinstance(order, list) else [order]
+    keys = [item for part in orders for item in part.items()]
+    # Sort by the last key first; stable sorts keep the earlier keys in charge. NULLs sort
+    # last ascending and first descending, as in PostgreSQL.
+    for field, direction in reversed(keys):
+        rows.sort(
+            key=lambda row: (
+                row.get(field) is None,
+                _comparable(row.get(field)) if row.get(field) is not None else 0,
+            ),
+            reverse=direction == "desc",
+        )
+    return rows
+
+
+class _Table:
+    """
+    The rows of one model by primary key, with hash indexes on its INDEXES columns.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.key_fields = PRIMARY_KEYS.get(model, ("id",))
+        self.rows: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        self.indexes: Dict[str, Dict[Any, set]] = {
+            field: {} for field in INDEXES.get(model, ())
+        }
+
+    def key(self, row: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(row[field] for field in self.key_fields)
+
+    def insert(self, row: Dict[str, Any]) -> None:
+        key = self.key(row)
+        self.rows[key] = row
+        for field, index in self.indexes.items():
+            index.setdefault(row.get(field), set()).add(key)
+
+    def update(self, row: Dict[str, Any], data: Dict[str, Any]) -> None:
+        key = self.key(row)
+        for field, index in self.indexes.items():
+            if field in data:
+                index[row.get(field)].discard(key)
+                index.setdefault(data[field], set()).add(key)
+        row.update(data)
+
+    def delete(self, row: Dict[str, Any]) -> None:
+        key = self.key(row)
+        del self.rows[key]
+        for field, index in self.indexes.items():
+            index[row.get(field)].discard(key)
+
+    def candidates(self, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Returns the rows that may match `where`, narrowed by the primary key or an index.
+        """
+        if not where:
+            return list(self.rows.values())
+        conditions = [where] + [
+            part for part in where.get("AND", []) if isinstance(part, dict)
+        ]
+        for condition in conditions:
+            values = [condition.get(field) for field in self.key_fields]
+            if all(
+                field in condition and not isinstance(value, dict)
+                for field, value in zip(self.key_fields, values)
+            ):
+                row = self.rows.get(tuple(values))
+                return [row] if row is not None else []
+            if (
+                len(values) == 1
+                and isinstance(values[0], dict)
+                and list(values[0]) == ["in"]
+            ):
+                return [
+                    self.rows[(value,)]
+                    for value in dict.fromkeys(values[0]["in"])
+                    if (value,) in self.rows
+                ]
+        for condition in conditions:
+            for field, index in self.indexes.items():
+                value = condition.get(field)
+                if value is not None and not isinstance(value, dict):
+                    return [self.rows[key] for key in index.get(value, ())]
+        return list(self.rows.values())
+
+
+class FakeActions:
+    """
+    The in-memory counterpart of a generated `<Model>Actions` class.
+    """
+
+    def __init__(self, db: "FakeDatabase", model: str) -> None:
+        self._db = db
+        self._model = model
+        self._table = db.tables[model]
+
+    def _build(
+        self, row: Dict[str, Any], include: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        data = dict(row)
+        for relation, wanted in (include or {}).items():
+            if not wanted:
+                continue
+            model, foreign_key = RELATIONS[self._model][relation]
+            related = self._db.find(model, {"id": row.get(foreign_key)})
+            data[relation] = (
+                FakeActions(self._db, model)._build(related) if related else None
+            )
+        return getattr(prisma.models, self._model)(**data)
+
+    def _new_row(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        row = {}
+        for field, default in DEFAULTS.get(self._model, {}).items():
+            row[field] = default() if callable(default) else default
+        row.update(data)
+        return row
+
+    def _insert(
+        self, data: Dict[str, Any], skip_duplicates: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        row = self._new_row(data)
+        if self._table.key(row) in self._table.rows:
+            if skip_duplicates:
+                return None
+            raise prisma.errors.UniqueViolationError(
+                {
+                    "user_facing_error": {
+                        "meta": {"target": list(self._table.key_fields)}
+                    }
+                }
+            )
+        self._table.insert(row)
+        return row
+
+    def _select(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        order: Any = None,
+        take: Optional[int] = None,
+        skip: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        rows = _sort(
+            [row for row in self._table.candidates(where) if matches(row, where)],
+            order,
+        )
+        if skip:
+            rows = rows[skip:]
+        if take is not None:
+            rows = rows[:take]
+        return rows
+
+    async def create(self, data: Dict[str, Any], include: Any = None) -> Any:
+        async with self._db.call(self._model, "create"):
+            return self._build(self._insert(data), include)
+
+    async def create_many(
+        self, data: List[Dict[str, Any]], skip_duplicates: bool = False
+    ) -> int:
+        async with self._db.call(self._model, "create_many"):
+            return sum(self._insert(item, skip_duplicates) is not None for item in data)
+
+    async def find_unique(self, where: Dict[str, Any], include: Any = None) -> Any:
+        async with self._db.call(self._model, "find_unique"):
+            rows = self._select(where, take=1)
+            return self._build(rows[0], include) if rows else None
+
+    async def find_first(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        order: Any = None,
+        skip: Optional[int] = None,
+        include: Any = None,
+    ) -> Any:
+        async with self._db.call(self._model, "find_first"):
+            rows = self._select(where, order, take=1, skip=skip)
+            return self._build(rows[0], include) if rows else None
+
+    async def find_many(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        order: Any = None,
+        take: Optional[int] = None,
+        skip: Optional[int] = None,
+        include: Any = None,
+    ) -> List[Any]:
+        async with self._db.call(self._model, "find_many"):
+            return [
+                self._build(row, include)
+                for row in self._select(where, order, take, skip)
+            ]
+
+    async def count(self, where: Optional[Dict[str, Any]] = None) -> int:
+        async with self._db.call(self._model, "count"):
+            return len(self._select(where))
+
+    async def update(
+        self, where: Dict[str, Any], data: Dict[str, Any], include: Any = None
+    ) -> Any:
+        async with self._db.call(self._model, "update"):
+            rows = self._select(where, take=1)
+            if not rows:
+                return None
+            self._table.update(rows[0], data)
+            return self._build(rows[0], include)
+
+    async def update_many(self, where: Dict[str, Any], data: Dict[str, Any]) -> int:
+        async with self._db.call(self._model, "update_many"):
+            rows = self._select(where)
+            for row in rows:
+                self._table.update(row, data)
+            return len(rows)
+
+    async def upsert(
+        self, where: Dict[str, Any], data: Dict[str, Any], include: Any = None
+    ) -> Any:
+        async with self._db.call(self._model, "upsert"):
+            rows = self._select(where, take=1)
+            if rows:
+                self._table.update(rows[0], data.get("update") or {})
+                return self._build(rows[0], include)
+            row = self._new_row(data["create"])
+            self._table.insert(row)
+            return self._build(row, include)
+
+    async def delete(self, where: Dict[str, Any]) -> Any:
+        async with self._db.call(self._model, "delete"):
+            rows = self._select(where, take=1)
+            if not rows:
+                return None
+            self._table.delete(rows[0])
+            return self._build(rows[0])
+
+    async def group_by(
+        self,
+        by: List[str],
+        where: Optional[Dict[str, Any]] = None,
+        sum: Optional[Dict[str, bool]] = None,
+        count: Any = None,
+        **kwargs: Any,
+    ) -> List[Dict[str, Any]]:
+        async with self._db.call(self._model, "group_by"):
+            groups: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+            for row in self._select(where):
+                groups.setdefault(tuple(row.get(field) for field in by), []).append(row)
+            results = []
+            for key, rows in groups.items():
+                result: Dict[str, Any] = dict(zip(by, key))
+                if sum:
+                    result["_sum"] = {
+                        field: _sum_or_none(row.get(field) for row in rows)
+                        for field, wanted in sum.items()
+                        if wanted
+                    }
+                if count:
+                    result["_count"] = {"_all": len(rows)}
+                results.append(result)
+            return results
+
+
+def _sum_or_none(values: Iterator[Any]) -> Optional[float]:
+    present = [value for value in values if value is not None]
+    return sum(present) if present else None
+
+
+class FakeBatch:
+    """
+    The in-memory counterpart of `Prisma.batch_()`: queues writes and runs them on exit.
+    """
+
+    def __init__(self, db: "FakeDatabase") -> None:
+        self._db = db
+        self._operations: List[Tuple[str, str, Dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> Any:
+        model = self._db.model_by_lowercase_name(name)
+        batch = self
+
+        class _Recorder:
+            def __getattr__(self, action: str) -> Callable[..., None]:
+                def record(**kwargs: Any) -> None:
+                    batch._operations.append((model, action, kwargs))
+
+                return record
+
+        return _Recorder()
+
+    async def __aenter__(self) -> "FakeBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            return
+        for model, action, kwargs in self._operations:
+            await getattr(FakeActions(self._db, model), action)(**kwargs)
+
+
+class FakeClient:
+    """
+    Stands in for the registered Prisma client. Raw SQL is counted but not run: queries return
+    no rows and statements report no affected rows.
+    """
+
+    def __init__(self, db: "FakeDatabase") -> None:
+        self._db = db
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def connect(self, timeout: Any = None) -> None:
+        self._connected = True
+
+    async def disconnect(self, timeout: Any = None) -> None:
+        self._connected = False
+
+    async def query_raw(self, query: str, *args: Any, model: Any = None) -> List[Any]:
+        async with self._db.call("raw", "query_raw"):
+            return []
+
+    async def query_first(self, query: str, *args: Any, model: Any = None) -> Any:
+        async with self._db.call("raw", "query_first"):
+            return None
+
+    async def execute_raw(self, query: str, *args: Any) -> int:
+        async with self._db.call("raw", "execute_raw"):
+            return 0
+
+    def batch_(self) -> FakeBatch:
+        return FakeBatch(self._db)
+
+
+class FakeDatabase:
+    """
+    In-memory tables for every model in schema.prisma, and the fake client that serves them.
+
+    Args:
+        latency (float): Seconds every database call takes, to model a round trip.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.tables: Dict[str, _Table] = {model: _Table(model) for model in DEFAULTS}
+        self.calls: Counter = Counter()
+        self.client = FakeClient(self)
+
+    @contextlib.asynccontextmanager
+    async def call(self, model: str, action: str):
+        started = time.perf_counter()
+        await asyncio.sleep(self.latency)
+        try:
+            yield
+        finally:
+            self.calls[f"{model}.{action}"] += 1
+            project.metrics.observe_database_call(action, time.perf_counter() - started)
+
+    def model_by_lowercase_name(self, name: str) -> str:
+        for model in self.tables:
+            if model.lower() == name:
+                return model
+        raise AttributeError(name)
+
+    def find(self, model: str, where: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for row in self.tables[model].candidates(where):
+            if matches(row, where):
+                return row
+        return None
+
+    def insert(self, model: str, **data: Any) -> Dict[str, Any]:
+        """
+        Stores a row directly, without counting a database call. For seeding.
+        """
+        return FakeActions(self, model)._insert(data)
+
+    def seed_models(self, latency_scale: float = 1.0) -> None:
+        """
+        Adds the SEED_MODELS catalog, with latencies multiplied by `latency_scale`.
+        """
+        for name, model_type, cost, latency in SEED_MODELS:
+            self.insert(
+                "AIModel",
+                name=name,
+                modelType=getattr(prisma.enums.ModelType, model_type),
+                costPerQuery=cost,
+                averageLatency=latency * latency_scale,
+            )
+
+    def seed_user(
+        self,
+        user_id: str,
+        plan: Optional[str] = None,
+        role: Optional[str] = None,
+    ) -> None:
+        """
+        Adds a user, with an active subscription to `plan` if one is given.
+        """
+        self.insert(
+            "User",
+            id=user_id,
+            email=f"{user_id}@example.com",
+            password="",
+            role=getattr(prisma.enums.UserRole, role or "SUBSCRIBER"),
+        )
+        if plan is not None:
+            now = _now()
+            self.insert(
+                "Subscription",
+                userId=user_id,
+                plan=getattr(prisma.enums.SubscriptionPlan, plan),
+                validFrom=now - timedelta(days=1),
+                validUntil=now + timedelta(days=30),
+            )
+
+    @contextlib.contextmanager
+    def install(self) -> Iterator["FakeDatabase"]:
+        """
+        Serves every Prisma model and `prisma.get_client()` from this database until exit.
+        """
+        saved = {}
+        for model in self.tables:
+            cls = getattr(prisma.models, model)
+            saved[model] = cls.__dict__.get("prisma")
+            actions = FakeActions(self, model)
+            cls.prisma = staticmethod(lambda actions=actions: actions)
+        get_client = prisma.get_client
+        prisma.get_client = lambda: self.client
+        try:
+            yield self
+        finally:
+            prisma.get_client = get_client
+            for model, original in saved.items():
+                cls = getattr(prisma.models, model)
+                if original is None:
+                    del cls.prisma
+                else:
+                    cls.prisma = original
@@ -0,0 +1,434 @@
+"""
+End-to-end load test of the API. It drives the FastAPI app in-process over ASGI, with every
+Prisma model served from the in-memory benchmarks.fake_prisma database and every AI model
+answered by the mock provider. What it measures is the cost of server.py and the service
+modules: routing, caching, bookkeeping, serialization and the middleware.
+
+The app runs with its real lifespan, so the write-behind buffer, query workers, estimators and
+other background services run as they do in production. Rate limits stay in the request path
+but are set far above the offered load. Run from the repository root:
+
+    poetry run python -m benchmarks.load_test --save-baseline
+    poetry run python -m benchmarks.load_test --requests 5000 --concurrency 64
+
+--concurrency clients send --requests requests, after --warmup unrecorded ones. Each request
+goes to an endpoint picked at random from ENDPOINTS by weight, with a fixed seed so that runs
+are comparable. For each endpoint the run reports its throughput, p50 and p99 latency, errors
+and database calls per request. Without --save-baseline the results are compared against
+benchmarks/baselines/load.json and the exit status is 1 if any metric regressed by more than
+--tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import benchmarks.baselines
+import benchmarks.fake_prisma
+import benchmarks.micro_benchmarks
+import httpx
+import prisma.enums
+
+SUITE = "load"
+# Defaults for the service configuration, which it reads from the environment on import. The
+# environment still wins, e.g. QUERY_WRITE_BEHIND=true to load-test the write-behind buffer.
+ENVIRONMENT = {
+    "MODEL_PROVIDER_MODE": "mock",
+    "QUERY_WORKER_MODE": "local",
+    "API_KEY_AUTH_REQUIRED": "false",
+    "API_KEY_HASH_SECRET": "load-test",
+    "SEMANTIC_CACHE_ENABLED": "false",
+}
+PLANS = ("BASIC", "PREMIUM", "ENTERPRISE", None)
+UNLIMITED = {"per_minute": 1e9, "burst": 1e9}
+# Answered queries seeded for result lookups and feedback until the run answers its own.
+ANSWERED_QUERIES = 100
+
+
+@dataclass
+class LoadState:
+    """
+    What the clients know about the data: the seeded users and the queries answered so far.
+    """
+
+    users: List[str]
+    query_ids: List[str] = field(default_factory=list)
+    # A key of the seeded admin, for the admin-only endpoints.
+    admin_key: str = ""
+
+
+@dataclass(frozen=True)
+class Request:
+    method: str
+    url: str
+    params: Optional[Dict[str, Any]] = None
+    json: Any = None
+    headers: Optional[Dict[str, str]] = None
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """
+    A route to load, by its method and path template as /metrics labels it.
+    """
+
+    method: str
+    route: str
+    weight: int
+    build: Callable[[random.Random, LoadState, str], Request]
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.route}"
+
+
+def _answered(rng: random.Random, state: LoadState) -> str:
+    return rng.choice(state.query_ids)
+
+
+ENDPOINTS: Tuple[Endpoint, ...] = (
+    Endpoint(
+        "POST",
+        "/query/process",
+        30,
+        lambda rng, state, text: Request(
+            "POST",
+            "/query/process",
+            params={
+                "queryText": text,
+                "userId": rng.choice(state.users),
+                "sessionId": "load-test",
+            },
+        ),
+    ),
+    Endpoint(
+        "POST",
+        "/query/analyze",
+        15,
+        lambda rng, state, text: Request(
+            "POST",
+            "/query/analyze",
+            params={"query_text": text, "user_id": rng.choice(state.users)},
+        ),
+    ),
+    Endpoint(
+        "POST",
+        "/query/allocate",
+        10,
+        lambda rng, state, text: Request(
+            "POST",
+            "/query/allocate",
+            params={
+                "query_text": text,
+                "user_id": rng.choice(state.users),
+                "complexity_score": round(rng.uniform(0.0, 3.0), 2),
+            },
+            json=[],
+        ),
+    ),
+    Endpoint(
+        "POST",
+        "/query/submit",
+        10,
+        lambda rng, state, text: Request(
+            "POST",
+            "/query/submit",
+            params={"userId": rng.choice(state.users), "queryText": text},
+        ),
+    ),
+    Endpoint(
+        "GET",
+        "/query/result/{queryId}",
+        15,
+        lambda rng, state, text: Request(
+            "GET", f"/query/result/{_answered(rng, state)}"
+        ),
+    ),
+    Endpoint(
+        "GET",
+        "/query/history/user/{userId}",
+        10,
+        lambda rng, state, text: Request(
+            "GET",
+            f"/query/history/user/{rng.choice(state.users)}",
+            params={"limit": 20},
+        ),
+    ),
+    Endpoint(
+        "POST",
+        "/feedback/submit",
+        5,
+        lambda rng, state, text: Request(
+            "POST",
+            "/feedback/submit",
+            params={
+                "userId": rng.choice(state.users),
+                "content": "Helpful answer, thanks.",
+                "queryId": _answered(rng, state),
+            },
+        ),
+    ),
+    Endpoint(
+        "GET",
+        "/system/health",
+        5,
+        lambda rng, state, text: Request(
+            "GET", "/system/health", headers={"X-API-Key": state.admin_key}
+        ),
+    ),
+)
+
+_DB_CALLS = re.compile(
+    r'^http_request_db_calls_total\{method="([^"]+)",route="([^"]+)"\} (\S+)$', re.M
+)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """
+    Returns the nearest-rank q-quantile (0 < q <= 1) of a sorted list.
+    """
+    return samples[min(len(samples) - 1, max(math.ceil(q * len(samples)) - 1, 0))]
+
+
+async def database_calls(client: httpx.AsyncClient) -> Dict[str, float]:
+    """
+    Reads the database calls made per route so far from /metrics.
+    """
+    text = (await client.get("/metrics")).text
+    return {
+        f"{method} {route}": float(calls)
+        for method, route, calls in _DB_CALLS.findall(text)
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    state: LoadState,
+    requests: int,
+    concurrency: int,
+    rng: random.Random,
+    texts: List[str],
+) -> Tuple[Dict[str, List[float]], Dict[str, int], float]:
+    """
+    Sends `requests` requests from `concurrency` concurrent clients.
+
+    Returns:
+        Tuple[Dict[str, List[float]], Dict[str, int], float]: The latencies in milliseconds and
+        the number of failed requests per endpoint, and the wall-clock duration in seconds.
+    """
+    plan = rng.choices(ENDPOINTS, weights=[e.weight for e in ENDPOINTS], k=requests)
+    pending = iter(enumerate(plan))
+    latencies: Dict[str, List[float]] = {endpoint.name: [] for endpoint in ENDPOINTS}
+    errors: Dict[str, int] = {endpoint.name: 0 for endpoint in ENDPOINTS}
+
+    async def client_loop() -> None:
+        for i, endpoint in pending:
+            request = endpoint.build(rng, state, texts[i % len(texts)])
+            started = time.perf_counter()
+            response = await client.request(
+                request.method,
+                request.url,
+                params=request.params,
+                json=request.json,
+                headers=request.headers,
+            )
+            latencies[endpoint.name].append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors[endpoint.name] += 1
+            elif endpoint.route == "/query/process":
+                state.query_ids.append(response.json()["queryId"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(
+    latencies: Dict[str, List[float]],
+    errors: Dict[str, int],
+    elapsed: float,
+    calls_before: Dict[str, float],
+    calls_after: Dict[str, float],
+) -> benchmarks.baselines.Results:
+    results: benchmarks.baselines.Results = {}
+    everything: List[float] = []
+    print(
+        f"{'endpoint':<36} {'requests':>8} {'errors':>6} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'db/req':>7}"
+    )
+    for name, samples in latencies.items():
+        if not samples:
+            continue
+        samples.sort()
+        everything.extend(samples)
+        calls = calls_after.get(name, 0.0) - calls_before.get(name, 0.0)
+        results[name] = {
+            "throughput_rps": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 0.5),
+            "p99_ms": percentile(samples, 0.99),
+            "db_calls_per_request": calls / len(samples),
+        }
+        print(
+            f"{name:<36} {len(samples):>8} {errors[name]:>6} "
+            f"{results[name]['throughput_rps']:>9.1f} {results[name]['p50_ms']:>8.2f} "
+            f"{results[name]['p99_ms']:>8.2f} "
+            f"{results[name]['db_calls_per_request']:>7.2f}"
+        )
+    everything.sort()
+    results["all"] = {
+        "throughput_rps": len(everything) / elapsed,
+        "p50_ms": percentile(everything, 0.5),
+        "p99_ms": percentile(everything, 0.99),
+    }
+    print(
+        f"{'all':<36} {len(everything):>8} {sum(errors.values()):>6} "
+        f"{results['all']['throughput_rps']:>9.1f} {results['all']['p50_ms']:>8.2f} "
+        f"{results['all']['p99_ms']:>8.2f}"
+    )
+    return results
+
+
+def seed(
+    db: benchmarks.fake_prisma.FakeDatabase, users: int, model_latency_scale: float
+) -> LoadState:
+    db.seed_models(model_latency_scale)
+    user_ids = [f"load-user-{i}" for i in range(users)]
+    for i, user_id in enumerate(user_ids):
+        db.seed_user(user_id, plan=PLANS[i % len(PLANS)])
+    query_ids = []
+    for i in range(ANSWERED_QUERIES):
+        row = db.insert(
+            "Query",
+            queryText=f"What is the capital of France? (seeded #{i})",
+            userId=user_ids[i % len(user_ids)],
+            complexityScore=0.4,
+            routedToModel=benchmarks.fake_prisma.SEED_MODELS[-1][0],
+            response="Paris.",
+            latency=400.0 * model_latency_scale,
+            cost=0.0005,
+            status=prisma.enums.QueryStatus.COMPLETED,
+        )
+        query_ids.append(row["id"])
+    import project.api_keys
+
+    admin_key = project.api_keys.generate_key()
+    db.seed_user("load-admin", role="ADMIN")
+    db.insert(
+        "APIKey",
+        key=project.api_keys.hash_key(admin_key),
+        userId="load-admin",
+        validUntil=datetime.now(timezone.utc) + timedelta(days=1),
+    )
+    limits = {plan or "NONE": UNLIMITED for plan in PLANS}
+    db.insert(
+        "SystemConfig",
+        key="rate_limits",
+        value=json.dumps({"users": limits, "plans": limits}),
+    )
+    return LoadState(users=user_ids, query_ids=query_ids, admin_key=admin_key)
+
+
+async def run(args: argparse.Namespace) -> benchmarks.baselines.Results:
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    # Imported here, after the environment is set, because the service reads its
+    # configuration when it is imported.
+    import project.server
+
+    db = benchmarks.fake_prisma.FakeDatabase(latency=args.db_latency_ms / 1000)
+    state = seed(db, args.users, args.model_latency_scale)
+    rng = random.Random(args.seed)
+    texts = [
+        f"{text} (#{i})"
+        for i, text in enumerate(
+            benchmarks.micro_benchmarks.query_texts(args.distinct_queries, args.seed)
+        )
+    ]
+    app = project.server.app
+    with db.install():
+        project.server.db_client = db.client
+        async with app.router.lifespan_context(app):
+            # Errors count against their endpoint instead of stopping the run.
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://load-test"
+            ) as client:
+                await drive(client, state, args.warmup, args.concurrency, rng, texts)
+                calls_before = await database_calls(client)
+                latencies, errors, elapsed = await drive(
+                    client, state, args.requests, args.concurrency, rng, texts
+                )
+                calls_after = await database_calls(client)
+    print(
+        f"\n{args.requests} requests from {args.concurrency} clients in {elapsed:.2f} s, "
+        f"database latency {args.db_latency_ms} ms\n"
+    )
+    return summarize(latencies, errors, elapsed, calls_before, calls_after)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load-test the API in-process against an in-memory database."
+    )
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--distinct-queries",
+        type=int,
+        default=2000,
+        help="How many different query texts to send; fewer means more cache hits",
+    )
+    parser.add_argument(
+        "--db-latency-ms",
+        type=float,
+        default=0.5,
+        help="Simulated round trip of every database call",
+    )
+    parser.add_argument(
+        "--model-latency-scale",
+        type=float,
+        default=0.01,
+        help="Scales the seeded models' average latencies (about 0.4-2.5 s) for the mock provider",
+    )
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save these results as the baseline instead of comparing against it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Relative change that counts as a regression",
+    )
+    parser.add_argument(
+        "--baseline", help="Baseline file (default: benchmarks/baselines/load.json)"
+    )
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    sys.exit(
+        benchmarks.baselines.report(
+            SUITE,
+            results,
+            args.save_baseline,
+            args.tolerance,
+            args.baseline,
+            parameters={
+                name: value
+                for name, value in vars(args).items()
+                if name not in ("save_baseline", "tolerance", "baseline")
+            },
+        )
+    )
@@ -0,0 +1,225 @@
+"""
+Micro-benchmarks of the hot paths every query goes through: complexity scoring, routing and
+response serialization.
+
+Routing runs against the in-memory catalog loaded from benchmarks.fake_prisma, so no database
+is needed, only a generated Prisma client. Run from the repository root:
+
+    poetry run python -m benchmarks.micro_benchmarks --save-baseline
+    poetry run python -m benchmarks.micro_benchmarks
+
+Each benchmark is timed in batches sized to take about 0.2 s; the median and best time per
+call over --repeat batches are reported in microseconds. Without --save-baseline the medians
+are compared against benchmarks/baselines/micro.json and the exit status is 1 if any of them
+regressed by more than --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List
+
+import benchmarks.baselines
+import benchmarks.fake_prisma
+import project.analyze_query_complexity_service
+import project.model_catalog
+import project.process_query_service
+import project.query_history_service
+import project.routing_engine
+from fastapi.encoders import jsonable_encoder
+
+SUITE = "micro"
+BATCH_SIZE = 1000
+
+QUERY_TEMPLATES = (
+    "What is the capital of {topic}?",
+    "Summarise the main arguments for and against {topic} in three bullet points.",
+    "Write a Python function that parses {topic} records:\n```python\ndef parse(rows):\n"
+    "    return [row.split(',') for row in rows]\n```\nWhy is it slow on large inputs?",
+    "Solve for x: 3x^2 + 2x = {topic}. Then compute the derivative and the integral.",
+    "Draft a friendly product announcement about {topic} for our newsletter, with a title.",
+)
+TOPICS = ("France", "remote work", "CSV files", "42", "the new pricing page", "solar")
+
+
+def query_texts(count: int, seed: int = 7) -> List[str]:
+    """
+    Returns `count` query texts of mixed length and complexity, the same for a given seed.
+    """
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUERY_TEMPLATES).format(topic=rng.choice(TOPICS))
+        + " " * rng.randint(0, 3)
+        for _ in range(count)
+    ]
+
+
+def history_response() -> project.query_history_service.QueryHistoryResponse:
+    now = datetime.now(timezone.utc)
+    return project.query_history_service.QueryHistoryResponse(
+        queries=[
+            project.query_history_service.QueryHistoryItem(
+                id=f"query-{i}",
+                createdAt=now - timedelta(minutes=i),
+                queryText=text,
+                userId="user-1",
+                routedToModel="GPT-4 Turbo",
+                complexityScore=1.4,
+                latency=812.5,
+                cost=0.031,
+            )
+            for i, text in enumerate(query_texts(100))
+        ],
+        start=now - timedelta(days=30),
+        end=now,
+        nextCursor="eyJjcmVhdGVkQXQiOiAiMjAyNC0wNi0wMSJ9",
+    )
+
+
+def time_call(function: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(number, 1)
+    per_call = [total / number * 1e6 for total in timer.repeat(repeat, number)]
+    return {"median_us": statistics.median(per_call), "best_us": min(per_call)}
+
+
+def time_async_call(
+    loop: asyncio.AbstractEventLoop,
+    function: Callable[[], Awaitable[object]],
+    repeat: int,
+) -> Dict[str, float]:
+    async def run(number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            await function()
+        return time.perf_counter() - started
+
+    number = 1
+    while loop.run_until_complete(run(number)) < 0.2:
+        number *= 2
+    per_call = [
+        loop.run_until_complete(run(number)) / number * 1e6 for _ in range(repeat)
+    ]
+    return {"median_us": statistics.median(per_call), "best_us": min(per_call)}
+
+
+def run_benchmarks(
+    loop: asyncio.AbstractEventLoop, repeat: int
+) -> benchmarks.baselines.Results:
+    complexity = project.analyze_query_complexity_service
+    routing = project.routing_engine
+    texts = query_texts(BATCH_SIZE)
+    scores = complexity.calculate_complexity_scores(texts)
+    loop.run_until_complete(project.model_catalog.refresh())
+    models = tuple(loop.run_until_complete(project.model_catalog.get_snapshot()).models)
+    live_costs = {model.name: model.costPerQuery * 1.1 for model in models}
+    live_latencies = {model.name: model.averageLatency * 0.9 for model in models}
+    error_rates = {model.name: 0.01 for model in models}
+    process_response = project.process_query_service.ProcessQueryResponse(
+        queryId="query-1",
+        routedToModel="GPT-4 Turbo",
+        processingTimeMs=812.5,
+        status="Completed",
+        response="A simulated answer. " * 40,
+        cost=0.031,
+    )
+    history = history_response()
+
+    cases: Dict[str, Callable[[], Dict[str, float]]] = {
+        "complexity score, 1 query": lambda: time_call(
+            lambda: complexity.calculate_complexity_score(texts[0]), repeat
+        ),
+        f"complexity scores, {BATCH_SIZE} queries": lambda: time_call(
+            lambda: complexity.calculate_complexity_scores(texts), repeat
+        ),
+        f"categorize scores, {BATCH_SIZE} queries": lambda: time_call(
+            lambda: complexity.categorize_scores(scores), repeat
+        ),
+        "rank models, catalog figures": lambda: time_call(
+            lambda: routing.rank_models(models, 1.4, 0.8), repeat
+        ),
+        "rank models, live estimates": lambda: time_call(
+            lambda: routing.rank_models(
+                models,
+                1.4,
+                0.8,
+                expected_costs=live_costs,
+                expected_latencies=live_latencies,
+                error_rates=error_rates,
+            ),
+            repeat,
+        ),
+        "route query": lambda: time_async_call(
+            loop,
+            lambda: routing.route_query(1.4, budget_remaining_fraction=0.8),
+            repeat,
+        ),
+        "process response, jsonable_encoder": lambda: time_call(
+            lambda: json.dumps(jsonable_encoder(process_response)), repeat
+        ),
+        "process response, model_dump_json": lambda: time_call(
+            process_response.model_dump_json, repeat
+        ),
+        "history page of 100, jsonable_encoder": lambda: time_call(
+            lambda: json.dumps(jsonable_encoder(history)), repeat
+        ),
+        "history page of 100, model_dump_json": lambda: time_call(
+            history.model_dump_json, repeat
+        ),
+    }
+    results = {}
+    print(f"{'benchmark':<40} {'median':>12} {'best':>12}")
+    for name, case in cases.items():
+        results[name] = case()
+        print(
+            f"{name:<40} {results[name]['median_us']:>9.2f} us "
+            f"{results[name]['best_us']:>9.2f} us",
+            flush=True,
+        )
+    return {
+        name: {"median_us": result["median_us"]} for name, result in results.items()
+    }
+
+
+def main(repeat: int, save_baseline: bool, tolerance: float, baseline: str) -> int:
+    db = benchmarks.fake_prisma.FakeDatabase()
+    db.seed_models()
+    loop = asyncio.new_event_loop()
+    try:
+        with db.install():
+            results = run_benchmarks(loop, repeat)
+    finally:
+        loop.close()
+    return benchmarks.baselines.report(
+        SUITE, results, save_baseline, tolerance, baseline, {"repeat": repeat}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time complexity scoring, routing and response serialization."
+    )
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save these results as the baseline instead of comparing against it",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Relative slowdown that counts as a regression",
+    )
+    parser.add_argument(
+        "--baseline", help="Baseline file (default: benchmarks/baselines/micro.json)"
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.repeat, args.save_baseline, args.tolerance, args.baseline))
@@ -0,0 +1,208 @@
+"""
+Times the query-history lookups on a large Query-shaped table three ways: with a sequential
+scan, with the indexes declared in schema.prisma, and with those indexes on a table
+range-partitioned by month as sql/partition_query_by_month.sql does.
+
+It needs PostgreSQL in DATABASE_URL and a generated Prisma client, and works in a scratch
+schema, "query_benchmark", that is dropped at the end unless --keep is given. Loading the
+default 10M rows takes a few minutes and about 2 GB of disk per layout.
+
+    poetry run python benchmarks/query_history_benchmark.py --rows 10000000
+
+For each lookup and layout it prints the median execution time reported by EXPLAIN ANALYZE
+over --repeat runs (after one warm-up run), the scan nodes of the plan, and how many tables
+or partitions those scans touched.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+from typing import Dict, List, Tuple
+
+import prisma
+
+SCHEMA = "query_benchmark"
+MODELS = ("GPT-4 Turbo", "Claude 3 Opus", "Gemini 1.5 Pro", "Other")
+# A year of evenly spread, time-ordered inserts, as the service produces them.
+FIRST_MONTH = "2024-01-01"
+MONTHS = 12
+LOAD_CHUNK_ROWS = 1_000_000
+
+LOOKUPS: Dict[str, str] = {
+    # GET /query/history/user/{userId} with its default 30-day window.
+    "user history": """
+        SELECT "id", "createdAt", "routedToModel", "cost" FROM {table}
+        WHERE "userId" = 'user-42'
+          AND "createdAt" >= TIMESTAMP '2024-12-01' AND "createdAt" < TIMESTAMP '2025-01-01'
+        ORDER BY "createdAt" DESC, "id" DESC
+        LIMIT 101
+    """,
+    # GET /query/history/model/{modelName} with its default 30-day window.
+    "model history": """
+        SELECT "id", "createdAt", "userId", "cost" FROM {table}
+        WHERE "routedToModel" = 'Claude 3 Opus'
+          AND "createdAt" >= TIMESTAMP '2024-12-01' AND "createdAt" < TIMESTAMP '2025-01-01'
+        ORDER BY "createdAt" DESC, "id" DESC
+        LIMIT 101
+    """,
+    # The ledger's month-to-date spend.
+    "month total": """
+        SELECT count(*), sum("cost") FROM {table}
+        WHERE "createdAt" >= TIMESTAMP '2024-06-01' AND "createdAt" < TIMESTAMP '2024-07-01'
+    """,
+}
+
+INDEXES = (
+    'CREATE INDEX ON {table} ("userId", "createdAt" DESC, "id" DESC)',
+    'CREATE INDEX ON {table} ("routedToModel", "createdAt" DESC, "id" DESC)',
+    'CREATE INDEX ON {table} USING brin ("createdAt")',
+)
+
+
+async def load_rows(db: prisma.Prisma, rows: int, users: int) -> None:
+    await db.execute_raw(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE')
+    await db.execute_raw(f'CREATE SCHEMA "{SCHEMA}"')
+    await db.execute_raw(
+        f"""
+        CREATE TABLE "{SCHEMA}"."heap" (
+            "id" text NOT NULL,
+            "createdAt" timestamp(3) NOT NULL,
+            "userId" text NOT NULL,
+            "routedToModel" text,
+            "queryText" text NOT NULL,
+            "latency" double precision,
+            "cost" double precision,
+            PRIMARY KEY ("id")
+        )
+        """,
+    )
+    models = ", ".join(f"'{model}'" for model in MODELS)
+    for first in range(1, rows + 1, LOAD_CHUNK_ROWS):
+        last = min(first + LOAD_CHUNK_ROWS - 1, rows)
+        await db.execute_raw(
+            f"""
+            INSERT INTO "{SCHEMA}"."heap"
+            SELECT
+                gen_random_uuid()::text,
+                TIMESTAMP '{FIRST_MONTH}'
+                    + (n::double precision / {rows}) * interval '{MONTHS} months',
+                'user-' || floor(random() * {users})::int,
+                (ARRAY[{models}])[1 + floor(random() * {len(MODELS)})::int],
+                md5(n::text),
+                random() * 3000,
+                random() * 0.1
+            FROM generate_series({first}, {last}) AS n
+            """,
+        )
+        print(f"loaded {last:,} / {rows:,} rows", flush=True)
+    await db.execute_raw(f'ANALYZE "{SCHEMA}"."heap"')
+
+
+async def add_indexes(db: prisma.Prisma, table: str) -> None:
+    for index in INDEXES:
+        await db.execute_raw(index.format(table=table))
+    await db.execute_raw(f"ANALYZE {table}")
+
+
+async def partition_copy(db: prisma.Prisma) -> str:
+    table = f'"{SCHEMA}"."partitioned"'
+    await db.execute_raw(
+        f'CREATE TABLE {table} (LIKE "{SCHEMA}"."heap") PARTITION BY RANGE ("createdAt")'
+    )
+    await db.execute_raw(f'ALTER TABLE {table} ADD PRIMARY KEY ("id", "createdAt")')
+    for month in range(MONTHS + 1):
+        await db.execute_raw(
+            f"""
+            CREATE TABLE "{SCHEMA}"."partitioned_{month:02d}" PARTITION OF {table}
+            FOR VALUES
+                FROM (TIMESTAMP '{FIRST_MONTH}' + interval '{month} months')
+                TO (TIMESTAMP '{FIRST_MONTH}' + interval '{month + 1} months')
+            """,
+        )
+    await db.execute_raw(f'INSERT INTO {table} SELECT * FROM "{SCHEMA}"."heap"')
+    await add_indexes(db, table)
+    return table
+
+
+def scans(plan: dict) -> List[Tuple[str, str]]:
+    """
+    Returns the (node type, relation) of every scan node in an EXPLAIN JSON plan.
+    """
+    found = []
+    if "Relation Name" in plan:
+        found.append((plan["Node Type"], plan["Relation Name"]))
+    for child in plan.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+async def explain(db: prisma.Prisma, sql: str) -> Tuple[float, List[Tuple[str, str]]]:
+    rows = await db.query_raw(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+    result = rows[0]["QUERY PLAN"]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]["Execution Time"], scans(result[0]["Plan"])
+
+
+async def measure(
+    db: prisma.Prisma, layout: str, table: str, repeat: int
+) -> List[Tuple[str, str, float, str, int]]:
+    results = []
+    for lookup, sql in LOOKUPS.items():
+        sql = sql.format(table=table)
+        await explain(db, sql)
+        timings = []
+        for _ in range(repeat):
+            elapsed, found = await explain(db, sql)
+            timings.append(elapsed)
+        node_types = ", ".join(sorted({node_type for node_type, _ in found}))
+        relations = len({relation for _, relation in found})
+        results.append(
+            (lookup, layout, statistics.median(timings), node_types, relations)
+        )
+        print(
+            f"{lookup:<14} {layout:<12} {statistics.median(timings):>10.2f} ms",
+            flush=True,
+        )
+    return results
+
+
+async def main(rows: int, users: int, repeat: int, keep: bool) -> None:
+    db = prisma.Prisma()
+    await db.connect()
+    try:
+        await load_rows(db, rows, users)
+        heap = f'"{SCHEMA}"."heap"'
+        results = await measure(db, "seq scan", heap, repeat)
+        await add_indexes(db, heap)
+        results += await measure(db, "indexed", heap, repeat)
+        partitioned = await partition_copy(db)
+        results += await measure(db, "partitioned", partitioned, repeat)
+        print()
+        print(f"{rows:,} rows, {users:,} users, median of {repeat} runs")
+        print(f"{'lookup':<14} {'layout':<12} {'median':>12}  {'tables':>6}  scans")
+        for lookup, layout, median, node_types, relations in sorted(
+            results, key=lambda result: result[0]
+        ):
+            print(
+                f"{lookup:<14} {layout:<12} {median:>9.2f} ms  {relations:>6}  {node_types}"
+            )
+    finally:
+        if not keep:
+            await db.execute_raw(f'DROP SCHEMA IF EXISTS "{SCHEMA}" CASCADE')
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time query-history lookups with and without indexes and partitions."
+    )
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the scratch schema for inspection"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.users, args.repeat, args.keep))
@@ -1,8 +1,9 @@
 from typing import List
 
-import prisma
-import prisma.models
-from pydantic import BaseModel
+import project.model_estimates
+import project.routing_engine
+import project.user_plans
+from pydantic import BaseModel, Field
 
 
 class AllocateQueryResponse(BaseModel):
@@ -14,6 +15,9 @@ class AllocateQueryResponse(BaseModel):
     expected_cost: float
     expected_latency: float
     availability: bool
+    complexity_category: str = ""
+    fallback_models: List[str] = Field(default_factory=list)
+    expected_latency_p95: float = 0.0
 
 
 async def allocate_query(
@@ -22,6 +26,11 @@ async def allocate_query(
     """
     Allocates a user query to the best-suited AI model based on current performance, cost metrics, and remaining budget.
 
+    Expected cost and latency are live estimates from the queries each model has answered, or its
+    catalog figures until it has answered any.
+
+    The allocation must be admitted by the budget governor at the priority of the user's plan.
+
     Args:
         query_text (str): The text of the query to be processed.
         user_id (str): The ID of the user submitting the query for resource tracking and analysis.
@@ -31,18 +40,23 @@ async def allocate_query(
     Returns:
         AllocateQueryResponse: Provides details about the allocated AI model for the query, including expected cost and latency.
     """
-    ai_models = await prisma.models.AIModel.prisma().find_many()
-    if preferred_models:
-        ai_models = [model for model in ai_models if model.name in preferred_models]
-    suitable_models = sorted(ai_models, key=lambda x: x.costPerQuery)
-    if suitable_models:
-        selected_model = suitable_models[0]
-        response = AllocateQueryResponse(
-            allocated_model=selected_model.name,
-            expected_cost=selected_model.costPerQuery,
-            expected_latency=selected_model.averageLatency,
-            availability=True,
-        )
-        return response
-    else:
-        raise ValueError("No suitable AI models found.")
+    decision = await project.routing_engine.route_query(
+        complexity_score,
+        preferred_models,
+        priority=await project.user_plans.get_priority(user_id),
+    )
+    selected = decision.primary
+    latency_p95 = project.model_estimates.get_estimator().latency_p95(
+        selected.model.name
+    )
+    return AllocateQueryResponse(
+        allocated_model=selected.model.name,
+        expected_cost=selected.expected_cost,
+        expected_latency=selected.expected_latency,
+        availability=True,
+        complexity_category=decision.complexity_category,
+        fallback_models=[ranked.model.name for ranked in decision.fallbacks],
+        expected_latency_p95=latency_p95
+        if latency_p95 is not None
+        else selected.expected_latency,
+    )
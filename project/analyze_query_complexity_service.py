@@ -1,7 +1,42 @@
+from typing import List, Sequence
+
+import numpy as np
 import prisma
+import prisma.enums
 import prisma.models
+import project.query_writer
 from pydantic import BaseModel
 
+MAX_BATCH_SIZE = 10_000
+
+CODE_MARKERS = ("```", "def ", "class ", "import ", "return ", "{", "};", "=>", "()")
+MATH_MARKERS = (
+    "=",
+    "+",
+    "^",
+    "\\",
+    "sqrt",
+    "integral",
+    "derivative",
+    "equation",
+    "matrix",
+    "probability",
+)
+
+# Each feature is scaled to 0..1 before weighting, so the weights bound its contribution
+# to the score. They sum to 3.2 and scores are clipped to 3.0, matching categorize_score.
+FEATURE_WEIGHTS = np.array([1.2, 0.6, 0.6, 0.4, 0.4])
+LENGTH_SATURATION = 2000
+TOKEN_SATURATION = 300
+CODE_SATURATION = 3
+MATH_SATURATION = 4
+QUESTION_SATURATION = 3
+# numpy string arrays are fixed-width UCS4, padded to their longest text. Markers are counted
+# in at most this many leading characters of each text, and texts are vectorized this many at
+# a time, so one very long text cannot blow up the array; length is always the full length.
+SCAN_LIMIT = 2 * LENGTH_SATURATION
+SCAN_CHUNK_SIZE = 1000
+
 
 class AnalyzeQueryComplexityResponse(BaseModel):
     """
@@ -12,6 +47,14 @@ class AnalyzeQueryComplexityResponse(BaseModel):
     complexity_category: str
 
 
+class AnalyzeQueryComplexityBatchResponse(BaseModel):
+    """
+    Outputs the complexity score and category of every query in a batch, in the order they were submitted.
+    """
+
+    results: List[AnalyzeQueryComplexityResponse]
+
+
 async def analyze_query_complexity(
     query_text: str, user_id: str
 ) -> AnalyzeQueryComplexityResponse:
@@ -28,11 +71,13 @@ async def analyze_query_complexity(
     """
     complexity_score = calculate_complexity_score(query_text)
     complexity_category = categorize_score(complexity_score)
-    await prisma.models.Query.prisma().create(
-        data={
+    await project.query_writer.create_query(
+        {
             "queryText": query_text,
             "complexityScore": complexity_score,
             "userId": user_id,
+            # Analysis is all that was asked for; keep the row away from the query workers.
+            "status": prisma.enums.QueryStatus.COMPLETED,
         }
     )
     return AnalyzeQueryComplexityResponse(
@@ -40,13 +85,114 @@ async def analyze_query_complexity(
     )
 
 
+async def analyze_query_complexity_batch(
+    query_texts: List[str], user_id: str
+) -> AnalyzeQueryComplexityBatchResponse:
+    """
+    Analyzes the complexity of many user-submitted queries in one call.
+
+    All queries are scored together by the vectorized scorer and recorded with a single bulk insert.
+
+    Args:
+        query_texts (List[str]): The texts of the user's queries to analyze.
+        user_id (str): The ID of the user submitting the queries.
+
+    Returns:
+        AnalyzeQueryComplexityBatchResponse: Outputs the complexity score and category of every query
+        in the batch, in the order they were submitted.
+    """
+    if len(query_texts) > MAX_BATCH_SIZE:
+        raise ValueError(
+            f"Batch of {len(query_texts)} queries exceeds the limit of {MAX_BATCH_SIZE}."
+        )
+    if not query_texts:
+        return AnalyzeQueryComplexityBatchResponse(results=[])
+    scores = calculate_complexity_scores(query_texts)
+    categories = categorize_scores(scores)
+    score_list = scores.tolist()
+    await prisma.models.Query.prisma().create_many(
+        data=[
+            {
+                "queryText": query_text,
+                "complexityScore": score,
+                "userId": user_id,
+                "status": prisma.enums.QueryStatus.COMPLETED,
+            }
+            for query_text, score in zip(query_texts, score_list)
+        ]
+    )
+    return AnalyzeQueryComplexityBatchResponse(
+        results=[
+            AnalyzeQueryComplexityResponse(
+                complexity_score=score, complexity_category=category
+            )
+            for score, category in zip(score_list, categories)
+        ]
+    )
+
+
+def extract_complexity_features(query_texts: Sequence[str]) -> np.ndarray:
+    """
+    Extracts the complexity features of many queries at once.
+
+    The features are, in order: character length (log-scaled), token count, code markers,
+    math markers and question marks. Each is scaled to the range 0..1.
+
+    Args:
+        query_texts (Sequence[str]): The texts of the queries to analyze.
+
+    Returns:
+        np.ndarray: A (len(query_texts), 5) matrix of scaled features.
+    """
+    if len(query_texts) > SCAN_CHUNK_SIZE:
+        return np.concatenate(
+            [
+                extract_complexity_features(query_texts[i : i + SCAN_CHUNK_SIZE])
+                for i in range(0, len(query_texts), SCAN_CHUNK_SIZE)
+            ]
+        )
+    lengths = np.fromiter(
+        (len(text) for text in query_texts), dtype=np.int64, count=len(query_texts)
+    )
+    texts = np.asarray([text[:SCAN_LIMIT] for text in query_texts], dtype=np.str_)
+    lowered = np.char.lower(texts)
+    tokens = np.char.count(texts, " ") + np.char.count(texts, "\n") + (lengths > 0)
+    code_markers = sum(np.char.count(texts, marker) for marker in CODE_MARKERS)
+    math_markers = sum(np.char.count(lowered, marker) for marker in MATH_MARKERS)
+    questions = np.char.count(texts, "?")
+    features = np.stack(
+        [
+            np.log1p(lengths) / np.log1p(LENGTH_SATURATION),
+            tokens / TOKEN_SATURATION,
+            code_markers / CODE_SATURATION,
+            math_markers / MATH_SATURATION,
+            questions / QUESTION_SATURATION,
+        ],
+        axis=-1,
+    )
+    return np.clip(features, 0.0, 1.0)
+
+
+def calculate_complexity_scores(query_texts: Sequence[str]) -> np.ndarray:
+    """
+    Calculates the complexity scores of many queries at once.
+
+    Args:
+        query_texts (Sequence[str]): The texts of the queries to analyze.
+
+    Returns:
+        np.ndarray: One score per query, between 0.0 and 3.0.
+    """
+    features = extract_complexity_features(query_texts)
+    return np.clip(features @ FEATURE_WEIGHTS, 0.0, 3.0)
+
+
 def calculate_complexity_score(query_text: str) -> float:
     """
     Calculates the complexity score of a query.
 
-    This is a placeholder function to simulate the complexity analysis.
-    In a real scenario, this could be a more sophisticated analysis based
-    on various factors like query length, use of specific keywords, etc.
+    The score is a weighted sum of length, token count, code and math markers and the number
+    of questions asked; see extract_complexity_features.
 
     Args:
         query_text (str): The text of the query to analyze.
@@ -54,8 +200,7 @@ def calculate_complexity_score(query_text: str) -> float:
     Returns:
         float: A calculated complexity score for the query.
     """
-    score = len(query_text) / 100.0
-    return score
+    return float(calculate_complexity_scores([query_text])[0])
 
 
 def categorize_score(score: float) -> str:
@@ -74,3 +219,17 @@ def categorize_score(score: float) -> str:
         return "Medium"
     else:
         return "High"
+
+
+def categorize_scores(scores: np.ndarray) -> List[str]:
+    """
+    Categorizes many complexity scores at once, using the same thresholds as categorize_score.
+
+    Args:
+        scores (np.ndarray): The computed complexity scores.
+
+    Returns:
+        List[str]: The category of each score ('Low', 'Medium', 'High').
+    """
+    labels = np.array(["Low", "Medium", "High"])
+    return labels[np.digitize(scores, [1.0, 2.0])].tolist()
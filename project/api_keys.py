@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.single_flight
+from fastapi import Depends, HTTPException, WebSocketException, status
+from fastapi.requests import HTTPConnection
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Without this, requests without a key are let through anonymously and act as whichever user
+# they name; a key that is sent is always checked. Admin endpoints always need a key.
+AUTH_REQUIRED = os.getenv("API_KEY_AUTH_REQUIRED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+API_KEY_HEADER = "X-API-Key"
+# Browsers cannot set headers on WebSocket handshakes, so they may pass the key here instead.
+API_KEY_QUERY_PARAM = "api_key"
+# Keys are stored as HMAC-SHA256 digests under this secret, so the APIKey table alone does
+# not reveal usable keys. No key can be issued or verified without it, and with
+# API_KEY_AUTH_REQUIRED on the service refuses to start without it.
+HASH_SECRET = os.getenv("API_KEY_HASH_SECRET", "").encode()
+CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "300"))
+NEGATIVE_CACHE_TTL_SECONDS = float(
+    os.getenv("API_KEY_NEGATIVE_CACHE_TTL_SECONDS", "30")
+)
+CACHE_MAX_ENTRIES = int(os.getenv("API_KEY_CACHE_MAX_ENTRIES", "100000"))
+# How often keys revoked by other processes are evicted from this process's cache.
+REVOCATION_SWEEP_SECONDS = float(os.getenv("API_KEY_REVOCATION_SWEEP_SECONDS", "5"))
+KEY_PREFIX = "pr_"
+
+
+@dataclass(frozen=True)
+class ApiKeyPrincipal:
+    """
+    The key a request authenticated with, and the user it belongs to.
+    """
+
+    key_id: str
+    user_id: str
+    role: prisma.enums.UserRole
+
+
+class ApiKeyCacheStats(BaseModel):
+    """
+    How often API keys were verified from memory rather than the database.
+    """
+
+    entries: int
+    hits: int
+    misses: int
+    rejected: int
+    evicted_revoked: int
+
+
+def check_hash_secret() -> None:
+    """
+    Raises:
+        RuntimeError: If API_KEY_HASH_SECRET is not set, so keys would be hashed under an empty key.
+    """
+    if not HASH_SECRET:
+        raise RuntimeError("API_KEY_HASH_SECRET must be set to hash API keys.")
+
+
+def hash_key(key: str) -> str:
+    """
+    Returns the digest under which an API key is stored in APIKey.key.
+
+    Raises:
+        RuntimeError: If API_KEY_HASH_SECRET is not set.
+    """
+    check_hash_secret()
+    return hmac.new(HASH_SECRET, key.encode(), hashlib.sha256).hexdigest()
+
+
+def generate_key() -> str:
+    """
+    Returns a new random API key, to be shown to its owner once and stored only as its digest.
+    """
+    return KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+class ApiKeyCache:
+    """
+    Verifies API keys against APIKey rows, remembering the outcome by key digest.
+
+    A valid key is remembered for `ttl` seconds or until it expires, whichever is sooner, and an
+    unknown, expired or revoked key for `negative_ttl` seconds, so a repeated request is one
+    dictionary lookup. Concurrent misses for the same key share one database read. Keys revoked
+    through this process are evicted at once; a sweeper evicts keys revoked elsewhere every
+    `sweep_interval` seconds. Past `max_entries`, the oldest entries are dropped first.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL_SECONDS,
+        negative_ttl: float = NEGATIVE_CACHE_TTL_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        sweep_interval: float = REVOCATION_SWEEP_SECONDS,
+    ) -> None:
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._entries: Dict[str, Tuple[float, Optional[ApiKeyPrincipal]]] = {}
+        self._lookups = project.single_flight.SingleFlight()
+        self._swept_until = datetime.now(timezone.utc)
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0, "evicted_revoked": 0}
+
+    async def verify(self, key: str) -> Optional[ApiKeyPrincipal]:
+        """
+        Returns who an API key belongs to, or None if it is unknown, expired or revoked.
+        """
+        if not HASH_SECRET:
+            # No key can have been issued without a secret, so none is valid.
+            self._stats["rejected"] += 1
+            return None
+        digest = hash_key(key)
+        entry = self._entries.get(digest)
+        if entry is not None and entry[0] > time.monotonic():
+            self._stats["hits"] += 1
+            principal = entry[1]
+        else:
+            self._stats["misses"] += 1
+            principal, _ = await self._lookups.do(digest, lambda: self._load(digest))
+        if principal is None:
+            self._stats["rejected"] += 1
+        return principal
+
+    async def _load(self, digest: str) -> Optional[ApiKeyPrincipal]:
+        row = await prisma.models.APIKey.prisma().find_unique(
+            where={"key": digest}, include={"user": True}
+        )
+        now = datetime.now(timezone.utc)
+        if row is None or row.revokedAt is not None or row.validUntil <= now:
+            self._remember(digest, self.negative_ttl, None)
+            return None
+        principal = ApiKeyPrincipal(
+            key_id=row.id, user_id=row.userId, role=row.user.role
+        )
+        self._remember(
+            digest,
+            min(self.ttl, (row.validUntil - now).total_seconds()),
+            principal,
+        )
+        return principal
+
+    def _remember(
+        self, digest: str, ttl: float, principal: Optional[ApiKeyPrincipal]
+    ) -> None:
+        self._entries.pop(digest, None)
+        while len(self._entries) >= self.max_entries:
+            del self._entries[next(iter(self._entries))]
+        self._entries[digest] = (time.monotonic() + ttl, principal)
+
+    def evict(self, digest: str) -> None:
+        """
+        Forgets the cached outcome for a key digest, so its next use is checked again.
+        """
+        if self._entries.pop(digest, None) is not None:
+            self._stats["evicted_revoked"] += 1
+
+    async def sweep(self) -> int:
+        """
+        Evicts every key revoked since the previous sweep.
+
+        Returns:
+            int: The number of revoked keys found.
+        """
+        started = datetime.now(timezone.utc)
+        # Overlap the previous sweep so a revocation committed while it ran is not missed.
+        since = self._swept_until - timedelta(seconds=self.sweep_interval)
+        rows = await prisma.models.APIKey.prisma().find_many(
+            where={"revokedAt": {"gte": since}}
+        )
+        for row in rows:
+            self.evict(row.key)
+        self._swept_until = started
+        return len(rows)
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Failed to sweep revoked API keys")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._swept_until = datetime.now(timezone.utc)
+            self._task = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> ApiKeyCacheStats:
+        return ApiKeyCacheStats(entries=len(self._entries), **self._stats)
+
+
+_cache = ApiKeyCache()
+
+
+async def authenticate(connection: HTTPConnection) -> Optional[ApiKeyPrincipal]:
+    """
+    FastAPI dependency that authenticates a request or WebSocket by its API key.
+
+    The key is read from the X-API-Key header, or for WebSockets also from the `api_key` query
+    parameter.
+
+    Args:
+        connection (HTTPConnection): The incoming request or WebSocket.
+
+    Returns:
+        Optional[ApiKeyPrincipal]: Who the key belongs to, or None for an anonymous request
+            when API_KEY_AUTH_REQUIRED is off.
+
+    Raises:
+        HTTPException: 401 if the key is missing and required, or invalid.
+        WebSocketException: The same, for WebSocket connections.
+    """
+    key = connection.headers.get(API_KEY_HEADER)
+    websocket = connection.scope["type"] == "websocket"
+    if key is None and websocket:
+        key = connection.query_params.get(API_KEY_QUERY_PARAM)
+    if key is None and not AUTH_REQUIRED:
+        return None
+    principal = await _cache.verify(key) if key else None
+    if principal is not None:
+        return principal
+    reason = "Invalid API key." if key else "An API key is required."
+    if websocket:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=reason)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=reason,
+        headers={"WWW-Authenticate": "ApiKey"},
+    )
+
+
+async def require_principal(connection: HTTPConnection) -> ApiKeyPrincipal:
+    """
+    FastAPI dependency like `authenticate`, for endpoints that are never open to anonymous
+    callers, whatever API_KEY_AUTH_REQUIRED says.
+
+    Raises:
+        HTTPException: 401 if the request has no valid API key.
+        WebSocketException: The same, for WebSocket connections.
+    """
+    principal = await authenticate(connection)
+    if principal is not None:
+        return principal
+    reason = "An API key is required."
+    if connection.scope["type"] == "websocket":
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=reason)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=reason,
+        headers={"WWW-Authenticate": "ApiKey"},
+    )
+
+
+async def require_admin(
+    principal: ApiKeyPrincipal = Depends(require_principal),
+) -> ApiKeyPrincipal:
+    """
+    FastAPI dependency for admin endpoints: the request needs a valid key of an ADMIN user.
+
+    Raises:
+        HTTPException: 401 if the request has no valid API key, 403 if its user is no admin.
+    """
+    if principal.role != prisma.enums.UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required."
+        )
+    return principal
+
+
+def acting_user_id(
+    principal: Optional[ApiKeyPrincipal],
+    user_id: Optional[str],
+    required: bool = True,
+) -> Optional[str]:
+    """
+    Returns the user a request acts as.
+
+    With a key this is the key's owner; only an admin may name another user. Anonymous
+    requests, let through when API_KEY_AUTH_REQUIRED is off, act as the user they name.
+
+    Args:
+        principal (Optional[ApiKeyPrincipal]): Who the request authenticated as, if anyone.
+        user_id (Optional[str]): The user the request names, if any.
+        required (bool): Whether an anonymous request must name a user.
+
+    Returns:
+        Optional[str]: The user ID, or None for an anonymous request that named none.
+
+    Raises:
+        PermissionError: If a non-admin key names another user.
+        ValueError: If the request is anonymous, names no user and one is required.
+    """
+    if principal is None:
+        if user_id is None and required:
+            raise ValueError("A userId is required without an API key.")
+        return user_id
+    if user_id is None or user_id == principal.user_id:
+        return principal.user_id
+    if principal.role != prisma.enums.UserRole.ADMIN:
+        raise PermissionError("An API key may only act for its own user.")
+    return user_id
+
+
+def restricted_user_id(principal: Optional[ApiKeyPrincipal]) -> Optional[str]:
+    """
+    Returns the user whose queries a request may read, or None if it may read any.
+
+    Admins and anonymous requests (API_KEY_AUTH_REQUIRED off) are not restricted.
+    """
+    if principal is None or principal.role == prisma.enums.UserRole.ADMIN:
+        return None
+    return principal.user_id
+
+
+def evict(key_digest: str) -> None:
+    """
+    Forgets the cached verification of a key, by its stored digest.
+    """
+    _cache.evict(key_digest)
+
+
+async def start() -> None:
+    """
+    Starts evicting keys revoked by other processes from the cache.
+
+    Raises:
+        RuntimeError: If API_KEY_AUTH_REQUIRED is on but API_KEY_HASH_SECRET is not set.
+    """
+    if AUTH_REQUIRED:
+        check_hash_secret()
+    elif not HASH_SECRET:
+        logger.warning(
+            "API_KEY_HASH_SECRET is not set; API keys cannot be issued or verified"
+        )
+    await _cache.start()
+
+
+async def stop() -> None:
+    """
+    Stops the revocation sweeper.
+    """
+    await _cache.stop()
+
+
+def get_stats() -> ApiKeyCacheStats:
+    """
+    Returns hit and miss counts of the API key cache.
+    """
+    return _cache.stats()
@@ -0,0 +1,119 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import project.financial_ledger
+
+# Below this share of the monthly budget left, models that would let the remainder serve fewer
+# than BUDGET_MIN_QUERIES_LEFT more queries are not routed to.
+DOWNGRADE_FRACTION = float(os.getenv("BUDGET_DOWNGRADE_FRACTION", "0.2"))
+MIN_QUERIES_LEFT = int(os.getenv("BUDGET_MIN_QUERIES_LEFT", "1000"))
+# Once this share of the budget is spent or reserved, only traffic with at least
+# BUDGET_PROTECTED_PRIORITY is admitted; once all of it is, nothing is.
+LOW_PRIORITY_CAP_FRACTION = float(os.getenv("BUDGET_LOW_PRIORITY_CAP_FRACTION", "0.95"))
+PROTECTED_PRIORITY = int(os.getenv("BUDGET_PROTECTED_PRIORITY", "2"))
+
+
+class BudgetExceededError(Exception):
+    """
+    Raised when the monthly budget does not admit a query of the given priority.
+    """
+
+
+def state_for(remaining: float) -> str:
+    """
+    Returns the budget regime for a share of the monthly budget left: "normal", "downgrade",
+    "protected-only" or "exhausted".
+
+    Args:
+        remaining (float): The share of the budget not yet spent or reserved, from 0.0 to 1.0.
+    """
+    if remaining <= 0:
+        return "exhausted"
+    if remaining <= 1 - LOW_PRIORITY_CAP_FRACTION:
+        return "protected-only"
+    if remaining < DOWNGRADE_FRACTION:
+        return "downgrade"
+    return "normal"
+
+
+def state() -> str:
+    """
+    Returns the current budget regime: "normal", "downgrade", "protected-only" or "exhausted".
+    """
+    return state_for(project.financial_ledger.remaining_budget_fraction())
+
+
+def min_priority_for(remaining: float) -> Optional[int]:
+    """
+    Returns the lowest priority admitted with a share of the budget left, or None if nothing is.
+    """
+    current = state_for(remaining)
+    if current == "exhausted":
+        return None
+    if current == "protected-only":
+        return PROTECTED_PRIORITY
+    return 0
+
+
+def min_admitted_priority() -> Optional[int]:
+    """
+    Returns the lowest priority that is currently admitted, or None if nothing is.
+    """
+    return min_priority_for(project.financial_ledger.remaining_budget_fraction())
+
+
+def check_admission(priority: int) -> None:
+    """
+    Checks that the budget admits a query of the given priority.
+
+    Args:
+        priority (int): The scheduling priority of the query, from its user's plan.
+
+    Raises:
+        BudgetExceededError: If the budget is exhausted, or nearly so and the priority is too low.
+    """
+    floor = min_admitted_priority()
+    if floor is None:
+        raise BudgetExceededError("The monthly budget is exhausted.")
+    if priority < floor:
+        raise BudgetExceededError(
+            "The monthly budget is nearly exhausted; only priority traffic is admitted."
+        )
+
+
+def cost_ceiling_for(remaining: float, remaining_budget: float) -> Optional[float]:
+    """
+    Returns the most a single query may be expected to cost with a share of the budget left, or
+    None while that share is healthy.
+
+    Args:
+        remaining (float): The share of the budget not yet spent or reserved, from 0.0 to 1.0.
+        remaining_budget (float): The same, in USD.
+    """
+    if remaining >= DOWNGRADE_FRACTION:
+        return None
+    return max(remaining_budget, 0.0) / max(MIN_QUERIES_LEFT, 1)
+
+
+def cost_ceiling() -> Optional[float]:
+    """
+    Returns the most a single query may be expected to cost, or None while the budget is healthy.
+    """
+    return cost_ceiling_for(
+        project.financial_ledger.remaining_budget_fraction(),
+        project.financial_ledger.get_ledger().remaining_budget(),
+    )
+
+
+@contextmanager
+def reserve(expected_cost: float) -> Iterator[None]:
+    """
+    Holds the expected cost of a query against the budget while it is being answered.
+    """
+    ledger = project.financial_ledger.get_ledger()
+    ledger.reserve(expected_cost)
+    try:
+        yield
+    finally:
+        ledger.release(expected_cost)
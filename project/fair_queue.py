@@ -0,0 +1,41 @@
+import asyncio
+import heapq
+import itertools
+from typing import Any, Dict, Hashable, Tuple
+
+
+class FairQueue(asyncio.Queue):
+    """
+    An asyncio queue that shares its output between flows in proportion to their weights.
+
+    Entries are put as `(flow, weight, item)` tuples and come out as the bare item. The order is
+    self-clocked fair queueing: each entry is stamped with a virtual finish time `1 / weight`
+    after the later of its flow's previous finish time and the finish time of the last entry
+    taken, and the entry with the earliest finish time is taken next. While several flows are
+    waiting each is served in proportion to its weight, however many entries it has queued, and
+    the entries of one flow keep their order.
+    """
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish: Dict[Hashable, float] = {}
+        self._waiting: Dict[Hashable, int] = {}
+
+    def _put(self, entry: Tuple[Hashable, float, Any]) -> None:
+        flow, weight, item = entry
+        finish = max(self._virtual_time, self._finish.get(flow, 0.0)) + 1.0 / weight
+        self._finish[flow] = finish
+        self._waiting[flow] = self._waiting.get(flow, 0) + 1
+        heapq.heappush(self._queue, (finish, next(self._sequence), flow, item))
+
+    def _get(self) -> Any:
+        finish, _, flow, item = heapq.heappop(self._queue)
+        self._virtual_time = finish
+        self._waiting[flow] -= 1
+        if not self._waiting[flow]:
+            # The flow's last finish time is now in the past, so it restarts from the clock.
+            del self._waiting[flow]
+            del self._finish[flow]
+        return item
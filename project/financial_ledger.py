@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import prisma
+import prisma.models
+import project.query_writer
+
+logger = logging.getLogger(__name__)
+
+MONTHLY_BUDGET = float(os.getenv("MONTHLY_BUDGET", "5000"))
+RECONCILE_INTERVAL_SECONDS = float(
+    os.getenv("LEDGER_RECONCILE_INTERVAL_SECONDS", "300")
+)
+
+
+def billing_month_start(now: Optional[datetime] = None) -> datetime:
+    """
+    Returns the start of the billing month (UTC) containing `now`.
+
+    Args:
+        now (Optional[datetime]): The point in time to use. Defaults to the current time.
+
+    Returns:
+        datetime: Midnight UTC on the first day of the month.
+    """
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+class CostTotals:
+    """
+    A running cost sum and query count.
+    """
+
+    __slots__ = ("cost", "count")
+
+    def __init__(self, cost: float = 0.0, count: int = 0) -> None:
+        self.cost = cost
+        self.count = count
+
+    def add(self, cost: float, count: int = 1) -> None:
+        self.cost += cost
+        self.count += count
+
+
+class FinancialLedger:
+    """
+    In-process running totals of query cost for the current billing month.
+
+    Totals are kept overall and per routed model and are updated with `record()` whenever a
+    query's cost is known, so reading them is constant time. `reconcile()` replaces them with
+    an aggregate computed by the database, correcting any drift from other processes or from
+    writes that bypassed this ledger. Totals reset when a new billing month starts.
+
+    Costs recorded for a query whose row has not been written yet are kept by query ID until
+    `persisted()` is called for it, so reconciling neither loses nor double-counts them. Spend
+    that no row will ever carry, such as a cancelled hedge request, is recorded with
+    `record_overhead()` and kept for the rest of the month.
+
+    Queries that are still being answered can `reserve()` their expected cost, so the remaining
+    budget also accounts for spend that is committed but not yet known.
+    """
+
+    def __init__(self) -> None:
+        self.month_start = billing_month_start()
+        self.total = CostTotals()
+        self.by_model: Dict[str, CostTotals] = {}
+        self.reserved = 0.0
+        self._unpersisted: Dict[str, Tuple[str, float]] = {}
+        self._overhead: Dict[str, float] = {}
+        self._listening = False
+        self._task: Optional[asyncio.Task] = None
+
+    def roll_over(self, now: Optional[datetime] = None) -> None:
+        """
+        Resets the totals if a new billing month has started since they were last touched.
+        """
+        month_start = billing_month_start(now)
+        if month_start != self.month_start:
+            self.month_start = month_start
+            self.total = CostTotals()
+            self.by_model = {}
+            self._unpersisted = {}
+            self._overhead = {}
+
+    def record(
+        self,
+        model: Optional[str],
+        cost: float,
+        at: Optional[datetime] = None,
+        query_id: Optional[str] = None,
+    ) -> None:
+        """
+        Adds the cost of one completed query to the running totals.
+
+        Args:
+            model (Optional[str]): The name of the model the query was routed to.
+            cost (float): The cost of the query.
+            at (Optional[datetime]): When the cost was incurred. Defaults to now.
+            query_id (Optional[str]): The ID of the query's row, if the cost has not been
+                written to it yet; call `persisted()` once it has.
+        """
+        at = at or datetime.now(timezone.utc)
+        self.roll_over(at)
+        if billing_month_start(at) != self.month_start:
+            return
+        key = model or "Unknown"
+        self.total.add(cost)
+        self.by_model.setdefault(key, CostTotals()).add(cost)
+        if query_id is not None:
+            self._unpersisted[query_id] = (key, cost)
+
+    def record_overhead(self, model: Optional[str], cost: float) -> None:
+        """
+        Adds spend that is not stored on any Query row, without counting a query.
+
+        Args:
+            model (Optional[str]): The name of the model that was called.
+            cost (float): The cost of the call.
+        """
+        self.roll_over()
+        key = model or "Unknown"
+        self.total.add(cost, 0)
+        self.by_model.setdefault(key, CostTotals()).add(cost, 0)
+        self._overhead[key] = self._overhead.get(key, 0.0) + cost
+
+    def persisted(self, query_ids: List[str]) -> None:
+        """
+        Marks the costs recorded for these queries as written to their rows.
+        """
+        for query_id in query_ids:
+            self._unpersisted.pop(query_id, None)
+
+    async def _on_flush(self, query_ids: List[str]) -> None:
+        self.persisted(query_ids)
+
+    def reserve(self, cost: float) -> None:
+        """
+        Sets aside the expected cost of a query that has been dispatched but not answered yet.
+        """
+        self.reserved += cost
+
+    def release(self, cost: float) -> None:
+        """
+        Returns a reservation made with `reserve()`, once the query's actual cost is recorded.
+        """
+        self.reserved = max(self.reserved - cost, 0.0)
+
+    def remaining_budget(self) -> float:
+        return MONTHLY_BUDGET - self.total.cost - self.reserved
+
+    def remaining_budget_fraction(self) -> float:
+        self.roll_over()
+        if MONTHLY_BUDGET <= 0:
+            return 0.0
+        return min(max(self.remaining_budget() / MONTHLY_BUDGET, 0.0), 1.0)
+
+    async def reconcile(self) -> None:
+        """
+        Replaces the running totals with the current month's totals as aggregated by the database.
+
+        Costs that are recorded but not yet written to their rows, and overhead that no row
+        carries, are re-applied on top of its result, since the aggregate cannot include them.
+        """
+        self.roll_over()
+        month_start = self.month_start
+        groups = await prisma.models.Query.prisma().group_by(
+            ["routedToModel"],
+            where={"createdAt": {"gte": month_start}, "cost": {"not": None}},
+            sum={"cost": True},
+            count=True,
+        )
+        if month_start != self.month_start:
+            return
+        by_model: Dict[str, CostTotals] = {}
+        for group in groups:
+            key = group.get("routedToModel") or "Unknown"
+            totals = by_model.setdefault(key, CostTotals())
+            totals.add((group.get("_sum") or {}).get("cost") or 0.0, 0)
+            totals.count += (group.get("_count") or {}).get("_all") or 0
+        for key, cost in self._unpersisted.values():
+            by_model.setdefault(key, CostTotals()).add(cost)
+        for key, cost in self._overhead.items():
+            by_model.setdefault(key, CostTotals()).add(cost, 0)
+        total = CostTotals()
+        for totals in by_model.values():
+            total.add(totals.cost, totals.count)
+        self.by_model = by_model
+        self.total = total
+
+    async def _reconcile_forever(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Failed to reconcile the financial ledger")
+
+    async def start(self, interval: float = RECONCILE_INTERVAL_SECONDS) -> None:
+        """
+        Loads the current month's totals and starts reconciling them periodically.
+        """
+        if not self._listening:
+            project.query_writer.add_flush_listener(self._on_flush)
+            self._listening = True
+        try:
+            await self.reconcile()
+        except Exception:
+            logger.exception("Failed to load the financial ledger")
+        self._task = asyncio.create_task(self._reconcile_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_ledger = FinancialLedger()
+
+
+async def start() -> None:
+    """
+    Loads this month's totals into the process-wide ledger and starts periodic reconciliation.
+    """
+    await _ledger.start()
+
+
+async def stop() -> None:
+    """
+    Stops periodic reconciliation of the process-wide ledger.
+    """
+    await _ledger.stop()
+
+
+def get_ledger() -> FinancialLedger:
+    """
+    Returns the process-wide ledger.
+    """
+    return _ledger
+
+
+def record_query_cost(
+    model: Optional[str], cost: float, query_id: Optional[str] = None
+) -> None:
+    """
+    Adds the cost of one completed query to the process-wide ledger.
+
+    Args:
+        model (Optional[str]): The name of the model the query was routed to.
+        cost (float): The cost of the query.
+        query_id (Optional[str]): The ID of the query's row, if the cost is not written to it
+            yet; call `cost_persisted()` once it is.
+    """
+    _ledger.record(model, cost, query_id=query_id)
+
+
+def record_overhead_cost(model: Optional[str], cost: float) -> None:
+    """
+    Adds spend that no Query row carries, such as a cancelled hedge request, to the
+    process-wide ledger.
+    """
+    _ledger.record_overhead(model, cost)
+
+
+def cost_persisted(query_id: str) -> None:
+    """
+    Tells the process-wide ledger that a cost recorded with `record_query_cost()` is now stored
+    on the query's row.
+    """
+    _ledger.persisted([query_id])
+
+
+def remaining_budget_fraction() -> float:
+    """
+    Returns the share of this month's budget that has not been spent yet, from 0.0 to 1.0.
+    """
+    return _ledger.remaining_budget_fraction()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Deque, List, Optional, Tuple
+
+import prisma
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("HEALTH_SAMPLE_INTERVAL_SECONDS", "5"))
+RING_SIZE = int(os.getenv("HEALTH_SAMPLE_RING_SIZE", "120"))
+DISK_PATH = os.getenv("HEALTH_DISK_PATH", "/")
+DB_PROBE_TIMEOUT_SECONDS = 2.0
+
+
+@dataclass(frozen=True)
+class HealthSample:
+    """
+    One reading of host resource usage and database liveness.
+    """
+
+    taken_at: datetime
+    monotonic: float
+    cpu_usage_percentage: float
+    memory_usage_percentage: float
+    disk_space_remaining: float
+    database_ok: bool
+    database_latency_ms: float
+    database_error: Optional[str] = None
+
+
+def _read_cpu_times() -> Optional[Tuple[int, int]]:
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return idle, sum(fields)
+
+
+def _read_memory_usage() -> float:
+    meminfo = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0])
+    except (OSError, ValueError):
+        return 0.0
+    total = meminfo.get("MemTotal", 0)
+    available = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+    return (total - available) / total * 100 if total else 0.0
+
+
+def _read_disk_space_remaining() -> float:
+    """
+    Returns the free disk space available to this process at DISK_PATH, in GB.
+    """
+    try:
+        stats = os.statvfs(DISK_PATH)
+    except OSError:
+        return 0.0
+    return stats.f_bavail * stats.f_frsize / 1e9
+
+
+class HealthSampler:
+    """
+    Samples host resource usage and database liveness on a fixed interval.
+
+    CPU and memory are read from /proc, free disk space from os.statvfs, and the database is
+    probed with a timed `SELECT 1` through the Prisma client. The last `ring_size` samples are
+    kept in a ring buffer so health reports are served from memory.
+    """
+
+    def __init__(self, ring_size: int = RING_SIZE) -> None:
+        self._samples: Deque[HealthSample] = deque(maxlen=ring_size)
+        self._previous_cpu = _read_cpu_times()
+        self._task: Optional[asyncio.Task] = None
+
+    def _cpu_usage(self) -> float:
+        current = _read_cpu_times()
+        previous, self._previous_cpu = self._previous_cpu, current
+        if current is None or previous is None:
+            return 0.0
+        idle = current[0] - previous[0]
+        total = current[1] - previous[1]
+        return (1 - idle / total) * 100 if total > 0 else 0.0
+
+    async def _probe_database(self) -> Tuple[bool, float, Optional[str]]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                prisma.get_client().query_raw("SELECT 1"), DB_PROBE_TIMEOUT_SECONDS
+            )
+            return True, (time.perf_counter() - started) * 1000, None
+        except Exception as e:
+            return (
+                False,
+                (time.perf_counter() - started) * 1000,
+                str(e) or type(e).__name__,
+            )
+
+    async def sample(self) -> HealthSample:
+        """
+        Takes one sample and adds it to the ring buffer.
+        """
+        database_ok, database_latency_ms, database_error = await self._probe_database()
+        sample = HealthSample(
+            taken_at=datetime.now(timezone.utc),
+            monotonic=time.monotonic(),
+            cpu_usage_percentage=self._cpu_usage(),
+            memory_usage_percentage=_read_memory_usage(),
+            disk_space_remaining=_read_disk_space_remaining(),
+            database_ok=database_ok,
+            database_latency_ms=database_latency_ms,
+            database_error=database_error,
+        )
+        self._samples.append(sample)
+        return sample
+
+    def latest(self) -> Optional[HealthSample]:
+        return self._samples[-1] if self._samples else None
+
+    def window(self, seconds: float) -> List[HealthSample]:
+        """
+        Returns the samples taken within the last `seconds`, oldest first.
+        """
+        cutoff = time.monotonic() - seconds
+        return [sample for sample in self._samples if sample.monotonic >= cutoff]
+
+    async def _sample_forever(self, interval: float) -> None:
+        while True:
+            try:
+                await self.sample()
+            except Exception:
+                logger.exception("Failed to sample system health")
+            await asyncio.sleep(interval)
+
+    async def start(self, interval: float = SAMPLE_INTERVAL_SECONDS) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_sampler = HealthSampler()
+
+
+async def start() -> None:
+    """
+    Starts sampling system health in the background.
+    """
+    await _sampler.start()
+
+
+async def stop() -> None:
+    """
+    Stops the background health sampler.
+    """
+    await _sampler.stop()
+
+
+def get_sampler() -> HealthSampler:
+    """
+    Returns the process-wide health sampler.
+    """
+    return _sampler
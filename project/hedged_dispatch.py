@@ -0,0 +1,219 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Dict, List
+
+import prisma
+import prisma.models
+import project.budget_governor
+import project.financial_ledger
+import project.model_estimates
+import project.model_providers
+import project.routing_engine
+from pydantic import BaseModel
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Long-run ceiling on hedged requests as a share of all dispatches, and how many may burst.
+HEDGE_MAX_FRACTION = float(os.getenv("HEDGE_MAX_FRACTION", "0.05"))
+HEDGE_BURST = float(os.getenv("HEDGE_BURST", "5"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+# Until a model has a p95 estimate, hedge after this multiple of its catalog latency.
+HEDGE_DEFAULT_LATENCY_MULTIPLIER = 2.0
+MAX_FAILOVERS = int(os.getenv("MODEL_MAX_FAILOVERS", "2"))
+
+
+@dataclass(frozen=True)
+class DispatchOutcome:
+    """
+    The answer that won a hedged dispatch, and the model that gave it.
+    """
+
+    model: prisma.models.AIModel
+    result: project.model_providers.ProviderResult
+    hedged: bool = False
+    failed_over: bool = False
+
+
+class HedgingStats(BaseModel):
+    """
+    How often dispatches were hedged or failed over, and which model circuits are open.
+    """
+
+    enabled: bool
+    dispatches: int
+    hedges: int
+    hedge_wins: int
+    failovers: int
+    cancelled: int
+    hedge_credit: float
+    open_circuits: List[str]
+
+
+class HedgedDispatcher:
+    """
+    Sends a query to the best-ranked model and hedges or fails over to the next-ranked ones.
+
+    Models whose circuit breaker is open are skipped. If the primary model has not answered
+    within its observed p95 latency, one backup request goes to the next-ranked model, and the
+    first answer wins while the other request is cancelled. The cancelled request was already
+    sent, so its expected cost is charged to the financial ledger. If a model fails, the next
+    one is tried, up to `max_failovers` times.
+
+    Hedging is rationed by a credit that grows by `max_fraction` per dispatch, up to `burst`,
+    and costs one per hedge, so hedges stay below that share of traffic. No hedges are sent
+    once the budget governor has left its normal regime, and every in-flight request reserves
+    its expected cost against the budget.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGING_ENABLED,
+        max_fraction: float = HEDGE_MAX_FRACTION,
+        burst: float = HEDGE_BURST,
+        min_delay_ms: float = HEDGE_MIN_DELAY_MS,
+        max_failovers: int = MAX_FAILOVERS,
+    ) -> None:
+        self.enabled = enabled
+        self.max_fraction = max_fraction
+        self.burst = burst
+        self.min_delay_ms = min_delay_ms
+        self.max_failovers = max_failovers
+        self._credit = burst
+        self._stats = {
+            "dispatches": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failovers": 0,
+            "cancelled": 0,
+        }
+
+    def hedge_delay_ms(self, model: prisma.models.AIModel) -> float:
+        p95 = project.model_estimates.get_estimator().latency_p95(model.name)
+        if p95 is None:
+            p95 = model.averageLatency * HEDGE_DEFAULT_LATENCY_MULTIPLIER
+        return max(p95, self.min_delay_ms)
+
+    def _may_hedge(self) -> bool:
+        if not self.enabled or self._credit < 1.0:
+            return False
+        if project.budget_governor.state() != "normal":
+            return False
+        self._credit -= 1.0
+        return True
+
+    async def _call(
+        self, ranked: project.routing_engine.RankedModel, query_text: str
+    ) -> project.model_providers.ProviderResult:
+        with project.budget_governor.reserve(ranked.expected_cost):
+            return await project.model_providers.dispatch(ranked.model, query_text)
+
+    async def dispatch(
+        self, decision: project.routing_engine.RoutingDecision, query_text: str
+    ) -> DispatchOutcome:
+        """
+        Answers a query with the models of a routing decision, hedging and failing over as needed.
+
+        Args:
+            decision (project.routing_engine.RoutingDecision): The ranked models for the query.
+            query_text (str): The text of the query.
+
+        Returns:
+            DispatchOutcome: The first answer to arrive and the model that gave it.
+
+        Raises:
+            project.model_providers.ProviderError: If every model tried failed, or every circuit is open.
+        """
+        pool = project.model_providers.get_pool()
+        candidates = [
+            ranked for ranked in decision.ranked if pool.available(ranked.model)
+        ]
+        if not candidates:
+            raise project.model_providers.CircuitOpenError(
+                "Every eligible model's circuit is open"
+            )
+        self._stats["dispatches"] += 1
+        self._credit = min(self._credit + self.max_fraction, self.burst)
+        primary, backups = candidates[0], candidates[1 : self.max_failovers + 1]
+        tasks: Dict[asyncio.Task, project.routing_engine.RankedModel] = {
+            asyncio.ensure_future(self._call(primary, query_text)): primary
+        }
+        hedged = failed_over = False
+        errors: List[Exception] = []
+        try:
+            done, _ = await asyncio.wait(
+                tasks, timeout=self.hedge_delay_ms(primary.model) / 1000
+            )
+            if not done and backups and self._may_hedge():
+                backup = backups.pop(0)
+                tasks[asyncio.ensure_future(self._call(backup, query_text))] = backup
+                hedged = True
+                self._stats["hedges"] += 1
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    ranked = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except project.model_providers.ProviderError as e:
+                        errors.append(e)
+                        continue
+                    if hedged and ranked is not primary:
+                        self._stats["hedge_wins"] += 1
+                    return DispatchOutcome(ranked.model, result, hedged, failed_over)
+                if not tasks and backups:
+                    backup = backups.pop(0)
+                    tasks[
+                        asyncio.ensure_future(self._call(backup, query_text))
+                    ] = backup
+                    failed_over = True
+                    self._stats["failovers"] += 1
+        finally:
+            # The losing requests were already sent upstream, so they are billed though their
+            # answers are dropped: at their metered cost if they answered too, else as expected.
+            for task, ranked in tasks.items():
+                if task.done():
+                    if task.cancelled() or task.exception() is not None:
+                        continue
+                    cost = task.result().cost
+                else:
+                    task.cancel()
+                    cost = ranked.expected_cost
+                    self._stats["cancelled"] += 1
+                project.financial_ledger.record_overhead_cost(ranked.model.name, cost)
+        raise project.model_providers.ProviderError(
+            f"Every model tried failed: {errors[-1]}"
+        ) from errors[-1]
+
+    def stats(self) -> HedgingStats:
+        return HedgingStats(
+            enabled=self.enabled,
+            hedge_credit=self._credit,
+            open_circuits=project.model_providers.get_pool().open_circuits(),
+            **self._stats,
+        )
+
+
+_dispatcher = HedgedDispatcher()
+
+
+async def dispatch(
+    decision: project.routing_engine.RoutingDecision, query_text: str
+) -> DispatchOutcome:
+    """
+    Answers a query with the process-wide hedged dispatcher.
+
+    Args:
+        decision (project.routing_engine.RoutingDecision): The ranked models for the query.
+        query_text (str): The text of the query.
+
+    Returns:
+        DispatchOutcome: The first answer to arrive and the model that gave it.
+    """
+    return await _dispatcher.dispatch(decision, query_text)
+
+
+def get_stats() -> HedgingStats:
+    """
+    Returns hedging and failover counters and the models whose circuits are open.
+    """
+    return _dispatcher.stats()
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.api_keys
+from pydantic import BaseModel
+
+DEFAULT_VALID_DAYS = 90
+
+
+class IssueApiKeyResponse(BaseModel):
+    """
+    A newly issued API key. The key itself is only ever shown in this response.
+    """
+
+    keyId: str
+    apiKey: str
+    validUntil: datetime
+
+
+class RevokeApiKeyResponse(BaseModel):
+    """
+    The outcome of revoking an API key.
+    """
+
+    keyId: str
+    revoked: bool
+    message: str
+
+
+def _check_access(principal: project.api_keys.ApiKeyPrincipal, user_id: str) -> None:
+    if principal.user_id != user_id and principal.role != prisma.enums.UserRole.ADMIN:
+        raise PermissionError("Only the key's owner or an admin may manage it.")
+
+
+async def issue_api_key(
+    userId: str,
+    validDays: int,
+    principal: project.api_keys.ApiKeyPrincipal,
+) -> IssueApiKeyResponse:
+    """
+    Issues a new API key for a user. Only a digest of the key is stored.
+
+    Keys can only be issued with another key. The first one, for an admin, is issued offline:
+
+        poetry run python -m project.manage_api_keys_service <admin user ID>
+
+    Args:
+        userId (str): The user the key will authenticate as.
+        validDays (int): How many days the key stays valid.
+        principal (project.api_keys.ApiKeyPrincipal): Who is asking.
+
+    Returns:
+        IssueApiKeyResponse: The key, its ID and its expiry.
+
+    Raises:
+        PermissionError: If the caller is neither the user nor an admin.
+        ValueError: If validDays is not positive.
+    """
+    _check_access(principal, userId)
+    return await _create_api_key(userId, validDays)
+
+
+async def _create_api_key(userId: str, validDays: int) -> IssueApiKeyResponse:
+    if validDays <= 0:
+        raise ValueError("validDays must be positive.")
+    key = project.api_keys.generate_key()
+    row = await prisma.models.APIKey.prisma().create(
+        data={
+            "key": project.api_keys.hash_key(key),
+            "userId": userId,
+            "validUntil": datetime.now(timezone.utc) + timedelta(days=validDays),
+        }
+    )
+    return IssueApiKeyResponse(keyId=row.id, apiKey=key, validUntil=row.validUntil)
+
+
+async def revoke_api_key(
+    keyId: str, principal: project.api_keys.ApiKeyPrincipal
+) -> RevokeApiKeyResponse:
+    """
+    Revokes an API key. It stops working in this process at once and in others within
+    API_KEY_REVOCATION_SWEEP_SECONDS.
+
+    Args:
+        keyId (str): The ID of the APIKey row.
+        principal (project.api_keys.ApiKeyPrincipal): Who is asking.
+
+    Returns:
+        RevokeApiKeyResponse: Whether the key was found and revoked.
+
+    Raises:
+        PermissionError: If the caller is neither the key's owner nor an admin.
+    """
+    row = await prisma.models.APIKey.prisma().find_unique(where={"id": keyId})
+    if row is None:
+        return RevokeApiKeyResponse(
+            keyId=keyId, revoked=False, message=f"API key {keyId} not found."
+        )
+    _check_access(principal, row.userId)
+    if row.revokedAt is None:
+        await prisma.models.APIKey.prisma().update(
+            where={"id": keyId}, data={"revokedAt": datetime.now(timezone.utc)}
+        )
+    project.api_keys.evict(row.key)
+    return RevokeApiKeyResponse(
+        keyId=keyId, revoked=True, message=f"API key {keyId} revoked."
+    )
+
+
+async def main(user_id: str, valid_days: int) -> IssueApiKeyResponse:
+    """
+    Issues an API key for a user straight from the database, without an authenticated caller.
+
+    This is how the first admin key is issued; later keys can be issued through the API with it.
+    """
+    project.api_keys.check_hash_secret()
+    db = prisma.Prisma(auto_register=True)
+    await db.connect()
+    try:
+        user = await prisma.models.User.prisma().find_unique(where={"id": user_id})
+        if user is None:
+            raise ValueError(f"User {user_id} not found.")
+        return await _create_api_key(user_id, valid_days)
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m project.manage_api_keys_service",
+        description=(
+            "Issue an API key for a user directly in the database, e.g. the first admin key. "
+            "Uses DATABASE_URL and API_KEY_HASH_SECRET."
+        ),
+    )
+    parser.add_argument("user_id", help="The ID of the user the key authenticates as")
+    parser.add_argument("--valid-days", type=int, default=DEFAULT_VALID_DAYS)
+    args = parser.parse_args()
+    issued = asyncio.run(main(args.user_id, args.valid_days))
+    print(f"Key ID:      {issued.keyId}")
+    print(f"Valid until: {issued.validUntil.isoformat()}")
+    print(f"API key:     {issued.apiKey}")
@@ -0,0 +1,236 @@
+import bisect
+import contextvars
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from prisma import Prisma
+from starlette.routing import Match
+
+# Upper bounds in seconds, roughly three per decade from 0.5ms to 30s.
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram in the Prometheus style.
+
+    Observing a value is a binary search over the bucket bounds and two additions, so it is
+    cheap enough to run on every request. Quantiles are estimated by linear interpolation
+    inside the bucket that contains them.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds: Tuple[float, ...] = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, counts: Sequence[int], total: float) -> None:
+        """
+        Adds the bucket counts and sum of another histogram with the same bounds.
+        """
+        for i, bucket_count in enumerate(counts):
+            self.counts[i] += bucket_count
+        self.count += sum(counts)
+        self.sum += total
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile (0 < q <= 1) of the observed values.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+class RequestDatabaseStats:
+    """
+    Database calls made while serving one request.
+    """
+
+    __slots__ = ("calls", "seconds")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+
+
+_current_request_db: contextvars.ContextVar[
+    Optional[RequestDatabaseStats]
+] = contextvars.ContextVar("current_request_db", default=None)
+
+_request_latency: Dict[Tuple[str, str, str], Histogram] = {}
+_request_db_calls: Dict[Tuple[str, str], int] = {}
+_request_db_seconds: Dict[Tuple[str, str], float] = {}
+_db_latency: Dict[str, Histogram] = {}
+
+
+def observe_database_call(operation: str, seconds: float) -> None:
+    """
+    Records one database call against its operation and the request being served, if any.
+    """
+    histogram = _db_latency.get(operation)
+    if histogram is None:
+        histogram = _db_latency[operation] = Histogram()
+    histogram.observe(seconds)
+    stats = _current_request_db.get()
+    if stats is not None:
+        stats.calls += 1
+        stats.seconds += seconds
+
+
+class InstrumentedPrisma(Prisma):
+    """
+    A Prisma client that times every query it sends to the engine.
+
+    All model actions and raw queries go through `_execute`; batched writes via `batch_()`
+    bypass it and are not counted.
+    """
+
+    async def _execute(self, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super()._execute(**kwargs)
+        finally:
+            observe_database_call(
+                str(kwargs.get("method", "unknown")), time.perf_counter() - started
+            )
+
+
+def _route_label(request: Request) -> str:
+    route = request.scope.get("route")
+    if route is None:
+        for candidate in request.app.router.routes:
+            match, _ = candidate.matches(request.scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    # Label by route template rather than raw path to keep series cardinality bounded.
+    return getattr(route, "path", "unmatched")
+
+
+async def observe_request(request: Request, call_next) -> Response:
+    """
+    HTTP middleware body that records request latency and database usage per route and status.
+    """
+    stats = RequestDatabaseStats()
+    token = _current_request_db.set(stats)
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_request_db.reset(token)
+        route = _route_label(request)
+        key = (request.method, route, status)
+        histogram = _request_latency.get(key)
+        if histogram is None:
+            histogram = _request_latency[key] = Histogram()
+        histogram.observe(elapsed)
+        db_key = (request.method, route)
+        _request_db_calls[db_key] = _request_db_calls.get(db_key, 0) + stats.calls
+        _request_db_seconds[db_key] = (
+            _request_db_seconds.get(db_key, 0.0) + stats.seconds
+        )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _format_histogram(
+    lines: List[str], name: str, histogram: Histogram, labels: str
+) -> None:
+    cumulative = 0
+    separator = "," if labels else ""
+    for bound, bucket_count in zip(histogram.bounds, histogram.counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def render_prometheus() -> str:
+    """
+    Renders all recorded metrics in the Prometheus text exposition format.
+    """
+    lines: List[str] = [
+        "# HELP http_request_duration_seconds Time spent serving HTTP requests.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route, status), histogram in sorted(_request_latency.items()):
+        _format_histogram(
+            lines,
+            "http_request_duration_seconds",
+            histogram,
+            _labels(method=method, route=route, status=status),
+        )
+    lines += [
+        "# HELP http_request_db_calls_total Database calls made while serving HTTP requests.",
+        "# TYPE http_request_db_calls_total counter",
+    ]
+    for (method, route), calls in sorted(_request_db_calls.items()):
+        lines.append(
+            f"http_request_db_calls_total{{{_labels(method=method, route=route)}}} {calls}"
+        )
+    lines += [
+        "# HELP http_request_db_seconds_total Time spent in the database while serving HTTP requests.",
+        "# TYPE http_request_db_seconds_total counter",
+    ]
+    for (method, route), seconds in sorted(_request_db_seconds.items()):
+        lines.append(
+            f"http_request_db_seconds_total{{{_labels(method=method, route=route)}}} {seconds}"
+        )
+    lines += [
+        "# HELP db_query_duration_seconds Time spent on database calls by Prisma operation.",
+        "# TYPE db_query_duration_seconds histogram",
+    ]
+    for operation, histogram in sorted(_db_latency.items()):
+        _format_histogram(
+            lines,
+            "db_query_duration_seconds",
+            histogram,
+            _labels(operation=operation),
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+
+
+class ModelCatalogSnapshot:
+    """
+    An immutable, pre-indexed view of the AIModel table as of a single load.
+    """
+
+    def __init__(self, models: List[prisma.models.AIModel], loaded_at: float) -> None:
+        self.loaded_at = loaded_at
+        self.models: Tuple[prisma.models.AIModel, ...] = tuple(models)
+        self.by_name: Dict[str, prisma.models.AIModel] = {
+            model.name: model for model in self.models
+        }
+        by_type: Dict[
+            prisma.enums.ModelType, List[prisma.models.AIModel]
+        ] = defaultdict(list)
+        for model in self.models:
+            by_type[model.modelType].append(model)
+        self.by_type: Dict[
+            prisma.enums.ModelType, Tuple[prisma.models.AIModel, ...]
+        ] = {
+            model_type: tuple(sorted(members, key=lambda x: x.costPerQuery))
+            for model_type, members in by_type.items()
+        }
+        self.by_cost: Tuple[prisma.models.AIModel, ...] = tuple(
+            sorted(self.models, key=lambda x: (x.costPerQuery, x.averageLatency))
+        )
+        self.by_latency: Tuple[prisma.models.AIModel, ...] = tuple(
+            sorted(self.models, key=lambda x: (x.averageLatency, x.costPerQuery))
+        )
+
+    def get(self, name: str) -> Optional[prisma.models.AIModel]:
+        """
+        Looks up a model by its name.
+
+        Args:
+            name (str): The name of the AI model.
+
+        Returns:
+            Optional[prisma.models.AIModel]: The model, or None if it is not in the catalog.
+        """
+        return self.by_name.get(name)
+
+    def cheapest(
+        self, names: Optional[List[str]] = None
+    ) -> Optional[prisma.models.AIModel]:
+        """
+        Returns the cheapest model, optionally restricted to a set of model names.
+
+        Args:
+            names (Optional[List[str]]): Model names to restrict the search to. An empty list or None means all models.
+
+        Returns:
+            Optional[prisma.models.AIModel]: The cheapest matching model, or None if nothing matches.
+        """
+        if not names:
+            return self.by_cost[0] if self.by_cost else None
+        allowed = set(names)
+        for model in self.by_cost:
+            if model.name in allowed:
+                return model
+        return None
+
+
+class ModelCatalog:
+    """
+    Process-local cache of the AIModel table.
+
+    The table is loaded once and kept as a pre-indexed snapshot. The snapshot is
+    reloaded when it is older than `ttl_seconds` or after `invalidate()` has been
+    called, e.g. because an admin changed a model. Concurrent callers share a
+    single reload instead of each hitting the database.
+
+    Every `invalidate()` bumps a generation counter, and a snapshot only counts as
+    fresh if no invalidation happened after its load began, so an invalidation that
+    lands while a reload is running is not lost.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[ModelCatalogSnapshot] = None
+        self._generation = 0
+        self._snapshot_generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """
+        Marks the current snapshot as stale so the next lookup reloads it.
+        """
+        self._generation += 1
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._snapshot is not None
+            and self._snapshot_generation == self._generation
+            and time.monotonic() - self._snapshot.loaded_at < self.ttl_seconds
+        )
+
+    async def refresh(self) -> ModelCatalogSnapshot:
+        """
+        Reloads the AIModel table from the database unconditionally.
+
+        Returns:
+            ModelCatalogSnapshot: The newly loaded snapshot.
+        """
+        generation = self._generation
+        ai_models = await prisma.models.AIModel.prisma().find_many()
+        self._snapshot = ModelCatalogSnapshot(ai_models, time.monotonic())
+        # Stays stale if invalidate() was called during the load.
+        self._snapshot_generation = generation
+        return self._snapshot
+
+    async def get_snapshot(self) -> ModelCatalogSnapshot:
+        """
+        Returns the current snapshot, reloading it first if it is stale.
+
+        Returns:
+            ModelCatalogSnapshot: A pre-indexed view of the AIModel table.
+        """
+        if self._is_fresh():
+            return self._snapshot
+        async with self._lock:
+            if self._is_fresh():
+                return self._snapshot
+            return await self.refresh()
+
+
+_catalog = ModelCatalog(
+    ttl_seconds=float(os.getenv("MODEL_CATALOG_TTL_SECONDS", "300"))
+)
+
+
+async def get_snapshot() -> ModelCatalogSnapshot:
+    """
+    Returns the process-wide model catalog snapshot, reloading it if stale.
+
+    Returns:
+        ModelCatalogSnapshot: A pre-indexed view of the AIModel table.
+    """
+    return await _catalog.get_snapshot()
+
+
+async def refresh() -> ModelCatalogSnapshot:
+    """
+    Forces a reload of the process-wide model catalog.
+
+    Returns:
+        ModelCatalogSnapshot: The newly loaded snapshot.
+    """
+    return await _catalog.refresh()
+
+
+def invalidate() -> None:
+    """
+    Marks the process-wide model catalog as stale, e.g. after an admin changed an AIModel row.
+    """
+    _catalog.invalidate()
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import prisma
+import prisma.models
+import project.metrics
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = float(os.getenv("MODEL_ESTIMATE_ALPHA", "0.1"))
+# p95 latency covers between one and two windows of the most recent observations.
+P95_WINDOW_SECONDS = float(os.getenv("MODEL_ESTIMATE_WINDOW_SECONDS", "300"))
+WRITE_BACK_INTERVAL_SECONDS = float(
+    os.getenv("MODEL_ESTIMATE_WRITE_BACK_SECONDS", "60")
+)
+# The same buckets as the request latency histograms, in milliseconds.
+LATENCY_BUCKETS_MS = tuple(bound * 1000 for bound in project.metrics.LATENCY_BUCKETS)
+
+
+class ModelEstimate(BaseModel):
+    """
+    Live estimates of one model's behaviour, from the queries it has answered.
+    """
+
+    name: str
+    samples: int
+    errors: int
+    latency_ms: float
+    latency_p95_ms: float
+    cost: float
+    error_rate: float
+
+
+class ModelStats:
+    """
+    Online estimates for one model: EWMAs of latency, cost and error rate, and a windowed p95.
+
+    The p95 comes from two latency histograms that take turns: observations go into the current
+    one, and every `window` seconds it becomes the previous one and a fresh one starts. Updates
+    are a few arithmetic operations with no awaits, so they need no lock on the event loop.
+    """
+
+    __slots__ = (
+        "samples",
+        "errors",
+        "latency_ms",
+        "cost",
+        "error_rate",
+        "dirty",
+        "_current",
+        "_previous",
+        "_window_started",
+    )
+
+    def __init__(self) -> None:
+        self.samples = 0
+        self.errors = 0
+        self.latency_ms = 0.0
+        self.cost = 0.0
+        self.error_rate = 0.0
+        self.dirty = False
+        self._current = project.metrics.Histogram(LATENCY_BUCKETS_MS)
+        self._previous = project.metrics.Histogram(LATENCY_BUCKETS_MS)
+        self._window_started = time.monotonic()
+
+    def _rotate(self, window: float) -> None:
+        now = time.monotonic()
+        if now - self._window_started >= window:
+            self._previous = self._current
+            self._current = project.metrics.Histogram(LATENCY_BUCKETS_MS)
+            self._window_started = now
+
+    def observe(
+        self, latency_ms: float, cost: float, alpha: float, window: float
+    ) -> None:
+        if self.samples == 0:
+            self.latency_ms = latency_ms
+            self.cost = cost
+        else:
+            self.latency_ms += alpha * (latency_ms - self.latency_ms)
+            self.cost += alpha * (cost - self.cost)
+        self.error_rate -= alpha * self.error_rate
+        self.samples += 1
+        self.dirty = True
+        self._rotate(window)
+        self._current.observe(latency_ms)
+
+    def observe_error(self, alpha: float) -> None:
+        self.errors += 1
+        self.error_rate += alpha * (1.0 - self.error_rate)
+
+    def latency_p95_ms(self) -> float:
+        combined = project.metrics.Histogram(LATENCY_BUCKETS_MS)
+        combined.merge(self._previous.counts, self._previous.sum)
+        combined.merge(self._current.counts, self._current.sum)
+        return combined.quantile(0.95)
+
+
+class ModelEstimator:
+    """
+    Per-model live estimates, fed by every upstream call and written back to AIModel on a timer.
+
+    Routing reads the estimates of models that have answered at least one query, and falls back
+    to the static `averageLatency` and `costPerQuery` columns for the rest. The write-back keeps
+    those columns close to observed behaviour, for other processes and for restarts.
+    """
+
+    def __init__(
+        self,
+        alpha: float = EWMA_ALPHA,
+        window: float = P95_WINDOW_SECONDS,
+    ) -> None:
+        self.alpha = alpha
+        self.window = window
+        self._stats: Dict[str, ModelStats] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _get(self, name: str) -> ModelStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = ModelStats()
+        return stats
+
+    def observe(self, name: str, latency_ms: float, cost: float) -> None:
+        self._get(name).observe(latency_ms, cost, self.alpha, self.window)
+
+    def observe_error(self, name: str) -> None:
+        self._get(name).observe_error(self.alpha)
+
+    def expected_latencies(self) -> Dict[str, float]:
+        return {
+            name: stats.latency_ms
+            for name, stats in self._stats.items()
+            if stats.samples
+        }
+
+    def expected_costs(self) -> Dict[str, float]:
+        return {
+            name: stats.cost for name, stats in self._stats.items() if stats.samples
+        }
+
+    def error_rates(self) -> Dict[str, float]:
+        return {name: stats.error_rate for name, stats in self._stats.items()}
+
+    def latency_p95(self, name: str) -> Optional[float]:
+        stats = self._stats.get(name)
+        return stats.latency_p95_ms() if stats is not None and stats.samples else None
+
+    def snapshot(self) -> List[ModelEstimate]:
+        return [
+            ModelEstimate(
+                name=name,
+                samples=stats.samples,
+                errors=stats.errors,
+                latency_ms=stats.latency_ms,
+                latency_p95_ms=stats.latency_p95_ms(),
+                cost=stats.cost,
+                error_rate=stats.error_rate,
+            )
+            for name, stats in sorted(self._stats.items())
+        ]
+
+    async def write_back(self) -> int:
+        """
+        Stores the latency and cost estimates of every model observed since the last write-back
+        in AIModel, in one batch.
+
+        Returns:
+            int: The number of models updated.
+        """
+        changed = {
+            name: (stats.latency_ms, stats.cost)
+            for name, stats in self._stats.items()
+            if stats.dirty
+        }
+        if not changed:
+            return 0
+        for name in changed:
+            self._stats[name].dirty = False
+        try:
+            async with prisma.get_client().batch_() as batcher:
+                for name, (latency_ms, cost) in changed.items():
+                    batcher.aimodel.update_many(
+                        where={"name": name},
+                        data={"averageLatency": latency_ms, "costPerQuery": cost},
+                    )
+        except Exception:
+            for name in changed:
+                self._stats[name].dirty = True
+            raise
+        return len(changed)
+
+    async def _write_back_forever(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.write_back()
+            except Exception:
+                logger.exception("Failed to write model estimates back")
+
+    async def start(self, interval: float = WRITE_BACK_INTERVAL_SECONDS) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._write_back_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                await self.write_back()
+            except Exception:
+                logger.exception("Failed to write model estimates back")
+
+
+_estimator = ModelEstimator()
+
+
+def get_estimator() -> ModelEstimator:
+    """
+    Returns the process-wide model estimator.
+    """
+    return _estimator
+
+
+def observe(name: str, latency_ms: float, cost: float) -> None:
+    """
+    Records a query a model answered, with its latency in milliseconds and its cost.
+    """
+    _estimator.observe(name, latency_ms, cost)
+
+
+def observe_error(name: str) -> None:
+    """
+    Records a query a model failed to answer.
+    """
+    _estimator.observe_error(name)
+
+
+async def start() -> None:
+    """
+    Starts writing the estimates back to AIModel periodically.
+    """
+    await _estimator.start()
+
+
+async def stop() -> None:
+    """
+    Stops the periodic write-back after a final one.
+    """
+    await _estimator.stop()
+
+
+def get_estimates() -> List[ModelEstimate]:
+    """
+    Returns the live estimates of every model that has been called.
+    """
+    return _estimator.snapshot()
@@ -0,0 +1,494 @@
+import abc
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import prisma
+import prisma.enums
+import prisma.models
+import project.model_estimates
+
+logger = logging.getLogger(__name__)
+
+# "mock" simulates every model locally; "http" calls MODEL_PROVIDER_URL_<MODEL_TYPE>.
+PROVIDER_MODE = os.getenv("MODEL_PROVIDER_MODE", "mock")
+DISPATCH_TIMEOUT_SECONDS = float(os.getenv("MODEL_DISPATCH_TIMEOUT_SECONDS", "60"))
+DISPATCH_RETRIES = int(os.getenv("MODEL_DISPATCH_RETRIES", "2"))
+MAX_CONCURRENCY_PER_MODEL = int(os.getenv("MODEL_MAX_CONCURRENCY", "32"))
+MOCK_FAILURE_RATE = float(os.getenv("MOCK_PROVIDER_FAILURE_RATE", "0"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("MODEL_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("MODEL_CIRCUIT_RESET_SECONDS", "30"))
+
+
+class ProviderError(Exception):
+    """
+    Raised when a model provider fails to answer a query.
+    """
+
+
+class CircuitOpenError(ProviderError):
+    """
+    Raised instead of calling a model whose circuit breaker is open.
+    """
+
+
+@dataclass(frozen=True)
+class ProviderResult:
+    """
+    A model's answer to a query. Latency is in milliseconds, cost in USD.
+    """
+
+    text: str
+    latency_ms: float
+    cost: float
+
+
+@dataclass(frozen=True)
+class StreamChunk:
+    """
+    A piece of a streamed answer. The last chunk of a stream carries the cost in USD.
+    """
+
+    text: str
+    cost: Optional[float] = None
+
+
+class ModelProvider(abc.ABC):
+    """
+    Sends queries to one family of AI models.
+    """
+
+    @abc.abstractmethod
+    async def complete(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> ProviderResult:
+        """
+        Answers a query with the model.
+
+        Raises:
+            ProviderError: If the model fails to answer.
+        """
+
+    async def stream(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        Yields the answer as it is produced. Providers that cannot stream answer in one chunk.
+        """
+        result = await self.complete(model, query_text)
+        yield StreamChunk(text=result.text, cost=result.cost)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MockModelProvider(ModelProvider):
+    """
+    Answers locally, for tests and offline benchmarks.
+
+    Latency is drawn from a log-normal distribution whose mean is the model's
+    `averageLatency` (interpreted as milliseconds). Cost is the model's `costPerQuery`, scaled
+    up for long queries. A share MOCK_PROVIDER_FAILURE_RATE of calls fails.
+
+    Each model's latency and cost are taken from the first AIModel row seen for it, so the
+    simulated behaviour does not drift as live estimates are written back to those columns.
+    """
+
+    def __init__(self, sigma: float = 0.35, failure_rate: float = MOCK_FAILURE_RATE):
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self._profiles: Dict[str, Tuple[float, float]] = {}
+
+    def _profile(self, model: prisma.models.AIModel) -> Tuple[float, float]:
+        profile = self._profiles.get(model.name)
+        if profile is None:
+            profile = self._profiles[model.name] = (
+                model.averageLatency,
+                model.costPerQuery,
+            )
+        return profile
+
+    def _latency_ms(self, model: prisma.models.AIModel) -> float:
+        mean = max(self._profile(model)[0], 0.0)
+        median = mean * math.exp(-self.sigma**2 / 2)
+        return median * math.exp(random.gauss(0.0, self.sigma)) if median else 0.0
+
+    def _cost(self, model: prisma.models.AIModel, query_text: str) -> float:
+        return self._profile(model)[1] * (1.0 + len(query_text) / 4000)
+
+    def _text(self, model: prisma.models.AIModel, query_text: str) -> str:
+        return f"[{model.name}] Simulated response to: {query_text[:200]}"
+
+    async def complete(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> ProviderResult:
+        latency_ms = self._latency_ms(model)
+        await asyncio.sleep(latency_ms / 1000)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ProviderError(f"Simulated failure from {model.name}")
+        return ProviderResult(
+            text=self._text(model, query_text),
+            latency_ms=latency_ms,
+            cost=self._cost(model, query_text),
+        )
+
+    async def stream(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> AsyncIterator[StreamChunk]:
+        # The first token arrives after a fifth of the latency; the rest trickle in evenly.
+        latency_ms = self._latency_ms(model)
+        words = self._text(model, query_text).split(" ")
+        await asyncio.sleep(latency_ms * 0.2 / 1000)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ProviderError(f"Simulated failure from {model.name}")
+        step = latency_ms * 0.8 / 1000 / len(words)
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(step)
+            yield StreamChunk(text=word if i == 0 else " " + word)
+        yield StreamChunk(text="", cost=self._cost(model, query_text))
+
+
+class HttpModelProvider(ModelProvider):
+    """
+    Calls a model family's HTTP endpoint through one pooled, keep-alive client.
+
+    The endpoint receives `{"model": <name>, "prompt": <query text>}` and must answer with
+    `{"response": <text>}` and optionally `"cost"`; without it the model's `costPerQuery` is used.
+    Transport errors and 5xx responses are retried with exponential backoff.
+
+    When streaming, `"stream": true` is added to the request and the endpoint must answer with
+    newline-delimited JSON objects, each holding a `"delta"` of text and optionally `"cost"`.
+    Only the connection is retried; a stream that breaks after its first chunk fails.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        max_connections: int = MAX_CONCURRENCY_PER_MODEL,
+        timeout: float = DISPATCH_TIMEOUT_SECONDS,
+        retries: int = DISPATCH_RETRIES,
+    ) -> None:
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.retries = retries
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60.0,
+            ),
+        )
+
+    async def complete(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> ProviderResult:
+        payload = {"model": model.name, "prompt": query_text}
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                response = await self._client.post("", json=payload)
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    body = response.json()
+                    return ProviderResult(
+                        text=body["response"],
+                        latency_ms=(time.perf_counter() - started) * 1000,
+                        cost=float(body.get("cost", model.costPerQuery)),
+                    )
+                error: Exception = ProviderError(
+                    f"{model.name} returned HTTP {response.status_code}"
+                )
+            except httpx.TransportError as e:
+                error = e
+            except (httpx.HTTPStatusError, KeyError, ValueError) as e:
+                raise ProviderError(f"{model.name} rejected the query: {e}") from e
+            if attempt < self.retries:
+                await asyncio.sleep(0.2 * 2**attempt)
+        raise ProviderError(f"{model.name} failed after retries: {error}") from error
+
+    async def stream(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> AsyncIterator[StreamChunk]:
+        payload = {"model": model.name, "prompt": query_text, "stream": True}
+        cost = model.costPerQuery
+        streamed = False
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._client.stream("POST", "", json=payload) as response:
+                    if response.status_code >= 500:
+                        raise ProviderError(
+                            f"{model.name} returned HTTP {response.status_code}"
+                        )
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        event = json.loads(line)
+                        if "cost" in event:
+                            cost = float(event["cost"])
+                        if event.get("delta"):
+                            streamed = True
+                            yield StreamChunk(text=event["delta"])
+                yield StreamChunk(text="", cost=cost)
+                return
+            except (httpx.TransportError, ProviderError) as e:
+                if streamed:
+                    raise ProviderError(
+                        f"{model.name} broke off its answer: {e}"
+                    ) from e
+                error: Exception = e
+            except (httpx.HTTPStatusError, KeyError, ValueError) as e:
+                raise ProviderError(f"{model.name} rejected the query: {e}") from e
+            if attempt < self.retries:
+                await asyncio.sleep(0.2 * 2**attempt)
+        raise ProviderError(f"{model.name} failed after retries: {error}") from error
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a model after `failure_threshold` consecutive failures.
+
+    Once open, the breaker lets a single trial call through every `reset_seconds`; a success
+    closes it again and a failure keeps it open for another period.
+    """
+
+    __slots__ = ("failure_threshold", "reset_seconds", "failures", "opened_at")
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def blocking(self) -> bool:
+        return (
+            self.opened_at is not None
+            and time.monotonic() - self.opened_at < self.reset_seconds
+        )
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.blocking():
+            return False
+        # Half-open: let this call through and hold everyone else until it reports back.
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class ProviderPool:
+    """
+    Dispatches queries to the provider of each model type, at most `max_concurrency` at a time per type.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[prisma.enums.ModelType, ModelProvider],
+        max_concurrency: int = MAX_CONCURRENCY_PER_MODEL,
+        timeout: float = DISPATCH_TIMEOUT_SECONDS,
+    ) -> None:
+        self.providers = providers
+        self.timeout = timeout
+        self._semaphores = {
+            model_type: asyncio.Semaphore(max_concurrency) for model_type in providers
+        }
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def _breaker(self, model: prisma.models.AIModel) -> CircuitBreaker:
+        breaker = self._breakers.get(model.name)
+        if breaker is None:
+            breaker = self._breakers[model.name] = CircuitBreaker()
+        return breaker
+
+    def available(self, model: prisma.models.AIModel) -> bool:
+        """
+        Returns False while the model's circuit breaker is open.
+        """
+        return model.modelType in self.providers and not self._breaker(model).blocking()
+
+    def open_circuits(self) -> List[str]:
+        return sorted(
+            name for name, breaker in self._breakers.items() if breaker.blocking()
+        )
+
+    def _failed(self, model: prisma.models.AIModel) -> None:
+        self._breaker(model).record_failure()
+        project.model_estimates.observe_error(model.name)
+
+    def _succeeded(
+        self, model: prisma.models.AIModel, latency_ms: float, cost: float
+    ) -> None:
+        self._breaker(model).record_success()
+        project.model_estimates.observe(model.name, latency_ms, cost)
+
+    async def dispatch(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> ProviderResult:
+        """
+        Sends a query to a model and waits for its answer.
+
+        Raises:
+            CircuitOpenError: If the model's circuit breaker is open.
+            ProviderError: If no provider serves the model, or it fails or times out.
+        """
+        provider = self.providers.get(model.modelType)
+        if provider is None:
+            raise ProviderError(f"No provider configured for {model.modelType}")
+        if not self._breaker(model).allow():
+            raise CircuitOpenError(f"Circuit for {model.name} is open")
+        async with self._semaphores[model.modelType]:
+            try:
+                result = await asyncio.wait_for(
+                    provider.complete(model, query_text), self.timeout
+                )
+            except asyncio.TimeoutError as e:
+                self._failed(model)
+                raise ProviderError(f"{model.name} timed out") from e
+            except ProviderError:
+                self._failed(model)
+                raise
+        self._succeeded(model, result.latency_ms, result.cost)
+        return result
+
+    async def stream(
+        self, model: prisma.models.AIModel, query_text: str
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        Streams a model's answer, holding one concurrency slot until the stream ends.
+
+        Raises:
+            CircuitOpenError: If the model's circuit breaker is open.
+            ProviderError: If no provider serves the model, or it fails or goes silent for longer
+                than the dispatch timeout.
+        """
+        provider = self.providers.get(model.modelType)
+        if provider is None:
+            raise ProviderError(f"No provider configured for {model.modelType}")
+        if not self._breaker(model).allow():
+            raise CircuitOpenError(f"Circuit for {model.name} is open")
+        async with self._semaphores[model.modelType]:
+            started = time.perf_counter()
+            chunks = provider.stream(model, query_text)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError as e:
+                        self._failed(model)
+                        raise ProviderError(f"{model.name} timed out") from e
+                    except ProviderError:
+                        self._failed(model)
+                        raise
+                    if chunk.cost is not None:
+                        self._succeeded(
+                            model, (time.perf_counter() - started) * 1000, chunk.cost
+                        )
+                    yield chunk
+            finally:
+                await chunks.aclose()
+
+    async def aclose(self) -> None:
+        for provider in self.providers.values():
+            await provider.aclose()
+
+
+def build_providers() -> Dict[prisma.enums.ModelType, ModelProvider]:
+    """
+    Builds one provider per model type according to MODEL_PROVIDER_MODE.
+    """
+    providers: Dict[prisma.enums.ModelType, ModelProvider] = {}
+    for model_type in prisma.enums.ModelType:
+        if PROVIDER_MODE == "http":
+            url = os.getenv(f"MODEL_PROVIDER_URL_{model_type.value}")
+            if not url:
+                logger.warning("No MODEL_PROVIDER_URL_%s set", model_type.value)
+                continue
+            providers[model_type] = HttpModelProvider(
+                url, os.getenv(f"MODEL_PROVIDER_KEY_{model_type.value}")
+            )
+        else:
+            providers[model_type] = MockModelProvider()
+    return providers
+
+
+_pool: Optional[ProviderPool] = None
+
+
+def get_pool() -> ProviderPool:
+    """
+    Returns the process-wide provider pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProviderPool(build_providers())
+    return _pool
+
+
+async def dispatch(model: prisma.models.AIModel, query_text: str) -> ProviderResult:
+    """
+    Sends a query to a model through the process-wide provider pool.
+
+    Args:
+        model (prisma.models.AIModel): The model to ask.
+        query_text (str): The query text.
+
+    Returns:
+        ProviderResult: The model's answer with its measured latency and cost.
+    """
+    return await get_pool().dispatch(model, query_text)
+
+
+async def stream(
+    model: prisma.models.AIModel, query_text: str
+) -> AsyncIterator[StreamChunk]:
+    """
+    Streams a model's answer through the process-wide provider pool.
+
+    Args:
+        model (prisma.models.AIModel): The model to ask.
+        query_text (str): The query text.
+
+    Returns:
+        AsyncIterator[StreamChunk]: The answer in pieces; the last one carries the cost.
+    """
+    async for chunk in get_pool().stream(model, query_text):
+        yield chunk
+
+
+async def stop() -> None:
+    """
+    Closes the pooled provider clients.
+    """
+    global _pool
+    if _pool is not None:
+        await _pool.aclose()
+        _pool = None
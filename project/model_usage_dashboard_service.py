@@ -0,0 +1,162 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import prisma
+import prisma.models
+import project.metrics
+import project.usage_rollup
+from pydantic import BaseModel
+
+DEFAULT_WINDOW_HOURS = 24 * 7
+MAX_WINDOW_DAYS = 92
+
+
+class HourlyModelUsage(BaseModel):
+    """
+    One model's traffic, spend and latency in one hour.
+    """
+
+    hour: datetime
+    modelName: str
+    queries: int
+    errors: int
+    errorRate: float
+    cost: float
+    avgLatencyMs: float
+    p50LatencyMs: float
+    p95LatencyMs: float
+    p99LatencyMs: float
+
+
+class ModelUsageTotals(BaseModel):
+    """
+    One model's traffic, spend and latency over the whole window.
+    """
+
+    modelName: str
+    queries: int
+    errors: int
+    errorRate: float
+    cost: float
+    avgLatencyMs: float
+    p95LatencyMs: float
+
+
+class ModelUsageDashboardResponse(BaseModel):
+    """
+    Hourly per-model usage series and totals for a time window, read from the hourly rollup.
+    """
+
+    start: datetime
+    end: datetime
+    series: List[HourlyModelUsage]
+    totals: List[ModelUsageTotals]
+
+
+def _histogram() -> project.metrics.Histogram:
+    return project.metrics.Histogram(project.usage_rollup.LATENCY_BUCKETS_MS)
+
+
+@dataclass
+class _Totals:
+    queries: int = 0
+    errors: int = 0
+    cost: float = 0.0
+    latency: project.metrics.Histogram = field(default_factory=_histogram)
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _error_rate(queries: int, errors: int) -> float:
+    return errors / (queries + errors) if queries + errors else 0.0
+
+
+def _average(histogram: project.metrics.Histogram) -> float:
+    return histogram.sum / histogram.count if histogram.count else 0.0
+
+
+async def model_usage_dashboard(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    modelName: Optional[str] = None,
+) -> ModelUsageDashboardResponse:
+    """
+    Returns cost, error and latency time series per model and hour, and totals per model.
+
+    Only the ModelUsageHourly rollup is read, at most one row per model and hour of the
+    window, so the cost does not depend on how many queries the window holds. Hours are
+    truncated to the hour and in UTC; the current hour and the last few are refreshed every
+    USAGE_ROLLUP_INTERVAL_SECONDS.
+
+    Args:
+        start (Optional[datetime]): The first hour to include; defaults to DEFAULT_WINDOW_HOURS
+            before the end.
+        end (Optional[datetime]): Only include hours before this time; defaults to now.
+        modelName (Optional[str]): Only include this model.
+
+    Returns:
+        ModelUsageDashboardResponse: The hourly series, oldest first, and per-model totals.
+
+    Raises:
+        ValueError: If the window is empty or longer than MAX_WINDOW_DAYS.
+    """
+    end = _utc(end) if end is not None else datetime.now(timezone.utc)
+    start = (
+        _utc(start)
+        if start is not None
+        else end - timedelta(hours=DEFAULT_WINDOW_HOURS)
+    )
+    if start >= end:
+        raise ValueError("The start of the window must be before its end.")
+    if end - start > timedelta(days=MAX_WINDOW_DAYS):
+        raise ValueError(f"The window may span at most {MAX_WINDOW_DAYS} days.")
+    where: Dict[str, object] = {"hour": {"gte": start, "lt": end}}
+    if modelName is not None:
+        where["modelName"] = modelName
+    rows = await prisma.models.ModelUsageHourly.prisma().find_many(
+        where=where, order=[{"hour": "asc"}, {"modelName": "asc"}]
+    )
+    series = []
+    totals: Dict[str, _Totals] = {}
+    for usage in rows:
+        histogram = _histogram()
+        histogram.merge(usage.latencyBuckets, usage.latencySum)
+        series.append(
+            HourlyModelUsage(
+                hour=usage.hour,
+                modelName=usage.modelName,
+                queries=usage.queries,
+                errors=usage.errors,
+                errorRate=_error_rate(usage.queries, usage.errors),
+                cost=usage.cost,
+                avgLatencyMs=_average(histogram),
+                p50LatencyMs=histogram.quantile(0.5),
+                p95LatencyMs=histogram.quantile(0.95),
+                p99LatencyMs=histogram.quantile(0.99),
+            )
+        )
+        total = totals.setdefault(usage.modelName, _Totals())
+        total.queries += usage.queries
+        total.errors += usage.errors
+        total.cost += usage.cost
+        total.latency.merge(usage.latencyBuckets, usage.latencySum)
+    return ModelUsageDashboardResponse(
+        start=start,
+        end=end,
+        series=series,
+        totals=[
+            ModelUsageTotals(
+                modelName=name,
+                queries=total.queries,
+                errors=total.errors,
+                errorRate=_error_rate(total.queries, total.errors),
+                cost=total.cost,
+                avgLatencyMs=_average(total.latency),
+                p95LatencyMs=total.latency.quantile(0.95),
+            )
+            for name, total in sorted(totals.items())
+        ],
+    )
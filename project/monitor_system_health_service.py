@@ -1,7 +1,14 @@
-from typing import List
+from typing import List, Optional
 
+import project.health_sampler
 from pydantic import BaseModel
 
+CPU_ALERT_PERCENTAGE = 85.0
+MEMORY_ALERT_PERCENTAGE = 90.0
+DISK_ALERT_GB = 5.0
+DATABASE_LATENCY_ALERT_MS = 500.0
+WINDOW_SECONDS = 300.0
+
 
 class ServiceHealth(BaseModel):
     """
@@ -11,6 +18,7 @@ class ServiceHealth(BaseModel):
     service_name: str
     status: str
     last_checked: str
+    latency_ms: Optional[float] = None
 
 
 class PerformanceMetrics(BaseModel):
@@ -32,41 +40,75 @@ class SystemHealthResponse(BaseModel):
     services: List[ServiceHealth]
     alerts: List[str]
     performance_metrics: PerformanceMetrics
+    window_averages: Optional[PerformanceMetrics] = None
+    window_seconds: float = 0.0
 
 
 async def monitor_system_health() -> SystemHealthResponse:
     """
     Provides real-time diagnostics and health reports of the system.
 
+    Values come from the background health sampler's ring buffer: the latest sample plus
+    averages over the last WINDOW_SECONDS, so a request does not read /proc or probe the database itself.
+    Disk space is reported in GB.
+
     Returns:
         SystemHealthResponse: This response model provides a comprehensive view of the current system health,
                               encompassing various metrics and statuses to indicate system performance,
                               operational health, and any issues.
     """
+    sampler = project.health_sampler.get_sampler()
+    latest = sampler.latest()
+    if latest is None:
+        latest = await sampler.sample()
+    last_checked = latest.taken_at.isoformat()
     services = [
         ServiceHealth(
             service_name="Database",
-            status="Running",
-            last_checked="2023-09-28T12:00:00Z",
+            status="Running" if latest.database_ok else "Unreachable",
+            last_checked=last_checked,
+            latency_ms=latest.database_latency_ms,
         ),
         ServiceHealth(
             service_name="API Server",
             status="Running",
-            last_checked="2023-09-28T12:00:00Z",
+            last_checked=last_checked,
         ),
     ]
-    alerts = ["CPU usage is high", "Disk space running low"]
-    performance_metrics = PerformanceMetrics(
-        cpu_usage_percentage=75.5,
-        memory_usage_percentage=64.3,
-        disk_space_remaining=120.5,
+    window = sampler.window(WINDOW_SECONDS) or [latest]
+    window_averages = PerformanceMetrics(
+        cpu_usage_percentage=sum(x.cpu_usage_percentage for x in window) / len(window),
+        memory_usage_percentage=sum(x.memory_usage_percentage for x in window)
+        / len(window),
+        disk_space_remaining=sum(x.disk_space_remaining for x in window) / len(window),
     )
-    overall_status = (
-        "Warning" if any((alert.startswith("CPU") for alert in alerts)) else "OK"
+    alerts = []
+    if not latest.database_ok:
+        alerts.append(f"Database is unreachable: {latest.database_error}")
+    elif latest.database_latency_ms > DATABASE_LATENCY_ALERT_MS:
+        alerts.append("Database latency is high")
+    if window_averages.cpu_usage_percentage > CPU_ALERT_PERCENTAGE:
+        alerts.append("CPU usage is high")
+    if window_averages.memory_usage_percentage > MEMORY_ALERT_PERCENTAGE:
+        alerts.append("Memory usage is high")
+    if latest.disk_space_remaining < DISK_ALERT_GB:
+        alerts.append("Disk space running low")
+    performance_metrics = PerformanceMetrics(
+        cpu_usage_percentage=latest.cpu_usage_percentage,
+        memory_usage_percentage=latest.memory_usage_percentage,
+        disk_space_remaining=latest.disk_space_remaining,
     )
+    if not latest.database_ok:
+        overall_status = "Critical"
+    elif alerts:
+        overall_status = "Warning"
+    else:
+        overall_status = "OK"
     return SystemHealthResponse(
         overall_status=overall_status,
         services=services,
         alerts=alerts,
         performance_metrics=performance_metrics,
+        window_averages=window_averages,
+        window_seconds=WINDOW_SECONDS,
     )
@@ -1,8 +1,23 @@
 import asyncio
-from typing import Optional
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
 
-import prisma
-import prisma.models
+import prisma.enums
+import project.analyze_query_complexity_service
+import project.budget_governor
+import project.financial_ledger
+import project.hedged_dispatch
+import project.model_providers
+import project.query_results
+import project.query_writer
+import project.rate_limits
+import project.response_cache
+import project.routing_engine
+import project.semantic_cache
+import project.single_flight
+import project.user_plans
 from pydantic import BaseModel
 
 
@@ -15,6 +30,46 @@ class ProcessQueryResponse(BaseModel):
     routedToModel: str
     processingTimeMs: float
     status: str
+    response: Optional[str] = None
+    cost: float = 0.0
+    cacheHit: bool = False
+    coalesced: bool = False
+    hedged: bool = False
+
+
+@dataclass
+class _RoutedQuery:
+    """
+    A query that has been scored and routed, and answered already if it was a cache hit.
+    """
+
+    complexity_score: float
+    chosen_model: str
+    decision: Optional[project.routing_engine.RoutingDecision]
+    cached_response: Optional[str]
+    cached_latency_ms: float = 0.0
+    query_id: str = ""
+
+    def fields(self) -> dict:
+        """
+        Returns the Query fields known after routing.
+        """
+        fields = {
+            "complexityScore": self.complexity_score,
+            "routedToModel": self.chosen_model,
+            "status": prisma.enums.QueryStatus.PROCESSING,
+            # Lets project.query_workers fail the row if this process dies before answering.
+            "processingStartedAt": datetime.now(timezone.utc),
+        }
+        if self.cached_response is not None:
+            fields["response"] = self.cached_response
+            fields["cost"] = 0.0
+            fields["latency"] = self.cached_latency_ms
+            fields["status"] = prisma.enums.QueryStatus.COMPLETED
+        return fields
+
+
+_dispatch_flights = project.single_flight.SingleFlight()
 
 
 async def process_query(
@@ -25,8 +80,13 @@ async def process_query(
 
     The method involves:
     - Estimating the complexity of the query text.
+    - Reusing the response of a semantically similar past query, if the semantic cache is enabled.
     - Selecting the most suitable AI model based on the estimated complexity.
+    - Reusing a cached response if the same query was already answered by that model.
     - Logging the query details in the database.
+    - Otherwise dispatching the query to the selected model and storing its response, latency and cost.
+      Identical queries that are already in flight to the same model share that one dispatch, and
+      a slow or failing model is hedged or failed over to the next-ranked one.
     - Returning details about the query processing within a response model.
 
     Args:
@@ -38,32 +98,314 @@ async def process_query(
         ProcessQueryResponse: The response model providing feedback on the processing of the query, including its allocation details and any initial latency metrics captured.
     """
     start_time = asyncio.get_event_loop().time()
-    complexity_score = await _evaluate_query_complexity(queryText)
-    chosen_model = await _select_model_for_query(complexity_score)
-    query = await prisma.models.Query.prisma().create(
-        data={
-            "queryText": queryText,
-            "complexityScore": complexity_score,
-            "routedToModel": chosen_model,
-            "userId": userId,
-        }
-    )
+    routed = await _route_and_log(queryText, userId, start_time)
+    return await _answer(queryText, routed, start_time)
+
+
+async def process_submitted_query(
+    queryId: str, queryText: str, priority: int = 0
+) -> ProcessQueryResponse:
+    """
+    Processes a query that was stored by `submit_query` and is waiting for an answer.
+
+    Runs the same scoring, routing, caching and dispatch as `process_query`, but updates the
+    existing Query row instead of logging a new one. Used by the background query workers.
+
+    Args:
+        queryId (str): The ID of the stored Query row.
+        queryText (str): The text of the query.
+        priority (int): The scheduling priority of the query, checked by the budget governor.
+
+    Returns:
+        ProcessQueryResponse: The outcome of processing the query.
+    """
+    start_time = asyncio.get_event_loop().time()
+    routed = await _route(queryText, start_time, priority)
+    routed.query_id = queryId
+    await project.query_results.update_query(queryId, routed.fields())
+    return await _answer(queryText, routed, start_time)
+
+
+async def _answer(
+    query_text: str, routed: _RoutedQuery, start_time: float
+) -> ProcessQueryResponse:
+    """
+    Dispatches a routed and logged query unless it was a cache hit, and stores the answer.
+
+    Args:
+        query_text (str): The text of the query.
+        routed (_RoutedQuery): The routed query, with the ID of its Query row.
+        start_time (float): Event-loop time at which processing started.
+
+    Returns:
+        ProcessQueryResponse: The outcome of processing the query.
+    """
+    response = routed.cached_response
+    cost = 0.0
+    coalesced = False
+    hedged = False
+    if routed.cached_response is not None:
+        project.financial_ledger.record_query_cost(routed.chosen_model, 0.0)
+    else:
+        try:
+            outcome, coalesced = await _dispatch_flights.do(
+                (
+                    project.response_cache.normalize_query_text(query_text),
+                    routed.chosen_model,
+                ),
+                lambda: _dispatch_and_charge(
+                    routed.decision, query_text, routed.query_id
+                ),
+            )
+        except Exception as e:
+            await project.query_results.update_query(
+                routed.query_id,
+                {"status": prisma.enums.QueryStatus.FAILED, "error": str(e)},
+            )
+            raise
+        result = outcome.result
+        routed.chosen_model = outcome.model.name
+        hedged = outcome.hedged
+        if coalesced or outcome.hedged or outcome.failed_over:
+            # The caller waited longer than the winning call took, and only the request that
+            # started the flight pays for the upstream calls; _dispatch_and_charge charged them.
+            result = project.model_providers.ProviderResult(
+                text=result.text,
+                latency_ms=(asyncio.get_event_loop().time() - start_time) * 1000,
+                cost=0.0 if coalesced else result.cost,
+            )
+        await project.query_results.record_result(
+            routed.query_id,
+            query_text,
+            routed.chosen_model,
+            result,
+            cost_recorded=not coalesced,
+        )
+        response = result.text
+        cost = result.cost
     end_time = asyncio.get_event_loop().time()
     processing_time_ms = (end_time - start_time) * 1000
     return ProcessQueryResponse(
-        queryId=query.id,
-        routedToModel=chosen_model,
+        queryId=routed.query_id,
+        routedToModel=routed.chosen_model,
         processingTimeMs=processing_time_ms,
         status="processed",
+        response=response,
+        cost=cost,
+        cacheHit=routed.cached_response is not None,
+        coalesced=coalesced,
+        hedged=hedged,
     )
 
 
+async def process_query_stream(
+    queryText: str, userId: str, sessionId: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Processes a user query like `process_query`, but streams the model's answer as server-sent events.
+
+    Scoring, routing and logging happen before this returns, so their errors can still be reported
+    as an ordinary error response. The returned stream then emits:
+    - `meta`: the query ID and chosen model, as soon as they are known.
+    - `delta`: each piece of the answer as the model produces it (`{"text": ...}`).
+    - `done`: the same fields as `ProcessQueryResponse`, without the response text, plus the
+      time to the first piece in milliseconds.
+    - `error`: if the model fails mid-answer.
+
+    The full response, latency and cost are saved to the Query row when the stream ends. Streamed
+    queries are not coalesced with identical in-flight queries. A client that disconnects aborts
+    the upstream call; the Query row is marked failed with the partial response, and the cost
+    is still charged to the budget.
+
+    Args:
+        queryText (str): The textual content of the user's query to be processed.
+        userId (str): The unique identifier of the user submitting the query.
+        sessionId (Optional[str]): Optional session identifier to link queries under a single session.
+
+    Returns:
+        AsyncIterator[str]: The server-sent events, each already formatted for the wire.
+    """
+    start_time = asyncio.get_event_loop().time()
+    routed = await _route_and_log(queryText, userId, start_time)
+    return _stream_events(queryText, routed, start_time)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_events(
+    query_text: str, routed: _RoutedQuery, start_time: float
+) -> AsyncIterator[str]:
+    loop = asyncio.get_event_loop()
+    try:
+        yield _sse(
+            "meta",
+            {
+                "queryId": routed.query_id,
+                "routedToModel": routed.chosen_model,
+                "cacheHit": routed.cached_response is not None,
+            },
+        )
+    except (GeneratorExit, asyncio.CancelledError):
+        if routed.cached_response is None:
+            # Gone before the model was called; nothing was spent.
+            await _record_abandoned_stream(
+                routed, "", (loop.time() - start_time) * 1000, 0.0
+            )
+        raise
+    cost = 0.0
+    first_chunk_ms = None
+    if routed.cached_response is not None:
+        project.financial_ledger.record_query_cost(routed.chosen_model, 0.0)
+        first_chunk_ms = (loop.time() - start_time) * 1000
+        yield _sse("delta", {"text": routed.cached_response})
+    else:
+        parts = []
+        cost_reported = False
+        with project.budget_governor.reserve(routed.decision.primary.expected_cost):
+            try:
+                async for chunk in project.model_providers.stream(
+                    routed.decision.primary.model, query_text
+                ):
+                    if chunk.cost is not None:
+                        cost = chunk.cost
+                        cost_reported = True
+                    if chunk.text:
+                        if first_chunk_ms is None:
+                            first_chunk_ms = (loop.time() - start_time) * 1000
+                        parts.append(chunk.text)
+                        yield _sse("delta", {"text": chunk.text})
+            except project.model_providers.ProviderError as e:
+                await project.query_results.update_query(
+                    routed.query_id,
+                    {"status": prisma.enums.QueryStatus.FAILED, "error": str(e)},
+                )
+                yield _sse("error", {"queryId": routed.query_id, "error": str(e)})
+                return
+            except (GeneratorExit, asyncio.CancelledError):
+                # The client went away mid-answer. The upstream call is billed anyway; it only
+                # reports its cost at the end, so charge the expected cost unless it did.
+                if not cost_reported:
+                    cost = routed.decision.primary.expected_cost
+                await _record_abandoned_stream(
+                    routed, "".join(parts), (loop.time() - start_time) * 1000, cost
+                )
+                raise
+            await project.query_results.record_result(
+                routed.query_id,
+                query_text,
+                routed.chosen_model,
+                project.model_providers.ProviderResult(
+                    text="".join(parts),
+                    latency_ms=(loop.time() - start_time) * 1000,
+                    cost=cost,
+                ),
+            )
+    yield _sse(
+        "done",
+        {
+            "queryId": routed.query_id,
+            "routedToModel": routed.chosen_model,
+            "processingTimeMs": (loop.time() - start_time) * 1000,
+            "timeToFirstChunkMs": first_chunk_ms,
+            "status": "processed",
+            "cost": cost,
+            "cacheHit": routed.cached_response is not None,
+        },
+    )
+
+
+async def _record_abandoned_stream(
+    routed: _RoutedQuery, partial_text: str, latency_ms: float, cost: float
+) -> None:
+    """
+    Marks a streamed query whose client disconnected as failed, keeping the partial answer, and
+    charges its cost to the ledger.
+    """
+    project.financial_ledger.record_query_cost(
+        routed.chosen_model, cost, routed.query_id
+    )
+    await project.query_results.update_query(
+        routed.query_id,
+        {
+            "status": prisma.enums.QueryStatus.FAILED,
+            "error": "Client disconnected before the answer was complete",
+            "response": partial_text or None,
+            "latency": latency_ms,
+            "cost": cost,
+        },
+    )
+    if project.query_writer.get_pending(routed.query_id) is None:
+        project.financial_ledger.cost_persisted(routed.query_id)
+
+
+async def _route(query_text: str, start_time: float, priority: int) -> _RoutedQuery:
+    """
+    Scores and routes a query, and looks it up in the semantic and exact-match caches.
+
+    Semantic cache hits cost nothing and skip the budget governor's admission check.
+
+    Args:
+        query_text (str): The text of the query.
+        start_time (float): Event-loop time at which processing started, for cache-hit latency.
+        priority (int): The scheduling priority of the query, checked by the budget governor.
+
+    Returns:
+        _RoutedQuery: The chosen model and any cached response.
+    """
+    complexity_score = await _evaluate_query_complexity(query_text)
+    semantic_match = None
+    decision = None
+    if project.semantic_cache.SEMANTIC_CACHE_ENABLED:
+        semantic_match = await project.semantic_cache.lookup(query_text)
+    if semantic_match is not None:
+        chosen_model = semantic_match.routed_to_model
+        cached_response = semantic_match.response
+    else:
+        decision = await _select_model_for_query(complexity_score, priority)
+        chosen_model = decision.primary.model.name
+        cached_response = await project.response_cache.lookup(query_text, chosen_model)
+    return _RoutedQuery(
+        complexity_score=complexity_score,
+        chosen_model=chosen_model,
+        decision=decision,
+        cached_response=cached_response,
+        cached_latency_ms=(asyncio.get_event_loop().time() - start_time) * 1000,
+    )
+
+
+async def _route_and_log(
+    query_text: str, user_id: str, start_time: float
+) -> _RoutedQuery:
+    """
+    Routes a query with the priority of its user's plan and logs it in the database.
+
+    Args:
+        query_text (str): The text of the query.
+        user_id (str): The ID of the user submitting the query.
+        start_time (float): Event-loop time at which processing started.
+
+    Returns:
+        _RoutedQuery: The routed query with the ID of its new Query row.
+
+    Raises:
+        project.rate_limits.RateLimitExceededError: If the user or their plan is over its rate limit.
+    """
+    await project.rate_limits.acquire(user_id)
+    priority = await project.user_plans.get_priority(user_id)
+    routed = await _route(query_text, start_time, priority)
+    routed.query_id = await project.query_writer.create_query(
+        {"queryText": query_text, "userId": user_id, **routed.fields()}
+    )
+    return routed
+
+
 async def _evaluate_query_complexity(query_text: str) -> float:
     """
     Evaluates the complexity of the given query text.
 
-    This stub implementation simulates the evaluation by returning a fixed complexity score.
-    In a production scenario, this could involve NLP analysis or other heuristics.
+    Uses the same feature-based scorer as the /query/analyze endpoints.
 
     Args:
         query_text (str): The text of the query to be analyzed.
@@ -71,20 +413,61 @@ async def _evaluate_query_complexity(query_text: str) -> float:
     Returns:
         float: A numeric score representing the estimated complexity of the query.
     """
-    return 0.5
+    return project.analyze_query_complexity_service.calculate_complexity_score(
+        query_text
+    )
 
 
-async def _select_model_for_query(complexity_score: float) -> str:
+async def _select_model_for_query(
+    complexity_score: float, priority: int
+) -> project.routing_engine.RoutingDecision:
     """
     Selects an appropriate AI model based on the analyzed query complexity score.
 
-    This stub implementation simulates model selection by returning a fixed model name.
-    A real implementation would select a model based on factors such as cost, latency, and capability.
+    The decision is delegated to the shared routing engine, which ranks the cached model
+    catalog on cost, latency and capability fit without touching the database.
 
     Args:
         complexity_score (float): The complexity score of the query needing processing.
+        priority (int): The scheduling priority of the query, checked by the budget governor.
+
+    Returns:
+        project.routing_engine.RoutingDecision: The eligible AI models, best suited for handling the query first.
+    """
+    return await project.routing_engine.route_query(complexity_score, priority=priority)
+
+
+async def _dispatch_and_charge(
+    decision: project.routing_engine.RoutingDecision, query_text: str, query_id: str
+) -> project.hedged_dispatch.DispatchOutcome:
+    """
+    Dispatches a query for a flight of identical queries and charges its cost to the ledger once.
+
+    The cost is recorded under the ID of the query that started the flight, from inside the
+    shielded flight, so it is charged even if that caller is cancelled before it gets the answer.
+    """
+    outcome = await _dispatch_query(decision, query_text)
+    project.financial_ledger.record_query_cost(
+        outcome.model.name, outcome.result.cost, query_id
+    )
+    return outcome
+
+
+async def _dispatch_query(
+    decision: project.routing_engine.RoutingDecision, query_text: str
+) -> project.hedged_dispatch.DispatchOutcome:
+    """
+    Sends the query to the model chosen by the routing decision and waits for its answer.
+
+    A model that is slow to answer is hedged with the next-ranked one, and a failing or
+    circuit-broken model is skipped for the next-ranked one. Expected costs are reserved against
+    the budget while requests are in flight.
+
+    Args:
+        decision (project.routing_engine.RoutingDecision): The routing decision for the query.
+        query_text (str): The text of the query.
 
     Returns:
-        str: The name of the selected AI model best suited for handling the query.
+        project.hedged_dispatch.DispatchOutcome: The first answer with the model that gave it.
     """
-    return "GPT-4 Turbo"
+    return await project.hedged_dispatch.dispatch(decision, query_text)
@@ -0,0 +1,53 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set
+
+
+class CompletionNotifier:
+    """
+    Wakes coroutines waiting for a query to finish, within this process.
+
+    Waiters subscribe before they read the query, so a completion that lands between the read
+    and the wait is not missed. Completions in other processes are not seen; waiters re-read
+    the database now and then to catch those.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    @contextmanager
+    def subscribe(self, query_id: str) -> Iterator[asyncio.Event]:
+        event = asyncio.Event()
+        self._waiters.setdefault(query_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(query_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[query_id]
+
+    def notify(self, query_id: str) -> None:
+        for event in self._waiters.get(query_id, ()):
+            event.set()
+
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+
+_notifier = CompletionNotifier()
+
+
+def subscribe(query_id: str):
+    """
+    Returns a context manager yielding an event that is set whenever the query completes or fails.
+    """
+    return _notifier.subscribe(query_id)
+
+
+def notify(query_id: str) -> None:
+    """
+    Wakes everything waiting for the query.
+    """
+    _notifier.notify(query_id)
@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.view_feedback_service
+from pydantic import BaseModel
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_WINDOW_DAYS = 30
+
+
+class QueryHistoryItem(BaseModel):
+    """
+    One past query and how it was answered.
+    """
+
+    id: str
+    createdAt: datetime
+    queryText: str
+    userId: str
+    routedToModel: Optional[str] = None
+    status: Optional[prisma.enums.QueryStatus] = None
+    complexityScore: Optional[float] = None
+    latency: Optional[float] = None
+    cost: Optional[float] = None
+
+
+class QueryHistoryResponse(BaseModel):
+    """
+    One page of query history within a time window, newest first.
+    """
+
+    queries: List[QueryHistoryItem]
+    start: datetime
+    end: datetime
+    nextCursor: Optional[str] = None
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _window(
+    start: Optional[datetime], end: Optional[datetime]
+) -> Tuple[datetime, datetime]:
+    end = _utc(end) if end is not None else datetime.now(timezone.utc)
+    start = (
+        _utc(start) if start is not None else end - timedelta(days=DEFAULT_WINDOW_DAYS)
+    )
+    if start >= end:
+        raise ValueError("The start of the window must be before its end.")
+    return start, end
+
+
+def _to_item(query: prisma.models.Query) -> QueryHistoryItem:
+    return QueryHistoryItem(
+        id=query.id,
+        createdAt=query.createdAt,
+        queryText=query.queryText,
+        userId=query.userId,
+        routedToModel=query.routedToModel,
+        status=query.status,
+        complexityScore=query.complexityScore,
+        latency=query.latency,
+        cost=query.cost,
+    )
+
+
+async def _history(
+    where: dict,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    limit: int,
+    cursor: Optional[str],
+) -> QueryHistoryResponse:
+    start, end = _window(start, end)
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    conditions = [where, {"createdAt": {"gte": start, "lt": end}}]
+    if cursor:
+        created_at, query_id = project.view_feedback_service.decode_cursor(cursor)
+        conditions.append(
+            {
+                "OR": [
+                    {"createdAt": {"lt": created_at}},
+                    {"createdAt": created_at, "id": {"lt": query_id}},
+                ]
+            }
+        )
+    queries = await prisma.models.Query.prisma().find_many(
+        where={"AND": conditions},
+        order=[{"createdAt": "desc"}, {"id": "desc"}],
+        take=limit + 1,
+    )
+    next_cursor = None
+    if len(queries) > limit:
+        queries = queries[:limit]
+        last = queries[-1]
+        next_cursor = project.view_feedback_service.encode_cursor(
+            last.createdAt, last.id
+        )
+    return QueryHistoryResponse(
+        queries=[_to_item(query) for query in queries],
+        start=start,
+        end=end,
+        nextCursor=next_cursor,
+    )
+
+
+async def query_history_by_user(
+    userId: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> QueryHistoryResponse:
+    """
+    Lists the queries a user submitted within a time window, newest first.
+
+    Pages are read with keyset pagination on (createdAt, id) through the
+    (userId, createdAt, id) index, and the window bounds createdAt so that only the monthly
+    partitions it covers are scanned once the table is partitioned.
+
+    Args:
+        userId (str): The user whose queries to list.
+        start (Optional[datetime]): Only include queries created at or after this time;
+            defaults to DEFAULT_WINDOW_DAYS before the end.
+        end (Optional[datetime]): Only include queries created before this time; defaults to now.
+        limit (int): Maximum number of queries to return, at most MAX_PAGE_SIZE.
+        cursor (Optional[str]): The nextCursor of the previous page, or None for the first page.
+
+    Returns:
+        QueryHistoryResponse: One page of the user's queries and a cursor for the next one.
+
+    Raises:
+        ValueError: If the window is empty or the cursor is malformed.
+    """
+    return await _history({"userId": userId}, start, end, limit, cursor)
+
+
+async def query_history_by_model(
+    modelName: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    userId: Optional[str] = None,
+) -> QueryHistoryResponse:
+    """
+    Lists the queries routed to a model within a time window, newest first.
+
+    Pages are read like `query_history_by_user`, through the (routedToModel, createdAt, id)
+    index.
+
+    Args:
+        modelName (str): The name of the AI model, as stored in Query.routedToModel.
+        start (Optional[datetime]): Only include queries created at or after this time;
+            defaults to DEFAULT_WINDOW_DAYS before the end.
+        end (Optional[datetime]): Only include queries created before this time; defaults to now.
+        limit (int): Maximum number of queries to return, at most MAX_PAGE_SIZE.
+        cursor (Optional[str]): The nextCursor of the previous page, or None for the first page.
+        userId (Optional[str]): If given, only this user's queries are listed.
+
+    Returns:
+        QueryHistoryResponse: One page of the model's queries and a cursor for the next one.
+
+    Raises:
+        ValueError: If the window is empty or the cursor is malformed.
+    """
+    where = {"routedToModel": modelName}
+    if userId is not None:
+        where["userId"] = userId
+    return await _history(where, start, end, limit, cursor)
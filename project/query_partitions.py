@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import prisma
+
+logger = logging.getLogger(__name__)
+
+# How many months past the current one always have a Query partition, and how often that is
+# checked. Only applies once sql/partition_query_by_month.sql has partitioned the table.
+MONTHS_AHEAD = int(os.getenv("QUERY_PARTITION_MONTHS_AHEAD", "3"))
+CHECK_INTERVAL_SECONDS = float(os.getenv("QUERY_PARTITION_CHECK_SECONDS", "21600"))
+
+
+async def is_partitioned() -> bool:
+    """
+    Returns whether the Query table has been converted to a partitioned table.
+    """
+    rows = await prisma.get_client().query_raw(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('"Query"')
+        ) AS "partitioned"
+        """
+    )
+    return bool(rows and rows[0]["partitioned"])
+
+
+async def ensure_partitions(months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Creates the monthly Query partitions from the current month to `months_ahead` months on.
+
+    Returns:
+        int: The number of partitions created; 0 if the table is not partitioned.
+    """
+    if not await is_partitioned():
+        return 0
+    rows = await prisma.get_client().query_raw(
+        """
+        SELECT query_ensure_partitions(now() AT TIME ZONE 'UTC', $1::integer) AS "created"
+        """,
+        months_ahead,
+    )
+    created = int(rows[0]["created"]) if rows else 0
+    if created:
+        logger.info("Created %d monthly Query partitions", created)
+    return created
+
+
+class PartitionMaintainer:
+    """
+    Creates upcoming monthly Query partitions at startup and every `interval` seconds.
+
+    Does nothing while the table is not partitioned, so it is safe to run everywhere.
+    """
+
+    def __init__(self, interval: float = CHECK_INTERVAL_SECONDS) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _ensure_forever(self) -> None:
+        while True:
+            try:
+                await ensure_partitions()
+            except Exception:
+                logger.exception("Failed to create upcoming Query partitions")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._ensure_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_maintainer = PartitionMaintainer()
+
+
+async def start() -> None:
+    """
+    Keeps upcoming monthly Query partitions created, if the table is partitioned.
+    """
+    await _maintainer.start()
+
+
+async def stop() -> None:
+    """
+    Stops the partition maintenance task.
+    """
+    await _maintainer.stop()
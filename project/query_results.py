@@ -0,0 +1,69 @@
+from typing import Any, Dict
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.financial_ledger
+import project.model_providers
+import project.query_events
+import project.query_writer
+import project.response_cache
+import project.semantic_cache
+
+
+async def update_query(query_id: str, data: Dict[str, Any]) -> None:
+    """
+    Updates a Query row, or merges the update into it if it is still in the write-behind buffer.
+
+    Anyone waiting for the query is woken when the update completes or fails it.
+
+    Args:
+        query_id (str): The ID of the Query row.
+        data (Dict[str, Any]): The fields to change.
+    """
+    if not project.query_writer.update_pending(query_id, data):
+        await prisma.models.Query.prisma().update(where={"id": query_id}, data=data)
+    if data.get("status") in (
+        prisma.enums.QueryStatus.COMPLETED,
+        prisma.enums.QueryStatus.FAILED,
+    ):
+        project.query_events.notify(query_id)
+
+
+async def record_result(
+    query_id: str,
+    query_text: str,
+    model_name: str,
+    result: project.model_providers.ProviderResult,
+    cost_recorded: bool = False,
+) -> None:
+    """
+    Stores a model's answer on its Query row and feeds it to everything that learns from answers.
+
+    The response, latency and cost are written to the Query row, which is marked completed, or merged
+    into it if the row is still in the write-behind buffer. The cost goes into the financial ledger, and the response into
+    the exact-match and semantic caches.
+
+    Args:
+        query_id (str): The ID of the answered Query row.
+        query_text (str): The query text.
+        model_name (str): The name of the model that answered.
+        result (project.model_providers.ProviderResult): The model's answer.
+        cost_recorded (bool): Whether the cost is already in the ledger under this query's ID.
+    """
+    data = {
+        "routedToModel": model_name,
+        "response": result.text,
+        "latency": result.latency_ms,
+        "cost": result.cost,
+        "status": prisma.enums.QueryStatus.COMPLETED,
+        "queryTextHash": project.response_cache.query_text_hash(query_text),
+    }
+    if not cost_recorded:
+        project.financial_ledger.record_query_cost(model_name, result.cost, query_id)
+    await update_query(query_id, data)
+    if project.query_writer.get_pending(query_id) is None:
+        # Otherwise the ledger hears about it when the write-behind buffer stores the row.
+        project.financial_ledger.cost_persisted(query_id)
+    project.response_cache.remember(query_text, model_name, result.text)
+    await project.semantic_cache.remember(query_id, query_text)
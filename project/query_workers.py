@@ -0,0 +1,485 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.budget_governor
+import project.fair_queue
+import project.process_query_service
+import project.query_results
+import project.user_plans
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# "database" claims QUEUED rows with FOR UPDATE SKIP LOCKED, so any number of processes can
+# share the work; "local" hands submitted queries straight to this process's workers.
+WORKER_MODE = os.getenv("QUERY_WORKER_MODE", "database")
+WORKER_COUNT = int(os.getenv("QUERY_WORKER_COUNT", "4"))
+POLL_INTERVAL_SECONDS = float(os.getenv("QUERY_WORKER_POLL_SECONDS", "1.0"))
+MAX_ATTEMPTS = int(os.getenv("QUERY_WORKER_MAX_ATTEMPTS", "3"))
+# A PROCESSING row whose claim is older than this is assumed abandoned by a dead worker. For
+# queries answered synchronously it is marked FAILED instead, since nobody waits for it anymore.
+CLAIM_TIMEOUT_SECONDS = int(os.getenv("QUERY_WORKER_CLAIM_TIMEOUT_SECONDS", "300"))
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("QUERY_WORKER_DRAIN_SECONDS", "30"))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("QUERY_WORKER_SWEEP_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class QueryJob:
+    """
+    A submitted query waiting for a worker.
+    """
+
+    query_id: str
+    query_text: str
+    user_id: str
+    priority: int = 0
+    attempts: int = 0
+
+
+class WorkerPoolStats(BaseModel):
+    """
+    Throughput and backlog of the background query workers.
+    """
+
+    running: bool
+    mode: str
+    workers: int
+    busy_workers: int
+    queued_jobs: int
+    claimed_jobs: int
+    completed_jobs: int
+    retried_jobs: int
+    failed_jobs: int
+    released_jobs: int
+    deferred_jobs: int
+    abandoned_queries: int
+
+
+class QueryWorkerPool:
+    """
+    Answers submitted queries in the background with a fixed number of worker tasks.
+
+    Workers take jobs from an in-process fair queue with one flow per user, weighted by the
+    share of the user's plan, so a user with a large backlog cannot hold back everyone else.
+    In database mode a claimer fills that queue with QUEUED Query rows in the same fair-share
+    order, claiming only as many as there are idle workers so that other processes get their
+    share; it polls every `poll_interval` seconds or as soon as `notify()` reports a new
+    submission. In local mode `enqueue()` fills the queue directly.
+
+    A failed job goes back to QUEUED until it has been attempted `max_attempts` times, and is
+    then marked FAILED with its error; so is a claim left PROCESSING past the claim timeout by
+    a worker that died. A job the budget governor does not admit goes back to QUEUED without
+    counting as an attempt, and only priorities the governor admits are claimed or, in local
+    mode, taken back from the deferred jobs. On shutdown the pool stops taking new work, gives
+    the workers `drain_timeout` seconds to finish, and returns whatever is left to QUEUED.
+
+    Every `sweep_interval` seconds the claimer also marks FAILED the synchronous and streamed
+    queries that have been PROCESSING for longer than the claim timeout, whose process died or
+    whose client went away before they were answered.
+    """
+
+    def __init__(
+        self,
+        mode: str = WORKER_MODE,
+        workers: int = WORKER_COUNT,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        drain_timeout: float = DRAIN_TIMEOUT_SECONDS,
+        sweep_interval: float = SWEEP_INTERVAL_SECONDS,
+    ) -> None:
+        self.mode = mode
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.drain_timeout = drain_timeout
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._queue = project.fair_queue.FairQueue()
+        self._wakeup = asyncio.Event()
+        self._active: Dict[str, QueryJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._deferred: List[QueryJob] = []
+        self._feeder: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._stats = {
+            "claimed_jobs": 0,
+            "completed_jobs": 0,
+            "retried_jobs": 0,
+            "failed_jobs": 0,
+            "released_jobs": 0,
+            "deferred_jobs": 0,
+            "abandoned_queries": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def _put(self, job: QueryJob) -> None:
+        self._queue.put_nowait(
+            (
+                job.user_id,
+                project.user_plans.share_for_priority(job.priority),
+                job,
+            )
+        )
+
+    def enqueue(self, job: QueryJob) -> bool:
+        """
+        Hands a submitted query to the workers of this process, in local mode.
+
+        Returns:
+            bool: False if the pool is not accepting local jobs; the row then stays QUEUED.
+        """
+        if not self._accepting or self.mode != "local":
+            return False
+        self._put(job)
+        return True
+
+    def notify(self) -> None:
+        """
+        Tells the database claimer that new rows are waiting, so it does not wait for its next poll.
+        """
+        self._wakeup.set()
+
+    async def _claim(self, limit: int, min_priority: int) -> List[QueryJob]:
+        # Claims older than the timeout were abandoned by a dead worker. They are queued again
+        # unless they have used up their attempts, so a query that keeps killing its worker
+        # is failed instead of claimed forever.
+        stale = f"""
+            "status" = 'PROCESSING' AND "submitted"
+            AND "processingStartedAt" < now() - interval '{CLAIM_TIMEOUT_SECONDS} seconds'
+        """
+        self._stats["failed_jobs"] += await prisma.get_client().execute_raw(
+            f"""
+            UPDATE "Query"
+            SET "status" = 'FAILED', "error" = 'Abandoned by its worker on every attempt'
+            WHERE {stale} AND "attempts" >= {int(self.max_attempts)}
+            """
+        )
+        await prisma.get_client().execute_raw(
+            f"""
+            UPDATE "Query" SET "status" = 'QUEUED'
+            WHERE {stale} AND "attempts" < {int(self.max_attempts)}
+            """
+        )
+        claimable = f"""
+            "status" = 'QUEUED' AND "submitted" AND "priority" >= {int(min_priority)}
+        """
+        share = " ".join(
+            f"WHEN {int(priority)} THEN {float(weight)}"
+            for priority, weight in project.user_plans.PRIORITY_SHARE.items()
+        )
+        # The n-th waiting query of a user finishes at virtual time n / share, as in the
+        # in-process fair queue. A user's queries are taken in order, so none past their first
+        # `limit` can make the cut: the users with waiting queries are found by skipping along
+        # the (status, userId, createdAt) index, and only their first `limit` queries each are
+        # numbered, however large the backlog. FOR UPDATE cannot sit next to a window
+        # function, so the claimable conditions are checked again on the locked rows.
+        rows = await prisma.get_client().query_raw(
+            f"""
+            WITH RECURSIVE "waitingUser" AS (
+                (SELECT "userId" FROM "Query" WHERE "status" = 'QUEUED'
+                 ORDER BY "userId" LIMIT 1)
+                UNION ALL
+                SELECT (
+                    SELECT "userId" FROM "Query"
+                    WHERE "status" = 'QUEUED' AND "userId" > "waitingUser"."userId"
+                    ORDER BY "userId" LIMIT 1
+                )
+                FROM "waitingUser" WHERE "waitingUser"."userId" IS NOT NULL
+            )
+            UPDATE "Query"
+            SET "status" = 'PROCESSING', "processingStartedAt" = now(),
+                "attempts" = "attempts" + 1
+            WHERE "id" IN (
+                SELECT "Query"."id" FROM "Query"
+                JOIN (
+                    SELECT "next"."id", row_number() OVER (
+                        PARTITION BY "next"."userId" ORDER BY "next"."createdAt"
+                    ) AS "turn"
+                    FROM "waitingUser"
+                    CROSS JOIN LATERAL (
+                        SELECT "id", "userId", "createdAt" FROM "Query"
+                        WHERE "Query"."userId" = "waitingUser"."userId" AND {claimable}
+                        ORDER BY "createdAt"
+                        LIMIT {int(limit)}
+                    ) AS "next"
+                ) AS "waiting" ON "waiting"."id" = "Query"."id"
+                WHERE {claimable}
+                ORDER BY "waiting"."turn" / (
+                    CASE "Query"."priority" {share} ELSE {float(project.user_plans.NO_PLAN_SHARE)} END
+                ), "Query"."createdAt"
+                LIMIT {int(limit)}
+                FOR UPDATE OF "Query" SKIP LOCKED
+            )
+            RETURNING "id", "queryText", "userId", "priority", "attempts"
+            """
+        )
+        return [
+            QueryJob(
+                row["id"],
+                row["queryText"],
+                row["userId"],
+                row["priority"],
+                row["attempts"],
+            )
+            for row in rows
+        ]
+
+    async def _sweep_abandoned(self) -> None:
+        now = datetime.now(timezone.utc)
+        self._stats[
+            "abandoned_queries"
+        ] += await prisma.models.Query.prisma().update_many(
+            where={
+                "status": prisma.enums.QueryStatus.PROCESSING,
+                "submitted": False,
+                "processingStartedAt": {
+                    "lt": now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)
+                },
+            },
+            data={
+                "status": prisma.enums.QueryStatus.FAILED,
+                "error": "Abandoned while processing",
+            },
+        )
+
+    def _readmit_deferred(self, min_priority: Optional[int]) -> None:
+        if min_priority is None or not self._deferred:
+            return
+        waiting = []
+        for job in self._deferred:
+            if job.priority >= min_priority:
+                self._put(job)
+            else:
+                waiting.append(job)
+        self._deferred = waiting
+
+    async def _feed_forever(self) -> None:
+        while True:
+            self._wakeup.clear()
+            min_priority = project.budget_governor.min_admitted_priority()
+            self._readmit_deferred(min_priority)
+            loop_time = asyncio.get_running_loop().time()
+            if loop_time - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = loop_time
+                try:
+                    await self._sweep_abandoned()
+                except Exception:
+                    logger.exception("Failed to sweep abandoned queries")
+            idle = self.workers - len(self._active) - self._queue.qsize()
+            if self.mode != "local" and idle > 0 and min_priority is not None:
+                try:
+                    jobs = await self._claim(idle, min_priority)
+                except Exception:
+                    logger.exception("Failed to claim queued queries")
+                    jobs = []
+                for job in jobs:
+                    self._put(job)
+                self._stats["claimed_jobs"] += len(jobs)
+                if len(jobs) == idle:
+                    # There may be more waiting; claim again as soon as a worker frees up.
+                    continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _load_queued(self) -> None:
+        rows = await prisma.models.Query.prisma().find_many(
+            where={"status": prisma.enums.QueryStatus.QUEUED, "submitted": True},
+            order={"createdAt": "asc"},
+        )
+        for row in rows:
+            self._put(
+                QueryJob(row.id, row.queryText, row.userId, row.priority, row.attempts)
+            )
+
+    async def _process(self, job: QueryJob) -> None:
+        attempts = job.attempts
+        if self.mode == "local":
+            attempts += 1
+            await project.query_results.update_query(
+                job.query_id,
+                {
+                    "status": prisma.enums.QueryStatus.PROCESSING,
+                    "attempts": attempts,
+                },
+            )
+        try:
+            await project.process_query_service.process_submitted_query(
+                job.query_id, job.query_text, job.priority
+            )
+            self._stats["completed_jobs"] += 1
+            return
+        except project.budget_governor.BudgetExceededError:
+            self._stats["deferred_jobs"] += 1
+            await self._release([job])
+            if self.mode == "local":
+                self._deferred.append(job)
+            return
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning("Query %s failed: %s", job.query_id, error)
+        retry = attempts < self.max_attempts
+        await project.query_results.update_query(
+            job.query_id,
+            {
+                "status": prisma.enums.QueryStatus.QUEUED
+                if retry
+                else prisma.enums.QueryStatus.FAILED,
+                "error": error,
+            },
+        )
+        if not retry:
+            self._stats["failed_jobs"] += 1
+            return
+        self._stats["retried_jobs"] += 1
+        if self.mode == "local":
+            self._put(
+                QueryJob(
+                    job.query_id, job.query_text, job.user_id, job.priority, attempts
+                )
+            )
+        else:
+            self.notify()
+
+    async def _work_forever(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._active[job.query_id] = job
+            try:
+                await self._process(job)
+            except Exception:
+                logger.exception("Query worker failed on %s", job.query_id)
+            finally:
+                self._active.pop(job.query_id, None)
+                self._queue.task_done()
+                self._wakeup.set()
+
+    async def _release(self, jobs: List[QueryJob]) -> None:
+        for job in jobs:
+            try:
+                await project.query_results.update_query(
+                    job.query_id,
+                    {
+                        "status": prisma.enums.QueryStatus.QUEUED,
+                        # A database claim counted an attempt that never ran.
+                        "attempts": max(job.attempts - 1, 0)
+                        if self.mode != "local"
+                        else job.attempts,
+                    },
+                )
+                self._stats["released_jobs"] += 1
+            except Exception:
+                logger.exception("Failed to release claimed query %s", job.query_id)
+
+    def _take_unstarted(self) -> List[QueryJob]:
+        jobs = []
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._queue.task_done()
+            jobs.append(job)
+        return jobs
+
+    async def start(self) -> None:
+        """
+        Starts the workers and the task that feeds them.
+        """
+        if self.running:
+            return
+        if self.mode == "local":
+            await self._load_queued()
+        self._feeder = asyncio.create_task(self._feed_forever())
+        self._accepting = True
+        self._tasks = [
+            asyncio.create_task(self._work_forever()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Stops taking new work, lets the workers finish what they hold, and releases the rest.
+        """
+        if not self.running:
+            return
+        self._accepting = False
+        if self._feeder is not None:
+            self._feeder.cancel()
+            try:
+                await self._feeder
+            except asyncio.CancelledError:
+                pass
+            self._feeder = None
+        # Deferred jobs are already back in QUEUED.
+        self._deferred = []
+        if self.mode != "local":
+            # Claimed jobs are held in memory only; hand back the ones no worker has started.
+            await self._release(self._take_unstarted())
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Query workers did not drain within %ss", self.drain_timeout)
+        interrupted = list(self._active.values())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        unstarted = self._take_unstarted()
+        # Local jobs that never started are still QUEUED in the database and are reloaded on start.
+        await self._release(interrupted + (unstarted if self.mode != "local" else []))
+
+    def stats(self) -> WorkerPoolStats:
+        return WorkerPoolStats(
+            running=self.running,
+            mode=self.mode,
+            workers=self.workers,
+            busy_workers=len(self._active),
+            queued_jobs=self._queue.qsize(),
+            **self._stats,
+        )
+
+
+_pool = QueryWorkerPool()
+
+
+def submitted(query_id: str, query_text: str, user_id: str, priority: int) -> None:
+    """
+    Tells the workers about a newly submitted query.
+
+    Args:
+        query_id (str): The ID of the QUEUED Query row.
+        query_text (str): The text of the query.
+        user_id (str): The user who submitted the query, whose fair share it counts against.
+        priority (int): The scheduling priority of the query.
+    """
+    if not _pool.enqueue(QueryJob(query_id, query_text, user_id, priority)):
+        _pool.notify()
+
+
+async def start() -> None:
+    """
+    Starts the background query workers.
+    """
+    await _pool.start()
+
+
+async def stop() -> None:
+    """
+    Drains and stops the background query workers.
+    """
+    await _pool.stop()
+
+
+def get_stats() -> WorkerPoolStats:
+    """
+    Returns throughput and backlog of the background query workers.
+    """
+    return _pool.stats()
@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("QUERY_WRITE_BEHIND", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+BATCH_SIZE = int(os.getenv("QUERY_WRITE_BEHIND_BATCH_SIZE", "500"))
+FLUSH_INTERVAL_SECONDS = float(os.getenv("QUERY_WRITE_BEHIND_FLUSH_SECONDS", "0.05"))
+MAX_QUEUE_SIZE = int(os.getenv("QUERY_WRITE_BEHIND_MAX_QUEUE", "10000"))
+ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("QUERY_WRITE_BEHIND_ENQUEUE_TIMEOUT", "1.0"))
+FLUSH_RETRIES = 3
+
+FlushListener = Callable[[List[str]], Awaitable[None]]
+
+
+class WriteBehindStats(BaseModel):
+    """
+    Durability metrics of the write-behind Query persistence.
+    """
+
+    enabled: bool
+    queue_depth: int
+    pending_rows: int
+    enqueued_rows: int
+    flushed_rows: int
+    flushed_batches: int
+    direct_writes: int
+    backpressure_waits: int
+    retried_batches: int
+    failed_rows: int
+    last_flush_ms: float
+    oldest_pending_age_ms: float
+
+
+class QueryWriteBehind:
+    """
+    Buffers new Query rows in memory and writes them to the database in batches.
+
+    Rows get their ID and creation time in the application, so callers can respond before the
+    row is stored. A background flusher drains a bounded queue with `create_many` whenever
+    `batch_size` rows are waiting or `flush_interval` has passed since the first one arrived.
+    When the queue is full, producers wait up to `enqueue_timeout` and then write their row
+    directly, so backpressure slows requests down instead of dropping data.
+
+    Rows stay readable through `get_pending()` until they are flushed, and `update_pending()`
+    lets later pipeline stages amend a row that has not reached the database yet.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        max_queue_size: int = MAX_QUEUE_SIZE,
+        enqueue_timeout: float = ENQUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._enqueued_at: Dict[str, float] = {}
+        self._inflight: Set[str] = set()
+        self._deferred_updates: Dict[str, Dict[str, Any]] = {}
+        self._flush_listeners: List[FlushListener] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "enqueued_rows": 0,
+            "flushed_rows": 0,
+            "flushed_batches": 0,
+            "direct_writes": 0,
+            "backpressure_waits": 0,
+            "retried_batches": 0,
+            "failed_rows": 0,
+        }
+        self._last_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def enqueue(self, data: Dict[str, Any]) -> str:
+        """
+        Queues a new Query row for batched insertion.
+
+        Args:
+            data (Dict[str, Any]): The Query fields to store.
+
+        Returns:
+            str: The ID assigned to the row.
+        """
+        row = dict(data)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("createdAt", datetime.now(timezone.utc))
+        query_id = row["id"]
+        if not self.running:
+            await self._write_direct(row)
+            return query_id
+        self._pending[query_id] = row
+        self._enqueued_at[query_id] = time.monotonic()
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self._stats["backpressure_waits"] += 1
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                await self._write_pending_direct(row)
+                return query_id
+        self._stats["enqueued_rows"] += 1
+        return query_id
+
+    def get_pending(self, query_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a queued row that has not been stored yet, including any deferred updates.
+        """
+        row = self._pending.get(query_id)
+        if row is None:
+            return None
+        deferred = self._deferred_updates.get(query_id)
+        return {**row, **deferred} if deferred else dict(row)
+
+    def update_pending(self, query_id: str, data: Dict[str, Any]) -> bool:
+        """
+        Applies an update to a row that has not been stored yet.
+
+        Args:
+            query_id (str): The ID of the row.
+            data (Dict[str, Any]): The fields to change.
+
+        Returns:
+            bool: True if the row was still pending and the update will be stored with or right
+            after it, False if the row is already in the database and the caller must update it there.
+        """
+        if query_id not in self._pending:
+            return False
+        if query_id in self._inflight:
+            self._deferred_updates.setdefault(query_id, {}).update(data)
+        else:
+            self._pending[query_id].update(data)
+        return True
+
+    def add_flush_listener(self, listener: FlushListener) -> None:
+        """
+        Registers a coroutine to be called with the IDs of the rows of every batch that were stored.
+        """
+        self._flush_listeners.append(listener)
+
+    def _forget(self, query_id: str) -> None:
+        self._pending.pop(query_id, None)
+        self._enqueued_at.pop(query_id, None)
+
+    async def _write_direct(self, row: Dict[str, Any]) -> None:
+        self._stats["direct_writes"] += 1
+        await prisma.models.Query.prisma().create(data=row)
+
+    async def _write_pending_direct(self, row: Dict[str, Any]) -> None:
+        # The row stays pending, with updates deferred, until it is in the database, so that an
+        # update made meanwhile is neither lost nor sent to a row that does not exist yet.
+        query_id = row["id"]
+        self._inflight.add(query_id)
+        try:
+            await self._write_direct(row)
+            await self._apply_deferred_updates([query_id])
+        finally:
+            self._inflight.discard(query_id)
+            self._deferred_updates.pop(query_id, None)
+            self._forget(query_id)
+        await self._notify_flushed([query_id])
+
+    async def _notify_flushed(self, ids: List[str]) -> None:
+        for listener in self._flush_listeners:
+            try:
+                await listener(ids)
+            except Exception:
+                logger.exception("Write-behind flush listener failed")
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> int:
+        ids = [row["id"] for row in batch]
+        self._inflight.update(ids)
+        started = time.perf_counter()
+        written: List[str] = []
+        try:
+            for attempt in range(FLUSH_RETRIES):
+                try:
+                    await prisma.models.Query.prisma().create_many(
+                        data=batch, skip_duplicates=True
+                    )
+                    written = ids
+                    break
+                except Exception:
+                    if attempt == FLUSH_RETRIES - 1:
+                        written = await self._flush_rows_individually(batch)
+                        break
+                    self._stats["retried_batches"] += 1
+                    logger.warning("Retrying write-behind flush of %d rows", len(batch))
+                    await asyncio.sleep(0.1 * 2**attempt)
+            self._stats["flushed_batches"] += 1
+            self._last_flush_ms = (time.perf_counter() - started) * 1000
+            # The rows stay pending until their deferred updates are stored, so that a newer
+            # update cannot reach the database first and be overwritten by an older one.
+            await self._apply_deferred_updates(written)
+        finally:
+            self._inflight.difference_update(ids)
+            for query_id in ids:
+                self._deferred_updates.pop(query_id, None)
+                self._forget(query_id)
+        # Only rows that reached the database; listeners treat these as stored.
+        await self._notify_flushed(written)
+        return len(written)
+
+    async def _flush_rows_individually(self, batch: List[Dict[str, Any]]) -> List[str]:
+        written = []
+        for row in batch:
+            try:
+                await prisma.models.Query.prisma().upsert(
+                    where={"id": row["id"]}, data={"create": row, "update": {}}
+                )
+                written.append(row["id"])
+            except Exception:
+                self._stats["failed_rows"] += 1
+                logger.exception("Dropping unwritable Query row %s", row["id"])
+        return written
+
+    async def _apply_deferred_updates(self, ids: List[str]) -> None:
+        # Updates that arrive while others are being applied are deferred again, so repeat
+        # until none are left; the caller then releases the rows without yielding.
+        while True:
+            waiting = [
+                query_id for query_id in ids if query_id in self._deferred_updates
+            ]
+            if not waiting:
+                return
+            for query_id in waiting:
+                data = self._deferred_updates.pop(query_id)
+                try:
+                    await prisma.models.Query.prisma().update(
+                        where={"id": query_id}, data=data
+                    )
+                except Exception:
+                    logger.exception("Failed to apply deferred update to %s", query_id)
+
+    async def _run(self) -> None:
+        while True:
+            first = await self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                self._stats["flushed_rows"] += await self._flush(batch)
+            except Exception:
+                self._stats["failed_rows"] += len(batch)
+                logger.exception("Write-behind flush of %d rows failed", len(batch))
+            for _ in batch:
+                self._queue.task_done()
+
+    async def start(self) -> None:
+        """
+        Starts the background flusher.
+        """
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the background flusher after writing every queued row.
+        """
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> WriteBehindStats:
+        now = time.monotonic()
+        oldest = min(self._enqueued_at.values(), default=now)
+        return WriteBehindStats(
+            enabled=self.running,
+            queue_depth=self._queue.qsize(),
+            pending_rows=len(self._pending),
+            last_flush_ms=self._last_flush_ms,
+            oldest_pending_age_ms=(now - oldest) * 1000,
+            **self._stats,
+        )
+
+
+_writer = QueryWriteBehind()
+
+
+async def create_query(data: Dict[str, Any]) -> str:
+    """
+    Stores a new Query row, through the write-behind buffer when it is enabled.
+
+    Args:
+        data (Dict[str, Any]): The Query fields to store.
+
+    Returns:
+        str: The ID of the new row.
+    """
+    if _writer.running:
+        return await _writer.enqueue(data)
+    query = await prisma.models.Query.prisma().create(data=data)
+    return query.id
+
+
+def get_pending(query_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns a Query row that is still waiting in the write-behind buffer, or None.
+    """
+    return _writer.get_pending(query_id)
+
+
+def update_pending(query_id: str, data: Dict[str, Any]) -> bool:
+    """
+    Applies an update to a Query row that is still waiting in the write-behind buffer.
+
+    Returns:
+        bool: False if the row is not buffered and must be updated in the database instead.
+    """
+    return _writer.update_pending(query_id, data)
+
+
+async def start() -> None:
+    """
+    Starts the write-behind flusher if QUERY_WRITE_BEHIND is enabled.
+    """
+    if WRITE_BEHIND_ENABLED:
+        await _writer.start()
+
+
+async def stop() -> None:
+    """
+    Flushes every buffered Query row and stops the write-behind flusher.
+    """
+    await _writer.stop()
+
+
+def add_flush_listener(listener: FlushListener) -> None:
+    """
+    Registers a coroutine to be called with the IDs of every batch of buffered rows once they are stored.
+    """
+    _writer.add_flush_listener(listener)
+
+
+def get_stats() -> WriteBehindStats:
+    """
+    Returns durability metrics of the write-behind buffer.
+    """
+    return _writer.stats()
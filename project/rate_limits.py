@@ -0,0 +1,379 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.user_plans
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# "memory" keeps buckets in this process; "database" shares them between processes through
+# the RateLimitBucket table, falling back to memory if the database cannot be reached.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+CONFIG_TTL_SECONDS = float(os.getenv("RATE_LIMIT_CONFIG_TTL_SECONDS", "60"))
+# The SystemConfig row whose JSON value overrides the default limits.
+CONFIG_KEY = "rate_limits"
+# Buckets idle for longer than it takes them to refill are dropped past this many.
+MAX_MEMORY_BUCKETS = 100000
+NO_PLAN = "NONE"
+
+
+class RateLimitExceededError(Exception):
+    """
+    Raised when a user or their plan has used up its request allowance for now.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    A token bucket's refill rate, in queries per minute, and its capacity.
+    """
+
+    per_minute: float
+    burst: float
+
+
+class RateLimitStats(BaseModel):
+    """
+    How many requests the rate limits let through or turned away.
+    """
+
+    enabled: bool
+    backend: str
+    allowed: int
+    limited: int
+    buckets: int
+    database_fallbacks: int
+
+
+# Each user of a plan, by plan name; NONE applies to users without an active subscription.
+DEFAULT_USER_LIMITS: Dict[str, RateLimit] = {
+    NO_PLAN: RateLimit(per_minute=10, burst=10),
+    prisma.enums.SubscriptionPlan.BASIC.value: RateLimit(per_minute=30, burst=30),
+    prisma.enums.SubscriptionPlan.PREMIUM.value: RateLimit(per_minute=120, burst=120),
+    prisma.enums.SubscriptionPlan.ENTERPRISE.value: RateLimit(
+        per_minute=600, burst=600
+    ),
+}
+# All users of a plan together, by plan name.
+DEFAULT_PLAN_LIMITS: Dict[str, RateLimit] = {
+    NO_PLAN: RateLimit(per_minute=300, burst=300),
+    prisma.enums.SubscriptionPlan.BASIC.value: RateLimit(per_minute=1200, burst=1200),
+    prisma.enums.SubscriptionPlan.PREMIUM.value: RateLimit(per_minute=3000, burst=3000),
+    prisma.enums.SubscriptionPlan.ENTERPRISE.value: RateLimit(
+        per_minute=6000, burst=6000
+    ),
+}
+
+
+@dataclass(frozen=True)
+class RateLimitConfig:
+    """
+    The limits in force: per user by plan, per plan, and per-user overrides.
+    """
+
+    users: Dict[str, RateLimit]
+    plans: Dict[str, RateLimit]
+    overrides: Dict[str, RateLimit]
+
+    def user_limit(self, user_id: str, plan: str) -> RateLimit:
+        return self.overrides.get(user_id) or self.users.get(plan, self.users[NO_PLAN])
+
+    def plan_limit(self, plan: str) -> Optional[RateLimit]:
+        return self.plans.get(plan)
+
+
+def _parse_limits(raw: Dict[str, dict]) -> Dict[str, RateLimit]:
+    limits = {}
+    for name, limit in raw.items():
+        if "per_minute" not in limit:
+            raise ValueError(f"Rate limit for {name} has no per_minute")
+        per_minute = float(limit["per_minute"])
+        burst = float(limit.get("burst", per_minute))
+        if per_minute <= 0 or burst <= 0:
+            raise ValueError(f"Rate limit for {name} must be positive")
+        limits[name] = RateLimit(per_minute=per_minute, burst=burst)
+    return limits
+
+
+def _seconds_for(limit: RateLimit, tokens: float) -> float:
+    return tokens * 60 / limit.per_minute
+
+
+def parse_config(value: Optional[str]) -> RateLimitConfig:
+    """
+    Builds the limits in force from the JSON value of the `rate_limits` SystemConfig row.
+
+    The value may override any of the defaults, for example:
+
+        {"users": {"BASIC": {"per_minute": 60, "burst": 20}},
+         "plans": {"ENTERPRISE": {"per_minute": 10000}},
+         "overrides": {"<userId>": {"per_minute": 5}}}
+
+    Plan names are those of SubscriptionPlan, or NONE for users without a subscription. A limit
+    without a burst has a burst of one minute's allowance.
+
+    Args:
+        value (Optional[str]): The JSON value, or None if the row does not exist.
+
+    Returns:
+        RateLimitConfig: The defaults with the configured limits applied.
+
+    Raises:
+        ValueError: If the value is not valid JSON or a limit is missing or not positive.
+    """
+    raw = json.loads(value) if value else {}
+    return RateLimitConfig(
+        users={**DEFAULT_USER_LIMITS, **_parse_limits(raw.get("users", {}))},
+        plans={**DEFAULT_PLAN_LIMITS, **_parse_limits(raw.get("plans", {}))},
+        overrides=_parse_limits(raw.get("overrides", {})),
+    )
+
+
+class TokenBucket:
+    """
+    Holds up to `burst` tokens and gains `per_minute / 60` of them a second.
+
+    A request takes as many tokens as it carries queries. A request larger than the burst is let
+    through once the bucket is full and leaves it in debt, so bulk requests are not refused
+    forever but still wait out their size.
+    """
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float) -> None:
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, limit: RateLimit, now: float) -> None:
+        self.tokens = min(
+            limit.burst, self.tokens + (now - self.updated) * limit.per_minute / 60
+        )
+        self.updated = now
+
+    def wait_time(self, limit: RateLimit, cost: float) -> float:
+        """
+        Returns how many seconds until the bucket can pay for `cost` tokens; 0 if it can now.
+        """
+        self._refill(limit, time.monotonic())
+        missing = min(cost, limit.burst) - self.tokens
+        return _seconds_for(limit, missing) if missing > 0 else 0.0
+
+    def take(self, cost: float) -> None:
+        self.tokens -= cost
+
+    def idle(self, limit: RateLimit, now: float) -> bool:
+        return self.tokens + (now - self.updated) * limit.per_minute / 60 >= limit.burst
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limits for each user and for each subscription plan as a whole.
+
+    A request must fit both its user's bucket and the bucket shared by every user of the same
+    plan, and takes tokens from both or from neither. Limits come from the `rate_limits`
+    SystemConfig row on top of built-in defaults, and are re-read every `config_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RATE_LIMITS_ENABLED,
+        backend: str = RATE_LIMIT_BACKEND,
+        config_ttl: float = CONFIG_TTL_SECONDS,
+    ) -> None:
+        self.enabled = enabled
+        self.backend = backend
+        self.config_ttl = config_ttl
+        self._config = parse_config(None)
+        self._config_expires = 0.0
+        self._config_lock = asyncio.Lock()
+        self._buckets: Dict[str, Tuple[TokenBucket, RateLimit]] = {}
+        self._stats = {"allowed": 0, "limited": 0, "database_fallbacks": 0}
+
+    async def config(self) -> RateLimitConfig:
+        if self._config_expires > time.monotonic():
+            return self._config
+        async with self._config_lock:
+            if self._config_expires > time.monotonic():
+                return self._config
+            try:
+                row = await prisma.models.SystemConfig.prisma().find_unique(
+                    where={"key": CONFIG_KEY}
+                )
+                self._config = parse_config(row.value if row is not None else None)
+            except Exception:
+                logger.exception("Failed to load rate limits; keeping the current ones")
+            self._config_expires = time.monotonic() + self.config_ttl
+        return self._config
+
+    def _bucket(self, key: str, limit: RateLimit) -> TokenBucket:
+        entry = self._buckets.get(key)
+        if entry is None:
+            if len(self._buckets) >= MAX_MEMORY_BUCKETS:
+                self._drop_idle()
+            bucket = TokenBucket(limit.burst)
+        else:
+            bucket = entry[0]
+        self._buckets[key] = (bucket, limit)
+        return bucket
+
+    def _drop_idle(self) -> None:
+        now = time.monotonic()
+        self._buckets = {
+            key: (bucket, limit)
+            for key, (bucket, limit) in self._buckets.items()
+            if not bucket.idle(limit, now)
+        }
+
+    def _acquire_memory(self, limits: Dict[str, RateLimit], cost: float) -> float:
+        buckets = [(self._bucket(key, limit), limit) for key, limit in limits.items()]
+        wait = max(bucket.wait_time(limit, cost) for bucket, limit in buckets)
+        if wait == 0:
+            for bucket, _ in buckets:
+                bucket.take(cost)
+        return wait
+
+    async def _take_shared(self, key: str, limit: RateLimit, cost: float) -> bool:
+        rows = await prisma.get_client().query_raw(
+            """
+            INSERT INTO "RateLimitBucket" AS "bucket" ("key", "tokens", "updatedAt")
+            VALUES ($1, $2::float8 - $4::float8, now())
+            ON CONFLICT ("key") DO UPDATE
+            SET "tokens" = LEAST(
+                    $2::float8,
+                    "bucket"."tokens"
+                    + $3::float8 * EXTRACT(EPOCH FROM now() - "bucket"."updatedAt")
+                ) - $4::float8,
+                "updatedAt" = now()
+            WHERE LEAST(
+                    $2::float8,
+                    "bucket"."tokens"
+                    + $3::float8 * EXTRACT(EPOCH FROM now() - "bucket"."updatedAt")
+                ) >= LEAST($4::float8, $2::float8)
+            RETURNING "tokens"
+            """,
+            key,
+            limit.burst,
+            limit.per_minute / 60,
+            cost,
+        )
+        return bool(rows)
+
+    async def _refund_shared(self, key: str, limit: RateLimit, cost: float) -> None:
+        await prisma.get_client().execute_raw(
+            """
+            UPDATE "RateLimitBucket"
+            SET "tokens" = LEAST($2::float8, "tokens" + $3::float8)
+            WHERE "key" = $1
+            """,
+            key,
+            limit.burst,
+            cost,
+        )
+
+    async def _refund_all_shared(
+        self, taken: List[Tuple[str, RateLimit]], cost: float
+    ) -> None:
+        for key, limit in taken:
+            try:
+                await self._refund_shared(key, limit, cost)
+            except Exception:
+                logger.exception("Failed to refund rate limit tokens to %s", key)
+
+    async def _acquire_shared(self, limits: Dict[str, RateLimit], cost: float) -> float:
+        taken: List[Tuple[str, RateLimit]] = []
+        for key, limit in limits.items():
+            try:
+                took = await self._take_shared(key, limit, cost)
+            except Exception:
+                # The caller falls back to the local buckets; don't charge the shared ones too.
+                await self._refund_all_shared(taken, cost)
+                raise
+            if not took:
+                await self._refund_all_shared(taken, cost)
+                # The exact balance is not returned on refusal; waiting for a full request's
+                # worth of tokens is an upper bound.
+                return _seconds_for(limit, min(cost, limit.burst))
+            taken.append((key, limit))
+        return 0.0
+
+    async def acquire(self, user_id: str, cost: float = 1) -> None:
+        """
+        Takes `cost` tokens from the user's bucket and their plan's bucket.
+
+        Args:
+            user_id (str): The user making the request.
+            cost (float): The number of queries in the request.
+
+        Raises:
+            RateLimitExceededError: If either bucket cannot pay for the request yet.
+        """
+        if not self.enabled or cost <= 0:
+            return
+        config = await self.config()
+        plan = await project.user_plans.get_plan(user_id)
+        plan_name = plan.value if plan is not None else NO_PLAN
+        limits = {f"user:{user_id}": config.user_limit(user_id, plan_name)}
+        plan_limit = config.plan_limit(plan_name)
+        if plan_limit is not None:
+            limits[f"plan:{plan_name}"] = plan_limit
+        wait = None
+        if self.backend == "database":
+            try:
+                wait = await self._acquire_shared(limits, cost)
+            except Exception:
+                logger.exception("Shared rate limit buckets failed; using local ones")
+                self._stats["database_fallbacks"] += 1
+        if wait is None:
+            wait = self._acquire_memory(limits, cost)
+        if wait > 0:
+            self._stats["limited"] += 1
+            raise RateLimitExceededError(
+                f"Rate limit exceeded; retry in {wait:.1f} seconds.", wait
+            )
+        self._stats["allowed"] += 1
+
+    def stats(self) -> RateLimitStats:
+        return RateLimitStats(
+            enabled=self.enabled,
+            backend=self.backend,
+            buckets=len(self._buckets),
+            **self._stats,
+        )
+
+
+_limiter = RateLimiter()
+
+
+async def acquire(user_id: str, cost: float = 1) -> None:
+    """
+    Charges a request of `cost` queries to the user's and their plan's rate limits.
+
+    Raises:
+        RateLimitExceededError: If the user or their plan is over its limit.
+    """
+    await _limiter.acquire(user_id, cost)
+
+
+def get_stats() -> RateLimitStats:
+    """
+    Returns how many requests the rate limits let through or turned away.
+    """
+    return _limiter.stats()
@@ -0,0 +1,30 @@
+from typing import List
+
+import project.model_catalog
+from pydantic import BaseModel
+
+
+class RefreshModelCatalogResponse(BaseModel):
+    """
+    Confirms that the in-memory AI model catalog was reloaded and reports what it now contains.
+    """
+
+    catalog_size: int
+    available_models: List[str]
+
+
+async def refresh_model_catalog() -> RefreshModelCatalogResponse:
+    """
+    Reloads the in-memory AI model catalog from the database.
+
+    Admins call this after adding, removing or editing AIModel rows so that query allocation
+    picks up the change immediately instead of waiting for the catalog TTL to expire.
+
+    Returns:
+        RefreshModelCatalogResponse: Confirms that the in-memory AI model catalog was reloaded and reports what it now contains.
+    """
+    snapshot = await project.model_catalog.refresh()
+    return RefreshModelCatalogResponse(
+        catalog_size=len(snapshot.models),
+        available_models=[model.name for model in snapshot.models],
+    )
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import prisma
+import prisma.models
+from pydantic import BaseModel
+
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+CACHE_DB_FALLBACK = os.getenv("RESPONSE_CACHE_DB_FALLBACK", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+
+class ResponseCacheStats(BaseModel):
+    """
+    Hit, miss and eviction counters of the response cache.
+    """
+
+    hits: int
+    misses: int
+    database_hits: int
+    evictions: int
+    expirations: int
+    entries: int
+    size_bytes: int
+
+
+def normalize_query_text(query_text: str) -> str:
+    """
+    Normalizes query text so that trivially different spellings of the same prompt match.
+
+    Args:
+        query_text (str): The raw query text.
+
+    Returns:
+        str: The text lower-cased, with surrounding whitespace removed and inner runs of whitespace collapsed.
+    """
+    return " ".join(query_text.lower().split())
+
+
+def query_text_hash(query_text: str) -> str:
+    """
+    Returns the SHA-256 hex digest of the normalized query text, as stored in Query.queryTextHash.
+
+    Args:
+        query_text (str): The raw query text.
+
+    Returns:
+        str: The digest, the same for every text that normalizes the same way.
+    """
+    return hashlib.sha256(normalize_query_text(query_text).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    An in-process LRU cache of model responses keyed by normalized query text and model.
+
+    Entries expire after `ttl_seconds`. The least recently used entries are evicted once
+    either `max_entries` or `max_bytes` (measured as the UTF-8 length of cached responses)
+    is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float, int]]" = (
+            OrderedDict()
+        )
+        self._size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.database_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        _, _, size = self._entries.pop(key)
+        self._size_bytes -= size
+
+    def get(self, normalized_text: str, model: str) -> Optional[str]:
+        """
+        Returns the cached response for a query and model, or None.
+        """
+        key = (normalized_text, model)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        response, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, normalized_text: str, model: str, response: str) -> None:
+        """
+        Caches a response for a query and model, evicting old entries if needed.
+        """
+        key = (normalized_text, model)
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (response, time.monotonic() + self.ttl_seconds, size)
+        self._size_bytes += size
+        while (
+            len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> ResponseCacheStats:
+        return ResponseCacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            database_hits=self.database_hits,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            entries=len(self._entries),
+            size_bytes=self._size_bytes,
+        )
+
+
+_cache = ResponseCache()
+
+
+async def lookup(query_text: str, model: str) -> Optional[str]:
+    """
+    Looks up a previously stored response for the same query routed to the same model.
+
+    The in-process cache is checked first. If RESPONSE_CACHE_DB_FALLBACK is enabled, a miss
+    falls back to the most recent answered Query row with the same normalized text and model,
+    found through the index on its queryTextHash, and the result is cached in memory.
+
+    Args:
+        query_text (str): The raw query text.
+        model (str): The name of the model the query is routed to.
+
+    Returns:
+        Optional[str]: The stored response, or None on a miss.
+    """
+    normalized_text = normalize_query_text(query_text)
+    response = _cache.get(normalized_text, model)
+    if response is not None or not CACHE_DB_FALLBACK:
+        return response
+    query = await prisma.models.Query.prisma().find_first(
+        where={
+            "queryTextHash": query_text_hash(query_text),
+            "routedToModel": model,
+            "response": {"not": None},
+        },
+        order={"createdAt": "desc"},
+    )
+    if query is None or query.response is None:
+        return None
+    _cache.database_hits += 1
+    _cache.put(normalized_text, model, query.response)
+    return query.response
+
+
+def remember(query_text: str, model: str, response: str) -> None:
+    """
+    Stores a model response so that repeats of the same query can reuse it.
+
+    Args:
+        query_text (str): The raw query text.
+        model (str): The name of the model that produced the response.
+        response (str): The model's response.
+    """
+    _cache.put(normalize_query_text(query_text), model, response)
+
+
+def get_stats() -> ResponseCacheStats:
+    """
+    Returns hit, miss and eviction counters of the process-wide response cache.
+    """
+    return _cache.stats()
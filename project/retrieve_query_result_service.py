@@ -1,7 +1,23 @@
+import asyncio
+import os
+from typing import Dict, List, Optional
+
 import prisma
+import prisma.enums
 import prisma.models
+import project.query_events
+import project.query_writer
 from pydantic import BaseModel
 
+MAX_WAIT_SECONDS = float(os.getenv("QUERY_RESULT_MAX_WAIT_SECONDS", "30"))
+MAX_WEBSOCKET_WAIT_SECONDS = float(
+    os.getenv("QUERY_RESULT_WEBSOCKET_MAX_WAIT_SECONDS", "300")
+)
+# Waiters re-read the row this often, to notice queries completed by another process.
+RECHECK_SECONDS = float(os.getenv("QUERY_RESULT_RECHECK_SECONDS", "5"))
+FINISHED_STATUSES = ("COMPLETED", "FAILED")
+MAX_BULK_SIZE = 1000
+
 
 class RetrieveQueryResultResponse(BaseModel):
     """
@@ -15,22 +31,124 @@ class RetrieveQueryResultResponse(BaseModel):
     response: str
     latency: float
     cost: float
+    status: str = "COMPLETED"
+    error: Optional[str] = None
+
+
+class BulkQueryResultItem(BaseModel):
+    """
+    The result of one query in a bulk retrieval, or why it could not be retrieved.
+    """
+
+    query_id: str
+    result: Optional[RetrieveQueryResultResponse] = None
+    error: Optional[str] = None
+
+
+class BulkRetrieveQueryResultResponse(BaseModel):
+    """
+    The results of a bulk retrieval, one item per requested ID in the order they were requested.
+    """
+
+    results: List[BulkQueryResultItem]
+    found: int
+    missing: int
 
 
-async def retrieve_query_result(queryId: str) -> RetrieveQueryResultResponse:
+async def retrieve_query_result(
+    queryId: str, userId: Optional[str] = None
+) -> RetrieveQueryResultResponse:
     """
     Retrieves the results of processed queries for the user.
 
     Args:
         queryId (str): The unique identifier of the query for which the result is being retrieved.
+        userId (Optional[str]): If given, queries of other users are treated as not found.
 
     Returns:
         RetrieveQueryResultResponse: The model outlining the response structure for a query result retrieval. It
         includes details about the query, its complexity score, the AI model it was routed to, and the actual response.
     """
-    query = await prisma.models.Query.prisma().find_unique(where={"id": queryId})
+    query = _pending_query(queryId)
     if query is None:
+        query = await prisma.models.Query.prisma().find_unique(where={"id": queryId})
+    if query is None or not _visible(query, userId):
         raise ValueError(f"No query found with ID: {queryId}")
+    return _to_response(query)
+
+
+async def retrieve_query_results(
+    queryIds: List[str], userId: Optional[str] = None
+) -> BulkRetrieveQueryResultResponse:
+    """
+    Retrieves the results of many queries with a single database read.
+
+    Queries still in the write-behind buffer are answered from memory and the rest are fetched
+    with one `find_many`. IDs that match no query are reported per item instead of failing the
+    whole request.
+
+    Args:
+        queryIds (List[str]): The IDs of the queries, at most MAX_BULK_SIZE.
+        userId (Optional[str]): If given, queries of other users are reported as not found.
+
+    Returns:
+        BulkRetrieveQueryResultResponse: One item per requested ID, in the order they were requested.
+    """
+    if len(queryIds) > MAX_BULK_SIZE:
+        raise ValueError(
+            f"Batch of {len(queryIds)} IDs exceeds the limit of {MAX_BULK_SIZE}."
+        )
+    queries: Dict[str, prisma.models.Query] = {}
+    for query_id in queryIds:
+        pending = _pending_query(query_id)
+        if pending is not None:
+            queries[query_id] = pending
+    missing_ids = list({query_id for query_id in queryIds if query_id not in queries})
+    if missing_ids:
+        for query in await prisma.models.Query.prisma().find_many(
+            where={"id": {"in": missing_ids}}
+        ):
+            queries[query.id] = query
+    results = []
+    for query_id in queryIds:
+        query = queries.get(query_id)
+        if query is None or not _visible(query, userId):
+            results.append(
+                BulkQueryResultItem(
+                    query_id=query_id, error=f"No query found with ID: {query_id}"
+                )
+            )
+        else:
+            results.append(
+                BulkQueryResultItem(query_id=query_id, result=_to_response(query))
+            )
+    found = sum(1 for item in results if item.result is not None)
+    return BulkRetrieveQueryResultResponse(
+        results=results, found=found, missing=len(results) - found
+    )
+
+
+def _visible(query: prisma.models.Query, user_id: Optional[str]) -> bool:
+    return user_id is None or query.userId == user_id
+
+
+def _pending_query(query_id: str) -> Optional[prisma.models.Query]:
+    pending = project.query_writer.get_pending(query_id)
+    if pending is None:
+        return None
+    # Fill in the database defaults the buffered row does not carry yet.
+    return prisma.models.Query(
+        **{
+            "status": prisma.enums.QueryStatus.COMPLETED,
+            "submitted": False,
+            "priority": 0,
+            "attempts": 0,
+            **pending,
+        }
+    )
+
+
+def _to_response(query: prisma.models.Query) -> RetrieveQueryResultResponse:
     return RetrieveQueryResultResponse(
         query_id=query.id,
         query_text=query.queryText,
@@ -41,4 +159,41 @@ async def retrieve_query_result(queryId: str) -> RetrieveQueryResultResponse:
         response=query.response if query.response else "No response available",
         latency=query.latency if query.latency is not None else 0.0,
         cost=query.cost if query.cost is not None else 0.0,
+        status=query.status,
+        error=query.error,
     )
+
+
+async def wait_for_query_result(
+    queryId: str, timeout: float, userId: Optional[str] = None
+) -> RetrieveQueryResultResponse:
+    """
+    Retrieves the result of a query once it has completed or failed, waiting up to `timeout` seconds.
+
+    The wait is woken by the in-process completion event of the query, and re-reads the row every
+    RECHECK_SECONDS in case another process answers it. If the query is still unfinished when the
+    timeout expires, its current state is returned.
+
+    Args:
+        queryId (str): The unique identifier of the query for which the result is being retrieved.
+        timeout (float): The longest time to wait, in seconds.
+        userId (Optional[str]): If given, queries of other users are treated as not found.
+
+    Returns:
+        RetrieveQueryResultResponse: The query result; check `status` to tell whether it finished.
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    with project.query_events.subscribe(queryId) as completed:
+        while True:
+            completed.clear()
+            result = await retrieve_query_result(queryId, userId)
+            remaining = deadline - loop.time()
+            if result.status in FINISHED_STATUSES or remaining <= 0:
+                return result
+            try:
+                await asyncio.wait_for(
+                    completed.wait(), min(remaining, RECHECK_SECONDS)
+                )
+            except asyncio.TimeoutError:
+                pass
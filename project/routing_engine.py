@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.analyze_query_complexity_service
+import project.budget_governor
+import project.financial_ledger
+import project.model_catalog
+import project.model_estimates
+
+# How capable each model family is, on the same 1-3 scale as COMPLEXITY_TIERS.
+CAPABILITY_TIERS: Dict[prisma.enums.ModelType, int] = {
+    prisma.enums.ModelType.GPT4_TURBO: 3,
+    prisma.enums.ModelType.CLAUDE_3_OPUS: 3,
+    prisma.enums.ModelType.GEMINI_1_5_PRO: 2,
+    prisma.enums.ModelType.OTHER: 1,
+}
+
+# The capability tier a query of each complexity category needs.
+COMPLEXITY_TIERS: Dict[str, int] = {"Low": 1, "Medium": 2, "High": 3}
+
+LATENCY_WEIGHT = 0.3
+UNDERPOWERED_PENALTY = 1.0
+OVERPOWERED_PENALTY = 0.15
+# A model failing every call scores as badly as one a full capability tier too weak.
+ERROR_RATE_WEIGHT = 1.0
+
+
+@dataclass(frozen=True)
+class RankedModel:
+    """
+    A candidate model together with the score it was ranked by (lower is better).
+    """
+
+    model: prisma.models.AIModel
+    score: float
+    expected_cost: float
+    expected_latency: float
+
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    """
+    The outcome of routing a single query: every eligible model, best first.
+    """
+
+    complexity_category: str
+    ranked: Tuple[RankedModel, ...]
+
+    @property
+    def primary(self) -> RankedModel:
+        return self.ranked[0]
+
+    @property
+    def fallbacks(self) -> Tuple[RankedModel, ...]:
+        return self.ranked[1:]
+
+
+def rank_models(
+    candidates: Tuple[prisma.models.AIModel, ...],
+    complexity_score: float,
+    budget_remaining_fraction: float = 1.0,
+    expected_costs: Optional[Mapping[str, float]] = None,
+    expected_latencies: Optional[Mapping[str, float]] = None,
+    error_rates: Optional[Mapping[str, float]] = None,
+) -> RoutingDecision:
+    """
+    Scores candidate models for a query and returns them best first.
+
+    Each model is scored on its normalised expected cost, its normalised expected latency, its
+    recent error rate and how well its capability tier fits the query's complexity category. The less of the monthly budget
+    is left, the more cost dominates and the less an underpowered model is penalised.
+
+    Args:
+        candidates (Tuple[prisma.models.AIModel, ...]): The models eligible for this query.
+        complexity_score (float): The complexity score of the query.
+        budget_remaining_fraction (float): Share of the monthly budget still available, from 0.0 to 1.0.
+        expected_costs (Optional[Mapping[str, float]]): Live cost estimates by model name, overriding `costPerQuery`.
+        expected_latencies (Optional[Mapping[str, float]]): Live latency estimates by model name, overriding `averageLatency`.
+        error_rates (Optional[Mapping[str, float]]): Recent error rates by model name, from 0.0 to 1.0.
+
+    Returns:
+        RoutingDecision: Every candidate model, ranked best first.
+    """
+    category = project.analyze_query_complexity_service.categorize_score(
+        complexity_score
+    )
+    if not candidates:
+        return RoutingDecision(complexity_category=category, ranked=())
+    required_tier = COMPLEXITY_TIERS[category]
+    budget_left = min(max(budget_remaining_fraction, 0.0), 1.0)
+    cost_weight = 0.3 + 0.7 * (1.0 - budget_left)
+    capability_weight = 0.5 + 0.5 * budget_left
+    costs = [
+        expected_costs.get(model.name, model.costPerQuery)
+        if expected_costs
+        else model.costPerQuery
+        for model in candidates
+    ]
+    latencies = [
+        expected_latencies.get(model.name, model.averageLatency)
+        if expected_latencies
+        else model.averageLatency
+        for model in candidates
+    ]
+    max_cost = max(costs) or 1.0
+    max_latency = max(latencies) or 1.0
+    ranked: List[RankedModel] = []
+    for model, cost, latency in zip(candidates, costs, latencies):
+        tier = CAPABILITY_TIERS.get(model.modelType, 1)
+        if tier < required_tier:
+            fit_penalty = (required_tier - tier) * UNDERPOWERED_PENALTY
+        else:
+            fit_penalty = (tier - required_tier) * OVERPOWERED_PENALTY
+        score = (
+            cost_weight * cost / max_cost
+            + LATENCY_WEIGHT * latency / max_latency
+            + capability_weight * fit_penalty
+            + ERROR_RATE_WEIGHT
+            * (error_rates.get(model.name, 0.0) if error_rates else 0.0)
+        )
+        ranked.append(
+            RankedModel(
+                model=model,
+                score=score,
+                expected_cost=cost,
+                expected_latency=latency,
+            )
+        )
+    ranked.sort(key=lambda x: (x.score, x.expected_cost))
+    return RoutingDecision(complexity_category=category, ranked=tuple(ranked))
+
+
+async def route_query(
+    complexity_score: float,
+    preferred_models: Optional[List[str]] = None,
+    budget_remaining_fraction: Optional[float] = None,
+    priority: Optional[int] = None,
+) -> RoutingDecision:
+    """
+    Routes a query against the in-memory model catalog, within what the budget governor allows.
+
+    Models are ranked on the live latency, cost and error-rate estimates of the model estimator
+    where it has observed them. When the budget runs low, models expected to cost more than the
+    governor's per-query ceiling are left out, falling back to the cheapest candidate if none is
+    cheap enough.
+
+    Args:
+        complexity_score (float): The complexity score of the query.
+        preferred_models (Optional[List[str]]): Model names the caller is willing to use. An empty list or None means any model.
+        budget_remaining_fraction (Optional[float]): Share of the monthly budget still available, from 0.0 to 1.0.
+            Defaults to the live figure from the financial ledger.
+        priority (Optional[int]): The scheduling priority of the query. When given, the query must
+            be admitted by the budget governor.
+
+    Returns:
+        RoutingDecision: Every eligible model, ranked best first.
+
+    Raises:
+        ValueError: If no model in the catalog is eligible.
+        project.budget_governor.BudgetExceededError: If the budget does not admit the query.
+    """
+    if priority is not None:
+        project.budget_governor.check_admission(priority)
+    catalog = await project.model_catalog.get_snapshot()
+    if preferred_models:
+        allowed = set(preferred_models)
+        candidates = tuple(model for model in catalog.models if model.name in allowed)
+    else:
+        candidates = catalog.models
+    estimator = project.model_estimates.get_estimator()
+    expected_costs = estimator.expected_costs()
+
+    def expected_cost(model: prisma.models.AIModel) -> float:
+        return expected_costs.get(model.name, model.costPerQuery)
+
+    ceiling = project.budget_governor.cost_ceiling()
+    if ceiling is not None and candidates:
+        affordable = tuple(
+            model for model in candidates if expected_cost(model) <= ceiling
+        )
+        candidates = affordable or (min(candidates, key=expected_cost),)
+    if budget_remaining_fraction is None:
+        budget_remaining_fraction = project.financial_ledger.remaining_budget_fraction()
+    decision = rank_models(
+        candidates,
+        complexity_score,
+        budget_remaining_fraction,
+        expected_costs=expected_costs,
+        expected_latencies=estimator.expected_latencies(),
+        error_rates=estimator.error_rates(),
+    )
+    if not decision.ranked:
+        raise ValueError("No suitable AI models found.")
+    return decision
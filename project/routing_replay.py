@@ -0,0 +1,898 @@
+import abc
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+import project.analyze_query_complexity_service
+import project.budget_governor
+import project.financial_ledger
+import project.metrics
+import project.model_catalog
+import project.model_estimates
+import project.routing_engine
+from pydantic import BaseModel
+
+# Records are scored and replayed this many at a time, and read from the database in pages
+# of this size, so memory does not grow with the length of the replay.
+CHUNK_SIZE = 1000
+DEFAULT_POLICIES = ("recorded", "router", "cheapest")
+TEXT_FIELDS = ("queryText", "query_text", "text", "prompt")
+LATENCY_BUCKETS_MS = project.model_estimates.LATENCY_BUCKETS_MS
+# Spread of simulated latencies for models with no recorded traffic, around averageLatency.
+UNRECORDED_LATENCY_SIGMA = 0.35
+
+
+@dataclass(frozen=True)
+class ReplayRecord:
+    """
+    One logged query and, if it was answered, what answering it took.
+    """
+
+    query_text: str
+    created_at: Optional[datetime] = None
+    model: Optional[str] = None
+    latency_ms: Optional[float] = None
+    cost: Optional[float] = None
+    failed: bool = False
+    priority: int = 0
+
+
+class MonthlySpend(BaseModel):
+    """
+    A policy's spend in one billing month, against the monthly budget.
+    """
+
+    month: str
+    cost: float
+    budgetUsed: float
+
+
+class ModelShare(BaseModel):
+    """
+    The queries a policy sent to one model and what they cost.
+    """
+
+    modelName: str
+    queries: int
+    cost: float
+
+
+class PolicyReport(BaseModel):
+    """
+    What replaying the traffic under one routing policy would have cost and taken.
+    """
+
+    policy: str
+    queries: int
+    rejected: int
+    failed: int
+    totalCost: float
+    avgCost: float
+    avgLatencyMs: float
+    p50LatencyMs: float
+    p95LatencyMs: float
+    p99LatencyMs: float
+    budgetExhaustedAt: Optional[datetime] = None
+    months: List[MonthlySpend]
+    models: List[ModelShare]
+
+
+class ReplayReport(BaseModel):
+    """
+    The outcome of replaying logged traffic under several routing policies.
+    """
+
+    records: int
+    skipped: int
+    monthlyBudget: float
+    policies: List[PolicyReport]
+
+
+def _parse_time(value: object) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _parse_float(value: object) -> Optional[float]:
+    return float(value) if value is not None and value != "" else None
+
+
+def parse_record(raw: dict, text_field: Optional[str] = None) -> Optional[ReplayRecord]:
+    """
+    Builds a replay record from one exported row.
+
+    The field names of the Query table are used, with snake_case spellings accepted too, so a
+    JSONL export of Query replays as is. Only the query text is required.
+
+    Args:
+        raw (dict): The exported row.
+        text_field (Optional[str]): The field holding the query text; defaults to the first of
+            TEXT_FIELDS present.
+
+    Returns:
+        Optional[ReplayRecord]: The record, or None if the row has no query text.
+    """
+    fields = (text_field,) if text_field else TEXT_FIELDS
+    text = next((raw[name] for name in fields if raw.get(name)), None)
+    if not isinstance(text, str):
+        return None
+    status = str(raw.get("status") or "")
+    return ReplayRecord(
+        query_text=text,
+        created_at=_parse_time(raw.get("createdAt") or raw.get("created_at")),
+        model=raw.get("routedToModel") or raw.get("routed_to_model") or None,
+        latency_ms=_parse_float(raw.get("latency")),
+        cost=_parse_float(raw.get("cost")),
+        failed=status == prisma.enums.QueryStatus.FAILED.value,
+        priority=int(raw.get("priority") or 0),
+    )
+
+
+class _Counts:
+    """
+    How many records a source produced and skipped, as it streams them.
+    """
+
+    def __init__(self) -> None:
+        self.records = 0
+        self.skipped = 0
+
+
+Source = Callable[[_Counts], AsyncIterator[ReplayRecord]]
+
+
+def jsonl_source(path: str, text_field: Optional[str] = None) -> Source:
+    """
+    Returns a source that streams records from a JSONL file, one line at a time.
+
+    Args:
+        path (str): The file to read, or "-" for standard input.
+        text_field (Optional[str]): The field holding the query text.
+
+    Returns:
+        Source: A callable that starts a new pass over the file each time it is called.
+    """
+
+    async def read(counts: _Counts) -> AsyncIterator[ReplayRecord]:
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        try:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    raw = json.loads(line)
+                    # Valid JSON that is not an object (an array, a number) is skipped too.
+                    record = (
+                        parse_record(raw, text_field) if isinstance(raw, dict) else None
+                    )
+                except (ValueError, TypeError):
+                    record = None
+                if record is None:
+                    counts.skipped += 1
+                    continue
+                counts.records += 1
+                yield record
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    return read
+
+
+def query_table_source(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    page_size: int = CHUNK_SIZE,
+) -> Source:
+    """
+    Returns a source that streams Query rows created within a time window, oldest first.
+
+    Rows are read in pages with keyset pagination on (createdAt, id), so each page is an index
+    range scan and only one page is held at a time.
+
+    Args:
+        start (Optional[datetime]): Only replay queries created at or after this time.
+        end (Optional[datetime]): Only replay queries created before this time.
+        page_size (int): The number of rows read per page.
+
+    Returns:
+        Source: A callable that starts a new pass over the table each time it is called.
+    """
+
+    async def read(counts: _Counts) -> AsyncIterator[ReplayRecord]:
+        window: Dict[str, datetime] = {}
+        if start is not None:
+            window["gte"] = start
+        if end is not None:
+            window["lt"] = end
+        after: Optional[Tuple[datetime, str]] = None
+        while True:
+            conditions: List[dict] = [{"createdAt": window}] if window else []
+            if after is not None:
+                conditions.append(
+                    {
+                        "OR": [
+                            {"createdAt": {"gt": after[0]}},
+                            {"createdAt": after[0], "id": {"gt": after[1]}},
+                        ]
+                    }
+                )
+            rows = await prisma.models.Query.prisma().find_many(
+                where={"AND": conditions},
+                order=[{"createdAt": "asc"}, {"id": "asc"}],
+                take=page_size,
+            )
+            for row in rows:
+                counts.records += 1
+                yield ReplayRecord(
+                    query_text=row.queryText,
+                    created_at=row.createdAt,
+                    model=row.routedToModel,
+                    latency_ms=row.latency,
+                    cost=row.cost,
+                    failed=row.status == prisma.enums.QueryStatus.FAILED,
+                    priority=row.priority,
+                )
+            if len(rows) < page_size:
+                return
+            after = (rows[-1].createdAt, rows[-1].id)
+
+    return read
+
+
+class ModelProfile:
+    """
+    The recorded behaviour of one model: a latency histogram, its error rate and a least-squares
+    fit of cost against query length. Fixed size, however much traffic is observed.
+    """
+
+    __slots__ = ("latency", "errors", "costs", "sum_x", "sum_y", "sum_xx", "sum_xy")
+
+    def __init__(self) -> None:
+        self.latency = project.metrics.Histogram(LATENCY_BUCKETS_MS)
+        self.errors = 0
+        self.costs = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+
+    def observe(self, record: ReplayRecord) -> None:
+        if record.failed:
+            self.errors += 1
+            return
+        if record.latency_ms is not None:
+            self.latency.observe(record.latency_ms)
+        if record.cost is not None:
+            length = float(len(record.query_text))
+            self.costs += 1
+            self.sum_x += length
+            self.sum_y += record.cost
+            self.sum_xx += length * length
+            self.sum_xy += length * record.cost
+
+    @property
+    def error_rate(self) -> float:
+        total = self.errors + self.latency.count
+        return self.errors / total if total else 0.0
+
+    @property
+    def mean_cost(self) -> Optional[float]:
+        return self.sum_y / self.costs if self.costs else None
+
+    @property
+    def mean_latency_ms(self) -> Optional[float]:
+        return self.latency.sum / self.latency.count if self.latency.count else None
+
+    def cost(self, length: int) -> Optional[float]:
+        if not self.costs:
+            return None
+        variance = self.costs * self.sum_xx - self.sum_x**2
+        if self.costs < 2 or variance <= 0:
+            return self.sum_y / self.costs
+        slope = (self.costs * self.sum_xy - self.sum_x * self.sum_y) / variance
+        intercept = (self.sum_y - slope * self.sum_x) / self.costs
+        return max(intercept + slope * length, 0.0)
+
+    def sample_latency_ms(self, rng: random.Random) -> Optional[float]:
+        histogram = self.latency
+        if not histogram.count:
+            return None
+        rank = rng.random() * histogram.count
+        seen = 0
+        for i, bucket_count in enumerate(histogram.counts):
+            if bucket_count and seen + bucket_count > rank:
+                bounds = histogram.bounds
+                lower = bounds[i - 1] if i > 0 else 0.0
+                upper = bounds[i] if i < len(bounds) else bounds[-1]
+                return lower + (upper - lower) * rng.random()
+            seen += bucket_count
+        return histogram.bounds[-1]
+
+
+class RecordedProfiles:
+    """
+    Per-model behaviour to simulate calls with: the recorded traffic where there is any, and
+    the catalog's averageLatency and costPerQuery for models that served none of it.
+    """
+
+    def __init__(self, catalog: project.model_catalog.ModelCatalogSnapshot) -> None:
+        self.catalog = catalog
+        self.profiles: Dict[str, ModelProfile] = {}
+
+    def observe(self, record: ReplayRecord) -> None:
+        if record.model is not None:
+            self.profiles.setdefault(record.model, ModelProfile()).observe(record)
+
+    def expected_costs(self) -> Dict[str, float]:
+        return {
+            name: profile.mean_cost
+            for name, profile in self.profiles.items()
+            if profile.mean_cost is not None
+        }
+
+    def expected_latencies(self) -> Dict[str, float]:
+        return {
+            name: profile.mean_latency_ms
+            for name, profile in self.profiles.items()
+            if profile.mean_latency_ms is not None
+        }
+
+    def error_rates(self) -> Dict[str, float]:
+        return {name: profile.error_rate for name, profile in self.profiles.items()}
+
+    def simulate(
+        self, model: prisma.models.AIModel, query_text: str, rng: random.Random
+    ) -> Tuple[bool, float, float]:
+        """
+        Simulates sending a query to a model.
+
+        Returns:
+            Tuple[bool, float, float]: Whether the call failed, its latency in milliseconds and
+            its cost.
+        """
+        profile = self.profiles.get(model.name)
+        if profile is not None and rng.random() < profile.error_rate:
+            return True, 0.0, 0.0
+        latency = profile.sample_latency_ms(rng) if profile else None
+        if latency is None:
+            median = model.averageLatency * math.exp(
+                -(UNRECORDED_LATENCY_SIGMA**2) / 2
+            )
+            latency = median * math.exp(rng.gauss(0.0, UNRECORDED_LATENCY_SIGMA))
+        cost = profile.cost(len(query_text)) if profile else None
+        return False, latency, cost if cost is not None else model.costPerQuery
+
+
+class SimulatedBudget:
+    """
+    The monthly budget as a policy burns through it, billed by each record's creation month.
+
+    Records without a timestamp are all billed to one month. Admission and the per-query cost
+    ceiling are decided by project.budget_governor, from this budget's remaining share.
+    """
+
+    def __init__(self, monthly_budget: float) -> None:
+        self.monthly_budget = monthly_budget
+        self.month: Optional[str] = None
+        self.spent: Dict[str, float] = {}
+        self.exhausted_at: Optional[datetime] = None
+
+    def advance(self, at: Optional[datetime]) -> None:
+        self.month = (
+            project.financial_ledger.billing_month_start(at).strftime("%Y-%m")
+            if at is not None
+            else "all"
+        )
+        self.spent.setdefault(self.month, 0.0)
+
+    def remaining(self) -> float:
+        return self.monthly_budget - self.spent.get(self.month or "all", 0.0)
+
+    def remaining_fraction(self) -> float:
+        if self.monthly_budget <= 0:
+            return 0.0
+        return min(max(self.remaining() / self.monthly_budget, 0.0), 1.0)
+
+    def admits(self, priority: int) -> bool:
+        floor = project.budget_governor.min_priority_for(self.remaining_fraction())
+        return floor is not None and priority >= floor
+
+    def cost_ceiling(self) -> Optional[float]:
+        return project.budget_governor.cost_ceiling_for(
+            self.remaining_fraction(), self.remaining()
+        )
+
+    def record(self, cost: float, at: Optional[datetime]) -> None:
+        self.spent[self.month or "all"] += cost
+        if self.exhausted_at is None and self.remaining() <= 0:
+            self.exhausted_at = at
+
+
+@dataclass(frozen=True)
+class ReplayOutcome:
+    """
+    What answering one replayed query took under a policy. Latency is in milliseconds and is
+    None if unknown; a failed call has no latency.
+    """
+
+    model: str
+    failed: bool
+    latency_ms: Optional[float]
+    cost: float
+
+
+class ReplayPolicy(abc.ABC):
+    """
+    A way of answering queries, to be compared on replayed traffic.
+
+    A policy that is `governed` is subject to the budget governor's admission control, as the
+    live router is.
+    """
+
+    name = ""
+    governed = False
+
+    @abc.abstractmethod
+    def replay(
+        self,
+        record: ReplayRecord,
+        score: float,
+        budget: SimulatedBudget,
+        rng: random.Random,
+    ) -> Optional[ReplayOutcome]:
+        """
+        Answers one replayed query.
+
+        Args:
+            record (ReplayRecord): The logged query.
+            score (float): Its complexity score.
+            budget (SimulatedBudget): This policy's budget so far.
+            rng (random.Random): The policy's random generator, for simulated calls.
+
+        Returns:
+            Optional[ReplayOutcome]: The outcome, or None if the policy does not answer the query.
+        """
+
+
+class RecordedPolicy(ReplayPolicy):
+    """
+    Keeps the model each query was actually routed to, and its recorded latency and cost.
+    Queries that were never answered are not answered.
+    """
+
+    name = "recorded"
+
+    def replay(
+        self,
+        record: ReplayRecord,
+        score: float,
+        budget: SimulatedBudget,
+        rng: random.Random,
+    ) -> Optional[ReplayOutcome]:
+        if record.model is None:
+            return None
+        return ReplayOutcome(
+            record.model,
+            record.failed,
+            None if record.failed else record.latency_ms,
+            record.cost or 0.0,
+        )
+
+
+class SimulatedPolicy(ReplayPolicy):
+    """
+    Picks a model for each query and simulates calling it from the recorded profiles.
+    """
+
+    def __init__(self, profiles: RecordedProfiles) -> None:
+        self.profiles = profiles
+
+    @abc.abstractmethod
+    def choose(
+        self, record: ReplayRecord, score: float, budget: SimulatedBudget
+    ) -> Optional[prisma.models.AIModel]:
+        """
+        Returns the model to send the query to, or None if there is none.
+        """
+
+    def replay(
+        self,
+        record: ReplayRecord,
+        score: float,
+        budget: SimulatedBudget,
+        rng: random.Random,
+    ) -> Optional[ReplayOutcome]:
+        model = self.choose(record, score, budget)
+        if model is None:
+            return None
+        failed, latency, cost = self.profiles.simulate(model, record.query_text, rng)
+        return ReplayOutcome(model.name, failed, None if failed else latency, cost)
+
+
+class RouterPolicy(SimulatedPolicy):
+    """
+    Routes like project.routing_engine.route_query: ranks the catalog on the recorded cost,
+    latency and error rate of each model, leaving out models above the budget's cost ceiling.
+
+    With `budget_aware` False the budget is taken to be untouched throughout, to show what the
+    budget-driven downgrades save.
+    """
+
+    def __init__(self, profiles: RecordedProfiles, budget_aware: bool = True) -> None:
+        super().__init__(profiles)
+        self.name = "router" if budget_aware else "router-unbudgeted"
+        self.governed = budget_aware
+        self.budget_aware = budget_aware
+        self.expected_costs = profiles.expected_costs()
+        self.expected_latencies = profiles.expected_latencies()
+        self.error_rates = profiles.error_rates()
+
+    def choose(
+        self, record: ReplayRecord, score: float, budget: SimulatedBudget
+    ) -> Optional[prisma.models.AIModel]:
+        candidates = self.profiles.catalog.models
+        expected_costs = self.expected_costs
+        fraction = 1.0
+        if self.budget_aware:
+            fraction = budget.remaining_fraction()
+            ceiling = budget.cost_ceiling()
+            if ceiling is not None and candidates:
+
+                def expected_cost(model: prisma.models.AIModel) -> float:
+                    return expected_costs.get(model.name, model.costPerQuery)
+
+                affordable = tuple(
+                    model for model in candidates if expected_cost(model) <= ceiling
+                )
+                candidates = affordable or (min(candidates, key=expected_cost),)
+        decision = project.routing_engine.rank_models(
+            candidates,
+            score,
+            fraction,
+            expected_costs=expected_costs,
+            expected_latencies=self.expected_latencies,
+            error_rates=self.error_rates,
+        )
+        return decision.primary.model if decision.ranked else None
+
+
+class CheapestPolicy(SimulatedPolicy):
+    """
+    Always routes to the model with the lowest cost per query in the catalog.
+    """
+
+    name = "cheapest"
+
+    def __init__(self, profiles: RecordedProfiles) -> None:
+        super().__init__(profiles)
+        self.model = profiles.catalog.cheapest()
+
+    def choose(
+        self, record: ReplayRecord, score: float, budget: SimulatedBudget
+    ) -> Optional[prisma.models.AIModel]:
+        return self.model
+
+
+class FixedPolicy(SimulatedPolicy):
+    """
+    Always routes to one named model.
+    """
+
+    def __init__(self, profiles: RecordedProfiles, model_name: str) -> None:
+        super().__init__(profiles)
+        self.model = profiles.catalog.get(model_name)
+        if self.model is None:
+            raise ValueError(f"Model {model_name!r} is not in the catalog.")
+        self.name = f"fixed:{model_name}"
+
+    def choose(
+        self, record: ReplayRecord, score: float, budget: SimulatedBudget
+    ) -> Optional[prisma.models.AIModel]:
+        return self.model
+
+
+def build_policy(spec: str, profiles: RecordedProfiles) -> ReplayPolicy:
+    """
+    Builds a policy from its name: recorded, router, router-unbudgeted, cheapest or
+    fixed:<model name>.
+
+    Raises:
+        ValueError: If the name is unknown or names a model that is not in the catalog.
+    """
+    if spec == "recorded":
+        return RecordedPolicy()
+    if spec == "router":
+        return RouterPolicy(profiles)
+    if spec == "router-unbudgeted":
+        return RouterPolicy(profiles, budget_aware=False)
+    if spec == "cheapest":
+        return CheapestPolicy(profiles)
+    if spec.startswith("fixed:"):
+        return FixedPolicy(profiles, spec[len("fixed:") :])
+    raise ValueError(f"Unknown routing policy: {spec}")
+
+
+class _PolicyRun:
+    """
+    The running totals of one policy over the replay.
+    """
+
+    def __init__(
+        self,
+        policy: ReplayPolicy,
+        monthly_budget: float,
+        seed: int,
+    ) -> None:
+        self.policy = policy
+        self.budget = SimulatedBudget(monthly_budget)
+        self.rng = random.Random(f"{seed}:{policy.name}")
+        self.latency = project.metrics.Histogram(LATENCY_BUCKETS_MS)
+        self.queries = 0
+        self.rejected = 0
+        self.failed = 0
+        self.by_model: Dict[str, project.financial_ledger.CostTotals] = {}
+
+    def replay(self, record: ReplayRecord, score: float) -> None:
+        self.budget.advance(record.created_at)
+        if self.policy.governed and not self.budget.admits(record.priority):
+            self.rejected += 1
+            return
+        outcome = self.policy.replay(record, score, self.budget, self.rng)
+        if outcome is None:
+            self.rejected += 1
+            return
+        self.queries += 1
+        if outcome.failed:
+            self.failed += 1
+        elif outcome.latency_ms is not None:
+            self.latency.observe(outcome.latency_ms)
+        self.by_model.setdefault(
+            outcome.model, project.financial_ledger.CostTotals()
+        ).add(outcome.cost)
+        self.budget.record(outcome.cost, record.created_at)
+
+    def report(self) -> PolicyReport:
+        total = sum(totals.cost for totals in self.by_model.values())
+        budget = self.budget.monthly_budget
+        return PolicyReport(
+            policy=self.policy.name,
+            queries=self.queries,
+            rejected=self.rejected,
+            failed=self.failed,
+            totalCost=total,
+            avgCost=total / self.queries if self.queries else 0.0,
+            avgLatencyMs=(
+                self.latency.sum / self.latency.count if self.latency.count else 0.0
+            ),
+            p50LatencyMs=self.latency.quantile(0.5),
+            p95LatencyMs=self.latency.quantile(0.95),
+            p99LatencyMs=self.latency.quantile(0.99),
+            budgetExhaustedAt=self.budget.exhausted_at,
+            months=[
+                MonthlySpend(
+                    month=month, cost=cost, budgetUsed=cost / budget if budget else 0.0
+                )
+                for month, cost in sorted(self.budget.spent.items())
+            ],
+            models=[
+                ModelShare(modelName=name, queries=totals.count, cost=totals.cost)
+                for name, totals in sorted(self.by_model.items())
+            ],
+        )
+
+
+async def _chunks(
+    records: AsyncIterator[ReplayRecord], size: int
+) -> AsyncIterator[List[ReplayRecord]]:
+    chunk: List[ReplayRecord] = []
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def build_profiles(
+    source: Source, catalog: project.model_catalog.ModelCatalogSnapshot
+) -> RecordedProfiles:
+    """
+    Reads the recorded latency, cost and error distributions of every model in one pass.
+    """
+    profiles = RecordedProfiles(catalog)
+    async for record in source(_Counts()):
+        profiles.observe(record)
+    return profiles
+
+
+async def replay(
+    source: Source,
+    policies: Sequence[ReplayPolicy],
+    monthly_budget: float = project.financial_ledger.MONTHLY_BUDGET,
+    seed: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+) -> ReplayReport:
+    """
+    Streams logged traffic through the complexity scorer and every policy.
+
+    Records are scored a chunk at a time by the vectorized scorer and replayed against each
+    policy in turn. Every policy keeps only fixed-size totals, so memory stays constant however
+    many records are replayed. Each policy gets its own seeded random generator for the calls it
+    simulates, so a replay is reproducible.
+
+    Args:
+        source (Source): Where to read the records from.
+        policies (Sequence[ReplayPolicy]): The policies to compare.
+        monthly_budget (float): The budget each policy's spend is held against, per month.
+        seed (int): Seeds the simulated latencies, costs and failures.
+        chunk_size (int): How many records are scored at a time.
+
+    Returns:
+        ReplayReport: Spend, latency and budget burn per policy.
+    """
+    runs = [_PolicyRun(policy, monthly_budget, seed) for policy in policies]
+    counts = _Counts()
+    scorer = project.analyze_query_complexity_service.calculate_complexity_scores
+    async for chunk in _chunks(source(counts), chunk_size):
+        scores = scorer([record.query_text for record in chunk]).tolist()
+        for run in runs:
+            for record, score in zip(chunk, scores):
+                run.replay(record, score)
+    return ReplayReport(
+        records=counts.records,
+        skipped=counts.skipped,
+        monthlyBudget=monthly_budget,
+        policies=[run.report() for run in runs],
+    )
+
+
+def load_catalog(path: str) -> project.model_catalog.ModelCatalogSnapshot:
+    """
+    Loads the models to route between from a JSON list of AIModel rows, e.g.
+    [{"name": "GPT-4 Turbo", "modelType": "GPT4_TURBO", "costPerQuery": 0.03,
+      "averageLatency": 2000}].
+    """
+    with open(path, encoding="utf-8") as f:
+        rows = json.load(f)
+    now = datetime.now(timezone.utc)
+    models = [
+        prisma.models.AIModel(
+            **{
+                "id": row.get("id", row["name"]),
+                "createdAt": row.get("createdAt", now),
+                **row,
+            }
+        )
+        for row in rows
+    ]
+    return project.model_catalog.ModelCatalogSnapshot(models, time.monotonic())
+
+
+def print_report(report: ReplayReport) -> None:
+    print(
+        f"Replayed {report.records:,} records ({report.skipped:,} skipped) against a "
+        f"monthly budget of ${report.monthlyBudget:,.2f}\n"
+    )
+    print(
+        f"{'policy':<28} {'queries':>9} {'rejected':>8} {'failed':>7} {'total $':>11} "
+        f"{'avg $':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  budget exhausted"
+    )
+    for policy in report.policies:
+        exhausted = (
+            policy.budgetExhaustedAt.isoformat() if policy.budgetExhaustedAt else "-"
+        )
+        print(
+            f"{policy.policy:<28} {policy.queries:>9,} {policy.rejected:>8,} "
+            f"{policy.failed:>7,} {policy.totalCost:>11,.2f} {policy.avgCost:>9.5f} "
+            f"{policy.p50LatencyMs:>8.0f} {policy.p95LatencyMs:>8.0f} "
+            f"{policy.p99LatencyMs:>8.0f}  {exhausted}"
+        )
+    for policy in report.policies:
+        print(f"\n{policy.policy}")
+        for month in policy.months:
+            print(
+                f"  {month.month:<10} ${month.cost:>11,.2f}  "
+                f"{month.budgetUsed:>7.1%} of budget"
+            )
+        for share in policy.models:
+            print(
+                f"  {share.modelName:<24} {share.queries:>9,} queries  "
+                f"${share.cost:>11,.2f}"
+            )
+
+
+async def main(args: argparse.Namespace) -> ReplayReport:
+    """
+    Replays a JSONL export or the Query table under the requested policies.
+
+    Without --catalog, or when replaying the Query table, the database in DATABASE_URL is used.
+    """
+    db: Optional[prisma.Prisma] = None
+    if args.input is None or args.catalog is None:
+        db = prisma.Prisma(auto_register=True)
+        await db.connect()
+    try:
+        if args.input is None:
+            source = query_table_source(_parse_time(args.start), _parse_time(args.end))
+        else:
+            source = jsonl_source(args.input, args.text_field)
+        catalog = (
+            load_catalog(args.catalog)
+            if args.catalog
+            else await project.model_catalog.refresh()
+        )
+        if args.input == "-":
+            # Standard input can be read only once; simulate from the catalog figures.
+            profiles = RecordedProfiles(catalog)
+        else:
+            profiles = await build_profiles(source, catalog)
+        policies = [
+            build_policy(spec, profiles) for spec in args.policy or DEFAULT_POLICIES
+        ]
+        return await replay(source, policies, args.monthly_budget, args.seed)
+    finally:
+        if db is not None:
+            await db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m project.routing_replay",
+        description=(
+            "Replay logged queries through the complexity scorer and router under several "
+            "routing policies, and compare their spend, latency and budget burn."
+        ),
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        help="JSONL export to replay, or - for standard input; the Query table if omitted",
+    )
+    parser.add_argument(
+        "--text-field",
+        help=f"Field with the query text (default: {', '.join(TEXT_FIELDS)})",
+    )
+    parser.add_argument(
+        "--start", help="With the Query table: first createdAt, ISO 8601"
+    )
+    parser.add_argument(
+        "--end", help="With the Query table: end of createdAt, ISO 8601"
+    )
+    parser.add_argument(
+        "--catalog", help="JSON list of AIModel rows (default: the AIModel table)"
+    )
+    parser.add_argument(
+        "--policy",
+        action="append",
+        help=(
+            "recorded, router, router-unbudgeted, cheapest or fixed:<model name>; repeat to "
+            f"compare several (default: {', '.join(DEFAULT_POLICIES)})"
+        ),
+    )
+    parser.add_argument(
+        "--monthly-budget",
+        type=float,
+        default=project.financial_ledger.MONTHLY_BUDGET,
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    if args.json:
+        print(result.model_dump_json(indent=2))
+    else:
+        print_report(result)
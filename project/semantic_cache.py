@@ -0,0 +1,207 @@
+import logging
+import math
+import os
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+import prisma
+import project.query_writer
+import project.response_cache
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+# "hnsw" or "ivfflat"; must match a pgvector index method.
+INDEX_METHOD = os.getenv("SEMANTIC_CACHE_INDEX", "hnsw")
+# ivfflat trains its centroids on the rows present when it is built, so it is only built once
+# this many queries have embeddings; until then lookups scan the embedded rows exactly.
+IVFFLAT_MIN_ROWS = int(os.getenv("SEMANTIC_CACHE_IVFFLAT_MIN_ROWS", "10000"))
+# Must match the vector(...) dimension of Query.embedding in schema.prisma.
+EMBEDDING_DIM = 256
+NGRAM_SIZE = 3
+
+
+class SemanticMatch(BaseModel):
+    """
+    A previously answered query whose text is close enough to reuse its response.
+    """
+
+    query_id: str
+    routed_to_model: str
+    response: str
+    similarity: float
+
+
+def embed(query_text: str) -> np.ndarray:
+    """
+    Embeds query text as a hashed bag of character n-grams and words.
+
+    The embedding is computed locally without any model or network call. Every character
+    trigram and every word of the normalized text is hashed into one of EMBEDDING_DIM buckets
+    with a hash-derived sign, and the result is L2-normalized so that the dot product of two
+    embeddings is their cosine similarity.
+
+    Args:
+        query_text (str): The raw query text.
+
+    Returns:
+        np.ndarray: A unit-length float32 vector of size EMBEDDING_DIM.
+    """
+    text = project.response_cache.normalize_query_text(query_text)
+    padded = f" {text} "
+    features = [padded[i : i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)]
+    features.extend(f"w:{word}" for word in text.split())
+    if not features:
+        return np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    hashes = np.fromiter(
+        (zlib.crc32(feature.encode("utf-8")) for feature in features),
+        dtype=np.uint32,
+        count=len(features),
+    )
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+    vector = np.bincount(
+        hashes % EMBEDDING_DIM, weights=signs, minlength=EMBEDDING_DIM
+    ).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def to_pgvector(vector: np.ndarray) -> str:
+    """
+    Formats an embedding as a pgvector text literal, e.g. "[0.1,0.2]".
+    """
+    return "[" + ",".join(f"{value:.6f}" for value in vector.tolist()) + "]"
+
+
+async def lookup(query_text: str) -> Optional[SemanticMatch]:
+    """
+    Finds the nearest previously answered query by cosine similarity.
+
+    Uses the ANN index on Query.embedding, so the lookup stays fast on large tables.
+
+    Args:
+        query_text (str): The raw query text.
+
+    Returns:
+        Optional[SemanticMatch]: The nearest answered query if its similarity reaches SEMANTIC_CACHE_THRESHOLD, otherwise None.
+    """
+    vector = embed(query_text)
+    if not vector.any():
+        return None
+    row = await prisma.get_client().query_first(
+        'SELECT id, "routedToModel", response, '
+        "1 - (embedding <=> $1::vector) AS similarity "
+        'FROM "Query" '
+        "WHERE embedding IS NOT NULL "
+        "ORDER BY embedding <=> $1::vector "
+        "LIMIT 1",
+        to_pgvector(vector),
+    )
+    if (
+        row is None
+        or row.get("response") is None
+        or row.get("similarity") is None
+        or row["similarity"] < SIMILARITY_THRESHOLD
+    ):
+        return None
+    return SemanticMatch(
+        query_id=row["id"],
+        routed_to_model=row.get("routedToModel") or "Unknown",
+        response=row["response"],
+        similarity=row["similarity"],
+    )
+
+
+_awaiting_flush: Dict[str, str] = {}
+
+
+async def _store_embedding(query_id: str, query_text: str) -> None:
+    await prisma.get_client().execute_raw(
+        'UPDATE "Query" SET embedding = $1::vector WHERE id = $2',
+        to_pgvector(embed(query_text)),
+        query_id,
+    )
+
+
+async def _on_rows_flushed(query_ids: List[str]) -> None:
+    for query_id in query_ids:
+        query_text = _awaiting_flush.pop(query_id, None)
+        if query_text is not None:
+            await _store_embedding(query_id, query_text)
+
+
+async def remember(query_id: str, query_text: str) -> None:
+    """
+    Stores the embedding of an answered query so later similar queries can reuse its response.
+
+    If the Query row is still waiting in the write-behind buffer, the embedding is stored as
+    soon as the row has been written.
+
+    Args:
+        query_id (str): The ID of the answered Query row.
+        query_text (str): The raw query text.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    if project.query_writer.get_pending(query_id) is not None:
+        _awaiting_flush[query_id] = query_text
+        return
+    await _store_embedding(query_id, query_text)
+
+
+def ivfflat_lists(rows: int) -> int:
+    """
+    Returns the number of ivfflat lists pgvector recommends for a table of `rows` vectors:
+    rows / 1000 up to a million rows, and the square root of rows beyond.
+    """
+    if rows <= 1_000_000:
+        return max(rows // 1000, 1)
+    return int(math.sqrt(rows))
+
+
+async def _create_ivfflat_index(client: prisma.Prisma) -> None:
+    row = await client.query_first(
+        'SELECT count(*)::int AS rows FROM "Query" WHERE embedding IS NOT NULL'
+    )
+    rows = (row or {}).get("rows") or 0
+    if rows < IVFFLAT_MIN_ROWS:
+        logger.info(
+            "Not building the ivfflat index on %d embedded queries; it is built on a later "
+            "start once there are %d",
+            rows,
+            IVFFLAT_MIN_ROWS,
+        )
+        return
+    await client.execute_raw(
+        'CREATE INDEX IF NOT EXISTS "Query_embedding_ivfflat_idx" ON "Query" '
+        f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {ivfflat_lists(rows)})"
+    )
+
+
+async def start() -> None:
+    """
+    Prepares the pgvector extension and ANN index if the semantic cache is enabled.
+
+    An HNSW index is created by default. With SEMANTIC_CACHE_INDEX=ivfflat the index is only
+    built once SEMANTIC_CACHE_IVFFLAT_MIN_ROWS queries have embeddings, with its number of
+    lists derived from that count; drop it to rebuild it after the cache has grown a lot.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    client = prisma.get_client()
+    await client.execute_raw("CREATE EXTENSION IF NOT EXISTS vector")
+    if INDEX_METHOD == "ivfflat":
+        await _create_ivfflat_index(client)
+    else:
+        await client.execute_raw(
+            'CREATE INDEX IF NOT EXISTS "Query_embedding_hnsw_idx" ON "Query" '
+            "USING hnsw (embedding vector_cosine_ops)"
+        )
+    project.query_writer.add_flush_listener(_on_rows_flushed)
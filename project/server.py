@@ -1,55 +1,163 @@
 import logging
+import math
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 
 import prisma
 import prisma.enums
 import project.allocate_query_service
 import project.analyze_query_complexity_service
+import project.api_keys
+import project.budget_governor
+import project.financial_ledger
+import project.health_sampler
+import project.hedged_dispatch
+import project.manage_api_keys_service
 import project.manage_user_accounts_service
+import project.metrics
+import project.model_catalog
+import project.model_estimates
+import project.model_providers
+import project.model_usage_dashboard_service
 import project.monitor_system_health_service
 import project.process_query_service
+import project.query_history_service
+import project.query_partitions
+import project.query_workers
+import project.query_writer
+import project.rate_limits
+import project.refresh_model_catalog_service
+import project.response_cache
 import project.retrieve_query_result_service
+import project.semantic_cache
 import project.submit_feedback_service
 import project.submit_query_service
 import project.track_financial_metrics_service
+import project.usage_rollup
 import project.view_feedback_service
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
-from prisma import Prisma
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
+db_client = project.metrics.InstrumentedPrisma(auto_register=True)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await db_client.connect()
+    try:
+        await project.model_catalog.refresh()
+    except Exception:
+        logger.exception("Failed to warm the AI model catalog")
+    await project.api_keys.start()
+    await project.query_partitions.start()
+    await project.financial_ledger.start()
+    await project.query_writer.start()
+    await project.semantic_cache.start()
+    await project.health_sampler.start()
+    await project.model_estimates.start()
+    await project.usage_rollup.start()
+    await project.query_workers.start()
     yield
+    await project.query_workers.stop()
+    await project.usage_rollup.stop()
+    await project.model_estimates.stop()
+    await project.health_sampler.stop()
+    await project.model_providers.stop()
+    await project.query_writer.stop()
+    await project.financial_ledger.stop()
+    await project.query_partitions.stop()
+    await project.api_keys.stop()
     await db_client.disconnect()
 
 
 app = FastAPI(
     title="Prompt Router",
     lifespan=lifespan,
+    dependencies=[Depends(project.api_keys.authenticate)],
     description="The project aims to build an automatic query-routing interface that intelligently routes queries to the most suitable AI model (GPT-4 Turbo, Claude 3 Opus, Gemini 1.5 Pro, or others) based on the query's complexity, the need for efficiency, and cost considerations. The system prioritizes high-quality responses while minimizing latency and keeping within a budget of up to $5,000 per month. Through the user interviews, we've identified the necessity for handling 10K queries per month, with a demand for prompt responses. The choice of model varies with the task: complex NLP tasks will utilise GPT-4 Turbo for its superior understanding and generation capabilities; Claude 3 Opus is preferred for engaging content creation with a focus on moderation and safety; and Gemini 1.5 Pro will serve specific domains requiring up-to-date industry knowledge. Strategies for reducing costs include examining various aspects like accuracy, uniqueness, and information timeliness. Additionally, techniques for lowering latency were discussed, suggesting the use of caching, CDNs, database optimization, and other performance-tuning methods. The technical stack for implementing this solution includes Python for programming, FastAPI for the API framework, PostgreSQL for the database, and Prisma for the ORM. This stack was chosen for its responsiveness, scalability, and developer-friendly nature, which aligns with our goals of creating a fast, reliable, and cost-effective query-routing interface.",
 )
 
 
+def rate_limited(error: project.rate_limits.RateLimitExceededError) -> Response:
+    """
+    Answers a request that is over its rate limit with 429 and when to retry.
+    """
+    return JSONResponse(
+        content={"error": str(error)},
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+def budget_exceeded(error: project.budget_governor.BudgetExceededError) -> Response:
+    """
+    Answers a query the monthly budget does not admit with 503, to be retried next billing month.
+    """
+    now = datetime.now(timezone.utc)
+    next_month = project.financial_ledger.billing_month_start(
+        project.financial_ledger.billing_month_start(now) + timedelta(days=32)
+    )
+    return JSONResponse(
+        content={"error": str(error)},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil((next_month - now).total_seconds()))},
+    )
+
+
+def forbidden(error: PermissionError) -> Response:
+    """
+    Answers an authenticated request that may not act on the resource it names with 403.
+    """
+    return JSONResponse(content={"error": str(error)}, status_code=403)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next) -> Response:
+    return await project.metrics.observe_request(request, call_next)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def api_get_metrics() -> PlainTextResponse:
+    """
+    Exposes per-route latency histograms and database usage in the Prometheus text format.
+    """
+    return PlainTextResponse(
+        project.metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.post(
     "/query/submit", response_model=project.submit_query_service.SubmitQueryResponse
 )
 async def api_post_submit_query(
-    userId: str, queryText: str
+    queryText: str,
+    userId: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
 ) -> project.submit_query_service.SubmitQueryResponse | Response:
     """
     Allows users to submit queries directly through the web UI.
     """
     try:
-        res = await project.submit_query_service.submit_query(userId, queryText)
+        res = await project.submit_query_service.submit_query(
+            project.api_keys.acting_user_id(principal, userId), queryText
+        )
         return res
+    except project.rate_limits.RateLimitExceededError as e:
+        return rate_limited(e)
+    except PermissionError as e:
+        return forbidden(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -66,16 +174,54 @@ async def api_post_submit_query(
     response_model=project.analyze_query_complexity_service.AnalyzeQueryComplexityResponse,
 )
 async def api_post_analyze_query_complexity(
-    query_text: str, user_id: str
+    query_text: str,
+    user_id: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
 ) -> project.analyze_query_complexity_service.AnalyzeQueryComplexityResponse | Response:
     """
     Analyzes the complexity of a user-submitted query and categorizes it accordingly.
     """
     try:
         res = await project.analyze_query_complexity_service.analyze_query_complexity(
-            query_text, user_id
+            query_text, project.api_keys.acting_user_id(principal, user_id)
+        )
+        return res
+    except PermissionError as e:
+        return forbidden(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/query/analyze/batch",
+    response_model=project.analyze_query_complexity_service.AnalyzeQueryComplexityBatchResponse,
+)
+async def api_post_analyze_query_complexity_batch(
+    query_texts: List[str],
+    user_id: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> project.analyze_query_complexity_service.AnalyzeQueryComplexityBatchResponse | Response:
+    """
+    Analyzes the complexity of a batch of user-submitted queries and stores them in one bulk insert.
+    """
+    try:
+        res = await project.analyze_query_complexity_service.analyze_query_complexity_batch(
+            query_texts, project.api_keys.acting_user_id(principal, user_id)
         )
         return res
+    except PermissionError as e:
+        return forbidden(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -92,16 +238,25 @@ async def api_post_analyze_query_complexity(
     response_model=project.submit_feedback_service.SubmitFeedbackResponse,
 )
 async def api_post_submit_feedback(
-    userId: Optional[str], content: str, queryId: Optional[str]
+    userId: Optional[str],
+    content: str,
+    queryId: Optional[str],
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
 ) -> project.submit_feedback_service.SubmitFeedbackResponse | Response:
     """
     Endpoint to allow users to submit feedback about the system.
     """
     try:
         res = await project.submit_feedback_service.submit_feedback(
-            userId, content, queryId
+            project.api_keys.acting_user_id(principal, userId, required=False),
+            content,
+            queryId,
         )
         return res
+    except PermissionError as e:
+        return forbidden(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -118,15 +273,51 @@ async def api_post_submit_feedback(
     response_model=project.allocate_query_service.AllocateQueryResponse,
 )
 async def api_post_allocate_query(
-    query_text: str, user_id: str, complexity_score: float, preferred_models: List[str]
+    query_text: str,
+    complexity_score: float,
+    preferred_models: List[str],
+    user_id: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
 ) -> project.allocate_query_service.AllocateQueryResponse | Response:
     """
     Allocates a user query to the best-suited AI model based on current performance, cost metrics, and remaining budget.
     """
     try:
         res = await project.allocate_query_service.allocate_query(
-            query_text, user_id, complexity_score, preferred_models
+            query_text,
+            project.api_keys.acting_user_id(principal, user_id),
+            complexity_score,
+            preferred_models,
+        )
+        return res
+    except project.budget_governor.BudgetExceededError as e:
+        return budget_exceeded(e)
+    except PermissionError as e:
+        return forbidden(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
         )
+
+
+@app.post(
+    "/models/refresh",
+    response_model=project.refresh_model_catalog_service.RefreshModelCatalogResponse,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_post_refresh_model_catalog() -> project.refresh_model_catalog_service.RefreshModelCatalogResponse | Response:
+    """
+    Reloads the in-memory AI model catalog after an admin changed the AIModel table.
+    """
+    try:
+        res = await project.refresh_model_catalog_service.refresh_model_catalog()
         return res
     except Exception as e:
         logger.exception("Error processing request")
@@ -142,6 +333,7 @@ async def api_post_allocate_query(
 @app.put(
     "/user/manage/{userId}",
     response_model=project.manage_user_accounts_service.ManageUserAccountsResponse,
+    dependencies=[Depends(project.api_keys.require_admin)],
 )
 async def api_put_manage_user_accounts(
     newRole: prisma.enums.UserRole, userId: str, isActive: Optional[bool]
@@ -151,9 +343,70 @@ async def api_put_manage_user_accounts(
     """
     try:
         res = await project.manage_user_accounts_service.manage_user_accounts(
-            newRole, userId, isActive
+            userId, newRole, isActive
+        )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/user/{userId}/api-keys",
+    response_model=project.manage_api_keys_service.IssueApiKeyResponse,
+)
+async def api_post_issue_api_key(
+    userId: str,
+    validDays: int = project.manage_api_keys_service.DEFAULT_VALID_DAYS,
+    principal: project.api_keys.ApiKeyPrincipal = Depends(
+        project.api_keys.require_principal
+    ),
+) -> project.manage_api_keys_service.IssueApiKeyResponse | Response:
+    """
+    Issues a new API key for a user; the key is returned once and stored only as a digest.
+    """
+    try:
+        res = await project.manage_api_keys_service.issue_api_key(
+            userId, validDays, principal
         )
         return res
+    except PermissionError as e:
+        return forbidden(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.delete(
+    "/api-keys/{keyId}",
+    response_model=project.manage_api_keys_service.RevokeApiKeyResponse,
+)
+async def api_delete_revoke_api_key(
+    keyId: str,
+    principal: project.api_keys.ApiKeyPrincipal = Depends(
+        project.api_keys.require_principal
+    ),
+) -> project.manage_api_keys_service.RevokeApiKeyResponse | Response:
+    """
+    Revokes an API key, evicting it from every process's key cache within seconds.
+    """
+    try:
+        res = await project.manage_api_keys_service.revoke_api_key(keyId, principal)
+        return res
+    except PermissionError as e:
+        return forbidden(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -190,6 +443,7 @@ async def api_get_track_financial_metrics() -> project.track_financial_metrics_s
 @app.get(
     "/system/health",
     response_model=project.monitor_system_health_service.SystemHealthResponse,
+    dependencies=[Depends(project.api_keys.require_admin)],
 )
 async def api_get_monitor_system_health() -> project.monitor_system_health_service.SystemHealthResponse | Response:
     """
@@ -209,20 +463,370 @@ async def api_get_monitor_system_health() -> project.monitor_system_health_servi
         )
 
 
+@app.get(
+    "/system/write-behind",
+    response_model=project.query_writer.WriteBehindStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_write_behind_stats() -> project.query_writer.WriteBehindStats | Response:
+    """
+    Reports queue depth, flush throughput and failure counts of the write-behind Query persistence.
+    """
+    try:
+        res = project.query_writer.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/models/estimates",
+    response_model=List[project.model_estimates.ModelEstimate],
+)
+async def api_get_model_estimates() -> List[
+    project.model_estimates.ModelEstimate
+] | Response:
+    """
+    Reports the live latency, p95 latency, cost and error-rate estimates of every model called.
+    """
+    try:
+        res = project.model_estimates.get_estimates()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/system/hedging",
+    response_model=project.hedged_dispatch.HedgingStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_hedging_stats() -> project.hedged_dispatch.HedgingStats | Response:
+    """
+    Reports hedging and failover counters and which model circuit breakers are open.
+    """
+    try:
+        res = project.hedged_dispatch.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/system/api-keys",
+    response_model=project.api_keys.ApiKeyCacheStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_api_key_cache_stats() -> project.api_keys.ApiKeyCacheStats | Response:
+    """
+    Reports how often API keys were verified from the in-memory cache.
+    """
+    try:
+        res = project.api_keys.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/dashboard/models/hourly",
+    response_model=project.model_usage_dashboard_service.ModelUsageDashboardResponse,
+)
+async def api_get_model_usage_dashboard(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    modelName: Optional[str] = None,
+) -> project.model_usage_dashboard_service.ModelUsageDashboardResponse | Response:
+    """
+    Charts cost, error rate and latency percentiles per model and hour from the hourly rollup.
+    """
+    try:
+        res = await project.model_usage_dashboard_service.model_usage_dashboard(
+            start, end, modelName
+        )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/system/usage-rollup",
+    response_model=project.usage_rollup.UsageRollupStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_usage_rollup_stats() -> project.usage_rollup.UsageRollupStats | Response:
+    """
+    Reports when the hourly model usage rollup last ran and how long it took.
+    """
+    try:
+        res = project.usage_rollup.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/system/usage-rollup",
+    response_model=project.usage_rollup.UsageRollupStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_post_usage_rollup(
+    since: Optional[datetime] = None,
+) -> project.usage_rollup.UsageRollupStats | Response:
+    """
+    Recomputes the hourly model usage rollup now, from `since` to backfill older hours.
+    """
+    try:
+        await project.usage_rollup.rollup(since)
+        res = project.usage_rollup.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/system/rate-limits",
+    response_model=project.rate_limits.RateLimitStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_rate_limit_stats() -> project.rate_limits.RateLimitStats | Response:
+    """
+    Reports how many requests the per-user and per-plan rate limits let through or turned away.
+    """
+    try:
+        res = project.rate_limits.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/system/workers",
+    response_model=project.query_workers.WorkerPoolStats,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_worker_stats() -> project.query_workers.WorkerPoolStats | Response:
+    """
+    Reports backlog, throughput and failure counts of the background query workers.
+    """
+    try:
+        res = project.query_workers.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/query/cache/stats",
+    response_model=project.response_cache.ResponseCacheStats,
+)
+async def api_get_response_cache_stats() -> project.response_cache.ResponseCacheStats | Response:
+    """
+    Reports hit, miss and eviction counters of the query response cache.
+    """
+    try:
+        res = project.response_cache.get_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/query/submit/bulk",
+    response_model=project.submit_query_service.BulkSubmitQueryResponse,
+)
+async def api_post_submit_queries(
+    queryTexts: List[str],
+    userId: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> project.submit_query_service.BulkSubmitQueryResponse | Response:
+    """
+    Submits a batch of queries with one bulk insert, reporting success or failure per query.
+    """
+    try:
+        res = await project.submit_query_service.submit_queries(
+            project.api_keys.acting_user_id(principal, userId), queryTexts
+        )
+        return res
+    except project.rate_limits.RateLimitExceededError as e:
+        return rate_limited(e)
+    except PermissionError as e:
+        return forbidden(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/query/result/bulk",
+    response_model=project.retrieve_query_result_service.BulkRetrieveQueryResultResponse,
+)
+async def api_post_retrieve_query_results(
+    queryIds: List[str],
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> project.retrieve_query_result_service.BulkRetrieveQueryResultResponse | Response:
+    """
+    Retrieves the results of a batch of queries with one database read, reporting missing IDs per item.
+    """
+    try:
+        res = await project.retrieve_query_result_service.retrieve_query_results(
+            queryIds, project.api_keys.restricted_user_id(principal)
+        )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
 @app.post(
     "/query/process", response_model=project.process_query_service.ProcessQueryResponse
 )
 async def api_post_process_query(
-    queryText: str, userId: str, sessionId: Optional[str]
+    queryText: str,
+    sessionId: Optional[str],
+    userId: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
 ) -> project.process_query_service.ProcessQueryResponse | Response:
     """
     Processes a user query for complexity analysis and model allocation, ensuring the fastest response time.
     """
     try:
         res = await project.process_query_service.process_query(
-            queryText, userId, sessionId
+            queryText, project.api_keys.acting_user_id(principal, userId), sessionId
         )
         return res
+    except project.rate_limits.RateLimitExceededError as e:
+        return rate_limited(e)
+    except project.budget_governor.BudgetExceededError as e:
+        return budget_exceeded(e)
+    except PermissionError as e:
+        return forbidden(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post("/query/process/stream", response_model=None)
+async def api_post_process_query_stream(
+    queryText: str,
+    userId: Optional[str] = None,
+    sessionId: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> StreamingResponse | Response:
+    """
+    Processes a user query and streams the model's answer as server-sent events.
+    """
+    try:
+        events = await project.process_query_service.process_query_stream(
+            queryText, project.api_keys.acting_user_id(principal, userId), sessionId
+        )
+        return StreamingResponse(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except project.rate_limits.RateLimitExceededError as e:
+        return rate_limited(e)
+    except project.budget_governor.BudgetExceededError as e:
+        return budget_exceeded(e)
+    except PermissionError as e:
+        return forbidden(e)
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -240,12 +844,29 @@ async def api_post_process_query(
 )
 async def api_get_retrieve_query_result(
     queryId: str,
+    wait: float = 0,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
 ) -> project.retrieve_query_result_service.RetrieveQueryResultResponse | Response:
     """
     Retrieves the results of processed queries for the user.
+
+    With `wait` > 0 the request long-polls: it returns as soon as the query completes or fails,
+    or after `wait` seconds (capped at QUERY_RESULT_MAX_WAIT_SECONDS) with its current state.
     """
+    user_id = project.api_keys.restricted_user_id(principal)
     try:
-        res = await project.retrieve_query_result_service.retrieve_query_result(queryId)
+        if wait > 0:
+            res = await project.retrieve_query_result_service.wait_for_query_result(
+                queryId,
+                min(wait, project.retrieve_query_result_service.MAX_WAIT_SECONDS),
+                user_id,
+            )
+        else:
+            res = await project.retrieve_query_result_service.retrieve_query_result(
+                queryId, user_id
+            )
         return res
     except Exception as e:
         logger.exception("Error processing request")
@@ -258,15 +879,100 @@ async def api_get_retrieve_query_result(
         )
 
 
+@app.websocket("/query/result/{queryId}/ws")
+async def api_websocket_query_result(
+    websocket: WebSocket,
+    queryId: str,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> None:
+    """
+    Sends the result of a query over a WebSocket as soon as it completes or fails, then closes.
+    """
+    await websocket.accept()
+    try:
+        res = await project.retrieve_query_result_service.wait_for_query_result(
+            queryId,
+            project.retrieve_query_result_service.MAX_WEBSOCKET_WAIT_SECONDS,
+            project.api_keys.restricted_user_id(principal),
+        )
+        await websocket.send_json(jsonable_encoder(res))
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        logger.exception("Error processing request")
+        await websocket.send_json({"error": str(e)})
+    await websocket.close()
+
+
 @app.get(
-    "/feedback/view", response_model=project.view_feedback_service.ViewFeedbackResponse
+    "/query/history/user/{userId}",
+    response_model=project.query_history_service.QueryHistoryResponse,
 )
-async def api_get_view_feedback() -> project.view_feedback_service.ViewFeedbackResponse | Response:
+async def api_get_query_history_by_user(
+    userId: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = project.query_history_service.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> project.query_history_service.QueryHistoryResponse | Response:
     """
-    Allows admins to view collected feedback for analysis.
+    Lists a user's queries within a time window, newest first, one keyset-paginated page at a time.
     """
     try:
-        res = await project.view_feedback_service.view_feedback()
+        res = await project.query_history_service.query_history_by_user(
+            project.api_keys.acting_user_id(principal, userId),
+            start,
+            end,
+            limit,
+            cursor,
+        )
+        return res
+    except PermissionError as e:
+        return forbidden(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/query/history/model/{modelName}",
+    response_model=project.query_history_service.QueryHistoryResponse,
+)
+async def api_get_query_history_by_model(
+    modelName: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = project.query_history_service.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    principal: Optional[project.api_keys.ApiKeyPrincipal] = Depends(
+        project.api_keys.authenticate
+    ),
+) -> project.query_history_service.QueryHistoryResponse | Response:
+    """
+    Lists the queries routed to a model within a time window, newest first, one keyset-paginated page at a time.
+
+    A key of a non-admin user only lists that user's queries.
+    """
+    try:
+        res = await project.query_history_service.query_history_by_model(
+            modelName,
+            start,
+            end,
+            limit,
+            cursor,
+            project.api_keys.restricted_user_id(principal),
+        )
         return res
     except Exception as e:
         logger.exception("Error processing request")
@@ -277,3 +983,51 @@ async def api_get_view_feedback() -> project.view_feedback_service.ViewFeedbackR
             status_code=500,
             media_type="application/json",
         )
+
+
+@app.get(
+    "/feedback/view",
+    response_model=project.view_feedback_service.ViewFeedbackResponse,
+    dependencies=[Depends(project.api_keys.require_admin)],
+)
+async def api_get_view_feedback(
+    limit: int = project.view_feedback_service.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    userId: Optional[str] = None,
+    queryId: Optional[str] = None,
+) -> project.view_feedback_service.ViewFeedbackResponse | Response:
+    """
+    Allows admins to view collected feedback for analysis, one keyset-paginated page at a time.
+    """
+    try:
+        res = await project.view_feedback_service.view_feedback(
+            limit, cursor, start, end, userId, queryId
+        )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get("/feedback/export", dependencies=[Depends(project.api_keys.require_admin)])
+async def api_get_export_feedback(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    userId: Optional[str] = None,
+    queryId: Optional[str] = None,
+) -> StreamingResponse:
+    """
+    Streams all matching feedback as newline-delimited JSON for offline analysis.
+    """
+    return StreamingResponse(
+        project.view_feedback_service.export_feedback(start, end, userId, queryId),
+        media_type="application/x-ndjson",
+    )
@@ -1,7 +1,18 @@
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
 import prisma
+import prisma.enums
 import prisma.models
+import project.query_workers
+import project.query_writer
+import project.rate_limits
+import project.user_plans
 from pydantic import BaseModel
 
+MAX_BULK_SIZE = 1000
+
 
 class SubmitQueryResponse(BaseModel):
     """
@@ -12,10 +23,33 @@ class SubmitQueryResponse(BaseModel):
     message: str = "Query successfully submitted. Track it with the provided ID."
 
 
+class BulkSubmitItemResult(BaseModel):
+    """
+    The outcome of submitting one query of a bulk submission.
+    """
+
+    index: int
+    queryId: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkSubmitQueryResponse(BaseModel):
+    """
+    The outcome of a bulk submission, one item per query text in the order they were submitted.
+    """
+
+    results: List[BulkSubmitItemResult]
+    submitted: int
+    failed: int
+
+
 async def submit_query(userId: str, queryText: str) -> SubmitQueryResponse:
     """
     Allows users to submit queries directly through the web UI.
 
+    The query is stored as QUEUED with the priority of the user's subscription plan and answered
+    later by the background query workers.
+
     Args:
         userId (str): The unique identifier of the user submitting the query.
         queryText (str): The actual text of the query that the user wants to submit.
@@ -23,14 +57,85 @@ async def submit_query(userId: str, queryText: str) -> SubmitQueryResponse:
     Returns:
         SubmitQueryResponse: This model provides feedback to the user about the successful reception of their query including a unique queryId and a confirmation message.
 
+    Raises:
+        project.rate_limits.RateLimitExceededError: If the user or their plan is over its rate limit.
+
     Example:
         asyncio.run(submit_query("example-user-id", "What is the current stock price of XYZ corporation?"))
         > SubmitQueryResponse(queryId="generated-query-id", message="Query successfully submitted. Track it with the provided ID.")
     """
-    query = await prisma.models.Query.prisma().create(
-        data={"queryText": queryText, "userId": userId}
+    await project.rate_limits.acquire(userId)
+    priority = await project.user_plans.get_priority(userId)
+    query_id = await project.query_writer.create_query(
+        {
+            "queryText": queryText,
+            "userId": userId,
+            "status": prisma.enums.QueryStatus.QUEUED,
+            "submitted": True,
+            "priority": priority,
+        }
     )
+    project.query_workers.submitted(query_id, queryText, userId, priority)
     return SubmitQueryResponse(
-        queryId=query.id,
+        queryId=query_id,
         message="Query successfully submitted. Track it with the provided ID.",
     )
+
+
+async def submit_queries(userId: str, queryTexts: List[str]) -> BulkSubmitQueryResponse:
+    """
+    Submits many queries at once with a single bulk insert.
+
+    Blank query texts are rejected per item; the rest are stored with one `create_many` and handed
+    to the background query workers. If the insert fails, every query in it reports the error.
+
+    Args:
+        userId (str): The unique identifier of the user submitting the queries.
+        queryTexts (List[str]): The texts of the queries, at most MAX_BULK_SIZE.
+
+    Returns:
+        BulkSubmitQueryResponse: One item per query text with its queryId or error.
+
+    Raises:
+        project.rate_limits.RateLimitExceededError: If the batch does not fit the user's or their
+            plan's rate limit; each query in it counts as one request.
+    """
+    if len(queryTexts) > MAX_BULK_SIZE:
+        raise ValueError(
+            f"Batch of {len(queryTexts)} queries exceeds the limit of {MAX_BULK_SIZE}."
+        )
+    await project.rate_limits.acquire(userId, len(queryTexts))
+    priority = await project.user_plans.get_priority(userId)
+    created_at = datetime.now(timezone.utc)
+    results = [BulkSubmitItemResult(index=i) for i in range(len(queryTexts))]
+    rows = []
+    for item, query_text in zip(results, queryTexts):
+        if not query_text.strip():
+            item.error = "Query text is empty."
+            continue
+        item.queryId = str(uuid.uuid4())
+        rows.append(
+            {
+                "id": item.queryId,
+                "createdAt": created_at,
+                "queryText": query_text,
+                "userId": userId,
+                "status": prisma.enums.QueryStatus.QUEUED,
+                "submitted": True,
+                "priority": priority,
+            }
+        )
+    if rows:
+        try:
+            await prisma.models.Query.prisma().create_many(data=rows)
+        except Exception as e:
+            for item in results:
+                if item.queryId is not None:
+                    item.queryId = None
+                    item.error = f"Failed to store query: {e}"
+            rows = []
+    for row in rows:
+        project.query_workers.submitted(row["id"], row["queryText"], userId, priority)
+    return BulkSubmitQueryResponse(
+        results=results, submitted=len(rows), failed=len(results) - len(rows)
+    )
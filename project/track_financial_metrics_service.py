@@ -1,8 +1,8 @@
-from typing import List
+from typing import Dict, List
 
-import prisma
-import prisma.models
-from pydantic import BaseModel
+import project.budget_governor
+import project.financial_ledger
+from pydantic import BaseModel, Field
 
 
 class FinanceMetricsResponse(BaseModel):
@@ -16,6 +16,11 @@ class FinanceMetricsResponse(BaseModel):
     costPerQuery: float
     budgetAlerts: List[str]
     financialHealthScore: float
+    billingMonth: str = ""
+    queryCount: int = 0
+    expenditureByModel: Dict[str, float] = Field(default_factory=dict)
+    reservedCost: float = 0.0
+    budgetState: str = "normal"
 
 
 async def track_financial_metrics() -> FinanceMetricsResponse:
@@ -24,21 +29,21 @@ async def track_financial_metrics() -> FinanceMetricsResponse:
 
     This function computes various key financial metrics such as total expenditure, monthly budget, remaining budget,
     average cost per query, budget alerts if thresholds are exceeded, and an overall financial health score.
+    The remaining budget excludes the expected cost reserved by queries still being answered, and the
+    budget state reports which regime of the budget governor is in force.
+    All figures cover the current billing month and are read from the in-process financial ledger,
+    so this takes constant time regardless of how many queries are stored.
 
     Returns:
         FinanceMetricsResponse: Defines the structure of the response containing various financial metrics important for administration and financial oversight. This encapsulates expenditures, budget status, and other relevant financial data to inform strategic financial decisions.
     """
-    monthly_budget = 5000
+    ledger = project.financial_ledger.get_ledger()
+    ledger.roll_over()
+    monthly_budget = project.financial_ledger.MONTHLY_BUDGET
     budget_alert_threshold = 500
-    total_expenditure = sum(
-        (
-            query.cost
-            for query in await prisma.models.Query.prisma().find_many()
-            if query.cost
-        )
-    )
-    remaining_budget = monthly_budget - total_expenditure
-    total_queries = await prisma.models.Query.prisma().count()
+    total_expenditure = ledger.total.cost
+    remaining_budget = ledger.remaining_budget()
+    total_queries = ledger.total.count
     cost_per_query = total_expenditure / total_queries if total_queries else 0
     budget_alerts = (
         ["Remaining budget is below threshold."]
@@ -55,4 +60,11 @@ async def track_financial_metrics() -> FinanceMetricsResponse:
         costPerQuery=cost_per_query,
         budgetAlerts=budget_alerts,
         financialHealthScore=financial_health_score,
+        billingMonth=ledger.month_start.strftime("%Y-%m"),
+        queryCount=total_queries,
+        expenditureByModel={
+            model: totals.cost for model, totals in ledger.by_model.items()
+        },
+        reservedCost=ledger.reserved,
+        budgetState=project.budget_governor.state(),
     )
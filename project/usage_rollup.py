@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import prisma
+import project.model_estimates
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("USAGE_ROLLUP_INTERVAL_SECONDS", "60"))
+# Queries are folded into the hour they were created in, but finish later; every run
+# recomputes this many recent hours so that late completions and retries are counted.
+LOOKBACK_HOURS = int(os.getenv("USAGE_ROLLUP_LOOKBACK_HOURS", "3"))
+LATENCY_BUCKETS_MS = project.model_estimates.LATENCY_BUCKETS_MS
+
+
+class UsageRollupStats(BaseModel):
+    """
+    Progress of the hourly per-model usage rollup.
+    """
+
+    running: bool
+    runs: int
+    failures: int
+    rows_written: int
+    last_run_at: Optional[datetime] = None
+    last_run_ms: Optional[float] = None
+
+
+def _rollup_sql() -> str:
+    # width_bucket counts the bounds at or below a latency, so a latency exactly on a bound
+    # lands one bucket higher than in metrics.Histogram; the quantiles barely move.
+    bounds = ", ".join(repr(float(bound)) for bound in LATENCY_BUCKETS_MS)
+    buckets = ", ".join(
+        f'count(*) FILTER (WHERE "bucket" = {i})'
+        for i in range(len(LATENCY_BUCKETS_MS) + 1)
+    )
+    return f"""
+        INSERT INTO "ModelUsageHourly" (
+            "hour", "modelName", "queries", "errors", "cost", "latencySum",
+            "latencyBuckets", "updatedAt"
+        )
+        SELECT
+            "hour",
+            "modelName",
+            count(*) FILTER (WHERE "status" = 'COMPLETED'),
+            count(*) FILTER (WHERE "status" = 'FAILED'),
+            coalesce(sum("cost") FILTER (WHERE "status" = 'COMPLETED'), 0),
+            coalesce(sum("latency") FILTER (WHERE "status" = 'COMPLETED'), 0),
+            ARRAY[{buckets}]::integer[],
+            now()
+        FROM (
+            SELECT
+                date_trunc('hour', "createdAt") AS "hour",
+                "routedToModel" AS "modelName",
+                "status",
+                "cost",
+                "latency",
+                CASE WHEN "status" = 'COMPLETED' AND "latency" IS NOT NULL
+                    THEN width_bucket("latency", ARRAY[{bounds}]::float8[])
+                END AS "bucket"
+            FROM "Query"
+            WHERE "createdAt" >= $1::timestamp
+              AND "routedToModel" IS NOT NULL
+              AND "status" IN ('COMPLETED', 'FAILED')
+        ) AS "finished"
+        GROUP BY "hour", "modelName"
+        ON CONFLICT ("hour", "modelName") DO UPDATE SET
+            "queries" = EXCLUDED."queries",
+            "errors" = EXCLUDED."errors",
+            "cost" = EXCLUDED."cost",
+            "latencySum" = EXCLUDED."latencySum",
+            "latencyBuckets" = EXCLUDED."latencyBuckets",
+            "updatedAt" = EXCLUDED."updatedAt"
+    """
+
+
+class UsageRollup:
+    """
+    Folds finished Query rows into ModelUsageHourly, one row per model and hour.
+
+    Every `interval` seconds the hours from `lookback_hours` ago onwards are recomputed from
+    Query in one INSERT ... SELECT ... ON CONFLICT statement, which reads only those hours
+    through the createdAt index or partitions and replaces their rollup rows. Recomputing
+    instead of adding makes a run idempotent, so several processes may run it at once and a
+    failed run is simply repeated. `rollup(since)` backfills older hours the same way.
+    """
+
+    def __init__(
+        self,
+        interval: float = ROLLUP_INTERVAL_SECONDS,
+        lookback_hours: int = LOOKBACK_HOURS,
+    ) -> None:
+        self.interval = interval
+        self.lookback_hours = lookback_hours
+        self._sql = _rollup_sql()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"runs": 0, "failures": 0, "rows_written": 0}
+        self._last_run_at: Optional[datetime] = None
+        self._last_run_ms: Optional[float] = None
+
+    async def rollup(self, since: Optional[datetime] = None) -> int:
+        """
+        Recomputes the rollup rows of every hour from `since` onwards.
+
+        Args:
+            since (Optional[datetime]): The first hour to recompute; defaults to
+                `lookback_hours` before now.
+
+        Returns:
+            int: The number of rollup rows written.
+        """
+        now = datetime.now(timezone.utc)
+        if since is None:
+            since = now - timedelta(hours=self.lookback_hours)
+        elif since.tzinfo is not None:
+            since = since.astimezone(timezone.utc)
+        # Query.createdAt is a UTC timestamp without a time zone.
+        since = since.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+        started = asyncio.get_event_loop().time()
+        written = await prisma.get_client().execute_raw(self._sql, since.isoformat())
+        self._stats["runs"] += 1
+        self._stats["rows_written"] += written
+        self._last_run_at = now
+        self._last_run_ms = (asyncio.get_event_loop().time() - started) * 1000
+        return written
+
+    async def _rollup_forever(self) -> None:
+        while True:
+            try:
+                await self.rollup()
+            except Exception:
+                self._stats["failures"] += 1
+                logger.exception("Failed to roll up model usage")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._rollup_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> UsageRollupStats:
+        return UsageRollupStats(
+            running=self._task is not None,
+            last_run_at=self._last_run_at,
+            last_run_ms=self._last_run_ms,
+            **self._stats,
+        )
+
+
+_rollup = UsageRollup()
+
+
+async def rollup(since: Optional[datetime] = None) -> int:
+    """
+    Recomputes the hourly usage rollup from `since`, or from the usual lookback, until now.
+    """
+    return await _rollup.rollup(since)
+
+
+async def start() -> None:
+    """
+    Starts rolling up model usage on a timer.
+    """
+    await _rollup.start()
+
+
+async def stop() -> None:
+    """
+    Stops the usage rollup timer.
+    """
+    await _rollup.stop()
+
+
+def get_stats() -> UsageRollupStats:
+    """
+    Returns progress of the hourly usage rollup.
+    """
+    return _rollup.stats()
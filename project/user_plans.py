@@ -0,0 +1,99 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import prisma
+import prisma.enums
+import prisma.models
+
+CACHE_TTL_SECONDS = float(os.getenv("USER_PLAN_CACHE_TTL_SECONDS", "60"))
+
+PLAN_PRIORITY: Dict[prisma.enums.SubscriptionPlan, int] = {
+    prisma.enums.SubscriptionPlan.BASIC: 1,
+    prisma.enums.SubscriptionPlan.PREMIUM: 2,
+    prisma.enums.SubscriptionPlan.ENTERPRISE: 3,
+}
+
+# Relative share of the query workers each plan's users get while others are waiting too.
+PLAN_SHARE: Dict[prisma.enums.SubscriptionPlan, float] = {
+    prisma.enums.SubscriptionPlan.BASIC: 1.0,
+    prisma.enums.SubscriptionPlan.PREMIUM: 2.0,
+    prisma.enums.SubscriptionPlan.ENTERPRISE: 4.0,
+}
+NO_PLAN_SHARE = 1.0
+PRIORITY_SHARE: Dict[int, float] = {
+    PLAN_PRIORITY[plan]: share for plan, share in PLAN_SHARE.items()
+}
+
+
+class UserPlanCache:
+    """
+    Caches each user's current subscription plan for `ttl` seconds.
+
+    A user with several active subscriptions gets the highest plan; a user with none gets None.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS) -> None:
+        self.ttl = ttl
+        self._plans: Dict[
+            str, Tuple[float, Optional[prisma.enums.SubscriptionPlan]]
+        ] = {}
+
+    async def get(self, user_id: str) -> Optional[prisma.enums.SubscriptionPlan]:
+        cached = self._plans.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        now = datetime.now(timezone.utc)
+        subscriptions = await prisma.models.Subscription.prisma().find_many(
+            where={
+                "userId": user_id,
+                "validFrom": {"lte": now},
+                "validUntil": {"gte": now},
+            }
+        )
+        plan = max(
+            (subscription.plan for subscription in subscriptions),
+            key=lambda plan: PLAN_PRIORITY.get(plan, 0),
+            default=None,
+        )
+        self._plans[user_id] = (time.monotonic() + self.ttl, plan)
+        return plan
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        if user_id is None:
+            self._plans.clear()
+        else:
+            self._plans.pop(user_id, None)
+
+
+_cache = UserPlanCache()
+
+
+async def get_plan(user_id: str) -> Optional[prisma.enums.SubscriptionPlan]:
+    """
+    Returns the user's current subscription plan, or None if they have no active subscription.
+    """
+    return await _cache.get(user_id)
+
+
+async def get_priority(user_id: str) -> int:
+    """
+    Returns the scheduling priority of the user's queries: 0 without a plan, higher for better plans.
+    """
+    plan = await _cache.get(user_id)
+    return PLAN_PRIORITY.get(plan, 0) if plan is not None else 0
+
+
+def invalidate(user_id: Optional[str] = None) -> None:
+    """
+    Forgets the cached plan of one user, or of every user.
+    """
+    _cache.invalidate(user_id)
+
+
+def share_for_priority(priority: int) -> float:
+    """
+    Returns the fair-share weight of a query with the given scheduling priority.
+    """
+    return PRIORITY_SHARE.get(priority, NO_PLAN_SHARE)
@@ -1,10 +1,15 @@
+import base64
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
 import prisma
 import prisma.models
 from pydantic import BaseModel
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 500
+
 
 class FeedbackDetail(BaseModel):
     """
@@ -14,47 +19,175 @@ class FeedbackDetail(BaseModel):
     id: str
     created_at: datetime
     content: str
-    userId: str
+    userId: Optional[str] = None
     queryId: Optional[str] = None
 
 
 class ViewFeedbackResponse(BaseModel):
     """
-    Response model containing a list of all feedback submitted by users for admin analysis.
+    Response model containing one page of feedback submitted by users for admin analysis, newest first.
     """
 
     feedbacks: List[FeedbackDetail]
+    nextCursor: Optional[str] = None
+
+
+def encode_cursor(created_at: datetime, feedback_id: str) -> str:
+    """
+    Encodes the sort key of the last feedback on a page as an opaque cursor.
+    """
+    raw = f"{created_at.isoformat()}|{feedback_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
 
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Decodes a cursor produced by encode_cursor.
 
-async def view_feedback() -> ViewFeedbackResponse:
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        created_at, feedback_id = (
+            base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        )
+        return datetime.fromisoformat(created_at), feedback_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _build_where(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    userId: Optional[str],
+    queryId: Optional[str],
+    after: Optional[Tuple[datetime, str]],
+) -> dict:
+    conditions: List[dict] = []
+    if start is not None:
+        conditions.append({"createdAt": {"gte": start}})
+    if end is not None:
+        conditions.append({"createdAt": {"lt": end}})
+    if userId is not None:
+        conditions.append({"userId": userId})
+    if queryId is not None:
+        conditions.append({"queryId": queryId})
+    if after is not None:
+        created_at, feedback_id = after
+        conditions.append(
+            {
+                "OR": [
+                    {"createdAt": {"lt": created_at}},
+                    {"createdAt": created_at, "id": {"lt": feedback_id}},
+                ]
+            }
+        )
+    return {"AND": conditions} if conditions else {}
+
+
+async def _fetch_page(
+    limit: int,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    userId: Optional[str],
+    queryId: Optional[str],
+    after: Optional[Tuple[datetime, str]],
+) -> List[prisma.models.Feedback]:
+    return await prisma.models.Feedback.prisma().find_many(
+        where=_build_where(start, end, userId, queryId, after),
+        order=[{"createdAt": "desc"}, {"id": "desc"}],
+        take=limit,
+    )
+
+
+def _to_detail(feedback: prisma.models.Feedback) -> FeedbackDetail:
+    return FeedbackDetail(
+        id=feedback.id,
+        created_at=feedback.createdAt,
+        content=feedback.content,
+        userId=feedback.userId,
+        queryId=feedback.queryId,
+    )
+
+
+async def view_feedback(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    userId: Optional[str] = None,
+    queryId: Optional[str] = None,
+) -> ViewFeedbackResponse:
     """
     Allows admins to view collected feedback for analysis.
 
-    This function retrieves all feedback from the database, including details about the user who submitted each feedback
-    and any associated query, then structures it into a response model for admin analysis.
+    Feedback is returned newest first, one page at a time, using keyset pagination on
+    (createdAt, id): each page ends with a cursor that is passed back to fetch the next one,
+    so deep pages cost the same as the first.
 
     Args:
-        None
+        limit (int): Maximum number of feedback entries to return, at most MAX_PAGE_SIZE.
+        cursor (Optional[str]): The nextCursor of the previous page, or None for the first page.
+        start (Optional[datetime]): Only include feedback created at or after this time.
+        end (Optional[datetime]): Only include feedback created before this time.
+        userId (Optional[str]): Only include feedback submitted by this user.
+        queryId (Optional[str]): Only include feedback about this query.
 
     Returns:
-        ViewFeedbackResponse: Response model containing a list of all feedback submitted by users for admin analysis.
+        ViewFeedbackResponse: Response model containing one page of feedback submitted by users for admin analysis, newest first.
 
     Example:
-        view_feedback()
-        > <ViewFeedbackResponse object>  # Contains a populated list of feedback details for analysis
+        view_feedback(limit=50)
+        > <ViewFeedbackResponse object>  # Contains up to 50 feedback details and a cursor for the next page
     """
-    feedback_records = await prisma.models.Feedback.prisma().find_many(
-        include={"user": True, "query": True}
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    after = decode_cursor(cursor) if cursor else None
+    feedback_records = await _fetch_page(limit + 1, start, end, userId, queryId, after)
+    next_cursor = None
+    if len(feedback_records) > limit:
+        feedback_records = feedback_records[:limit]
+        last = feedback_records[-1]
+        next_cursor = encode_cursor(last.createdAt, last.id)
+    response = ViewFeedbackResponse(
+        feedbacks=[_to_detail(feedback) for feedback in feedback_records],
+        nextCursor=next_cursor,
     )
-    response_feedbacks = [
-        FeedbackDetail(
-            id=feedback.id,
-            created_at=feedback.createdAt,
-            content=feedback.content,
-            userId=feedback.userId,
-            queryId=feedback.queryId,
-        )
-        for feedback in feedback_records
-    ]
-    response = ViewFeedbackResponse(feedbacks=response_feedbacks)
     return response
+
+
+async def export_feedback(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    userId: Optional[str] = None,
+    queryId: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Streams all matching feedback as newline-delimited JSON, newest first.
+
+    Rows are read EXPORT_CHUNK_SIZE at a time with the same keyset pagination as view_feedback,
+    so memory use stays constant regardless of how much feedback matches.
+
+    Args:
+        start (Optional[datetime]): Only include feedback created at or after this time.
+        end (Optional[datetime]): Only include feedback created before this time.
+        userId (Optional[str]): Only include feedback submitted by this user.
+        queryId (Optional[str]): Only include feedback about this query.
+
+    Yields:
+        str: One JSON-encoded FeedbackDetail per line.
+    """
+    after = None
+    while True:
+        feedback_records = await _fetch_page(
+            EXPORT_CHUNK_SIZE, start, end, userId, queryId, after
+        )
+        if not feedback_records:
+            return
+        yield "".join(
+            _to_detail(feedback).model_dump_json() + "\n"
+            for feedback in feedback_records
+        )
+        if len(feedback_records) < EXPORT_CHUNK_SIZE:
+            return
+        last = feedback_records[-1]
+        after = (last.createdAt, last.id)
@@ -0,0 +1,23 @@
+-- Takes every Query row that was not stored by /query/submit out of the workers' reach.
+--
+-- Query."status" defaults to COMPLETED, so `prisma db push` fills it in as COMPLETED for rows
+-- that predate the column, and the workers only claim rows marked "submitted". A database
+-- that got the column while its default was still QUEUED, though, holds old rows that look
+-- like a backlog of unanswered submissions. Run this once after `prisma db push`, before
+-- starting the service:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f sql/backfill_query_status.sql
+--
+-- It is idempotent, and a no-op on a database where the column was added as COMPLETED.
+
+BEGIN;
+
+UPDATE "Query"
+SET "status" = 'COMPLETED'
+WHERE "status" = 'QUEUED' AND NOT "submitted";
+
+UPDATE "Query"
+SET "status" = 'FAILED', "error" = 'Abandoned before this row could be claimed'
+WHERE "status" = 'PROCESSING' AND NOT "submitted" AND "processingStartedAt" IS NULL;
+
+COMMIT;
@@ -0,0 +1,99 @@
+-- Converts "Query" into a table range-partitioned by month on "createdAt".
+--
+-- Prisma cannot declare partitioned tables, so this is run by hand once `prisma db push` has
+-- created the schema:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f sql/partition_query_by_month.sql
+--
+-- It copies every row under an exclusive lock, so run it in a maintenance window with the
+-- service stopped. Afterwards:
+--
+--   * Month-bounded scans (history windows, monthly cost totals) only touch the partitions of
+--     the months they cover, and old months can be detached or dropped whole instead of
+--     being deleted row by row.
+--   * The primary key is ("id", "createdAt"), because unique constraints on a partitioned
+--     table must include the partition key. "id" is still a random UUID and is still
+--     indexed, but "Feedback"."queryId" can no longer have a foreign key to it.
+--   * `prisma db push` would try to restore the single-column primary key and the foreign
+--     key. Review later schema changes with `prisma migrate diff` and apply them by hand.
+--   * project/query_partitions.py calls query_ensure_partitions() at startup and every few
+--     hours so that the coming months always have a partition. Rows outside every monthly
+--     partition land in "Query_default"; a month cannot be given its own partition while
+--     the default partition holds rows for it.
+
+BEGIN;
+
+LOCK TABLE "Query" IN ACCESS EXCLUSIVE MODE;
+
+CREATE OR REPLACE FUNCTION query_ensure_partitions(first_month timestamp, months_ahead integer)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month timestamp := date_trunc('month', first_month);
+    last_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC')
+        + make_interval(months => months_ahead);
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE month <= last_month LOOP
+        partition_name := 'Query_' || to_char(month, 'YYYY_MM');
+        IF to_regclass(quote_ident(partition_name)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF "Query" FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month, month + interval '1 month'
+            );
+            created := created + 1;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$;
+
+ALTER TABLE "Feedback" DROP CONSTRAINT IF EXISTS "Feedback_queryId_fkey";
+
+ALTER TABLE "Query" RENAME TO "Query_unpartitioned";
+ALTER TABLE "Query_unpartitioned" RENAME CONSTRAINT "Query_pkey" TO "Query_unpartitioned_pkey";
+ALTER TABLE "Query_unpartitioned" RENAME CONSTRAINT "Query_userId_fkey" TO "Query_unpartitioned_userId_fkey";
+
+CREATE TABLE "Query" (
+    LIKE "Query_unpartitioned" INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMMENTS
+) PARTITION BY RANGE ("createdAt");
+
+ALTER TABLE "Query" ADD CONSTRAINT "Query_pkey" PRIMARY KEY ("id", "createdAt");
+ALTER TABLE "Query" ADD CONSTRAINT "Query_userId_fkey"
+    FOREIGN KEY ("userId") REFERENCES "User"("id") ON DELETE RESTRICT ON UPDATE CASCADE;
+
+SELECT query_ensure_partitions(
+    coalesce(
+        (SELECT min("createdAt") FROM "Query_unpartitioned"),
+        now() AT TIME ZONE 'UTC'
+    ),
+    3
+);
+CREATE TABLE "Query_default" PARTITION OF "Query" DEFAULT;
+
+INSERT INTO "Query" SELECT * FROM "Query_unpartitioned";
+DROP TABLE "Query_unpartitioned";
+
+-- The indexes declared in schema.prisma, under the names Prisma gives them. Creating them on
+-- the parent creates them on every partition, present and future. The semantic cache's
+-- embedding index is recreated at startup if SEMANTIC_CACHE_ENABLED is on.
+CREATE INDEX "Query_status_priority_createdAt_idx"
+    ON "Query" ("status", "priority" DESC, "createdAt");
+CREATE INDEX "Query_status_userId_createdAt_idx"
+    ON "Query" ("status", "userId", "createdAt");
+CREATE INDEX "Query_userId_createdAt_id_idx"
+    ON "Query" ("userId", "createdAt" DESC, "id" DESC);
+CREATE INDEX "Query_routedToModel_createdAt_id_idx"
+    ON "Query" ("routedToModel", "createdAt" DESC, "id" DESC);
+CREATE INDEX "Query_createdAt_idx" ON "Query" USING brin ("createdAt");
+CREATE INDEX "Query_queryTextHash_routedToModel_createdAt_idx"
+    ON "Query" ("queryTextHash", "routedToModel", "createdAt" DESC);
+-- Lookups by "id" alone (results, updates, worker claims) cannot be pruned to one partition;
+-- they probe the primary key index of each partition, one probe per month kept.
+
+COMMIT;
+
+ANALYZE "Query";